@@ -14,7 +14,7 @@ from click.decorators import command
 
 from sphinx import build_main as sphinx_build_main
 
-from gfzreport.sphinxbuild.map import parse_margins
+from gfzreport.sphinxbuild.map import parse_margins, prewarm_arcgis_cache
 from gfzreport.templates.network import Templater as NetworkTemplater
 from gfzreport.templates.annual import Templater as AnnualTemplater
 from gfzreport.sphinxbuild import run as sphinxbuild_run
@@ -113,6 +113,62 @@ def tutorial(outdir, other_sphinxbuild_options, sphinxhelp):
         sys.exit(sphinxbuild_run(sourcedir, os.path.join(outdir,'latex'), 'pdf',
                                  *other_sphinxbuild_options))
 
+def _validate_bbox(ctx, param, value):
+    """Parses each bounding box string into a list of 4 floats"""
+    ret = []
+    for string in value:
+        try:
+            bbox = [float(_) for _ in string.split(',')]
+        except ValueError:
+            bbox = []
+        if len(bbox) != 4:
+            raise click.BadParameter("invalid bounding box: '%s'" % string)
+        ret.append(bbox)
+    return ret
+
+
+@main.command(context_settings=dict(max_content_width=TERMINAL_HELP_WIDTH),
+              options_metavar='[options]',
+              short_help="Downloads map background images into the local cache")
+@click.argument('bboxes', nargs=-1, required=True, callback=_validate_bbox,
+                metavar='bbox [bbox...]')
+@option('-m', '--mapmargins', default='0.5deg',
+        help="The map margins, as in the mapfigure directive option :map_mapmargins:")
+@option('-s', '--arcgis_service', default='World_Street_Map',
+        help="The ArcGIS service, as in the mapfigure directive option :map_arcgis_service:")
+@option('-x', '--arcgis_xpixels', default=1500, type=int,
+        help="The image pixels in x-direction, as in the mapfigure directive option "
+             ":map_arcgis_xpixels:")
+@option('-d', '--arcgis_dpi', default=96, type=int,
+        help="The image dpi, as in the mapfigure directive option :map_arcgis_dpi:")
+def prewarm(bboxes, mapmargins, arcgis_service, arcgis_xpixels, arcgis_dpi):
+    """Downloads into the local cache the ArcGIS background images of the maps whose points
+    span the given bounding boxes. Each bounding box must be given as
+    min_lon,min_lat,max_lon,max_lat (no spaces). Afterwards, building a report with maps
+    within one of the given bounding boxes (and the same map options) does not fetch the
+    background image from the web. The cache directory is given by the environment
+    variable GFZREPORT_CACHE_DIR (default if missing: ~/.gfzreport/cache). Set the
+    environment variable GFZREPORT_OFFLINE=1 to build reports reading background images
+    from the cache only
+
+    Example:
+
+    [program_name] -x 3000 6.5,45.2,13.1,49.8 -20,30,40,70
+    """
+    ret = 0
+    for bbox in bboxes:
+        try:
+            downloaded = prewarm_arcgis_cache(*bbox, mapmargins=mapmargins,
+                                              arcgis_service=arcgis_service,
+                                              arcgis_xpixels=arcgis_xpixels,
+                                              arcgis_dpi=arcgis_dpi)
+            print("%s: %s" % (bbox, "downloaded" if downloaded else "already cached"))
+        except Exception as exc:  # pylint: disable=broad-except
+            print("%s: ERROR: %s" % (bbox, str(exc)))
+            ret = 1
+    sys.exit(ret)
+
+
 @main.group(short_help="creates templates reports. Type template --help for help")
 def template():
     pass
@@ -248,6 +304,12 @@ def n(out_path, conffiles_only, mv_datafiles, noprompt,
     a local system path (with or without wildcards). They will be copied recursively in the
     relative output directory under 'data' (see above)
 
+    Web service responses (stations, datacenters) are cached in the directory given by the
+    environment variable GFZREPORT_CACHE_DIR (default if missing: ~/.gfzreport/cache).
+    Set the environment variable GFZREPORT_ROUTING_FILE to the path of a local routing file
+    (in the EIDA routing service 'post' format) to use its datacenters without querying the
+    routing service
+
     Example:
 
     [program_name] --noise_pdf /home/my_images/myfile.png --noise_pdf /home/other_images/*.jpg
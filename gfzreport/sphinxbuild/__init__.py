@@ -10,6 +10,8 @@ import sys
 import os
 import subprocess
 import time
+import hashlib
+import json
 from datetime import datetime
 from cStringIO import StringIO
 import re
@@ -22,6 +24,8 @@ from sphinx.util.pycompat import execfile_
 from sphinx.util.osutil import cd
 from itertools import izip
 
+from gfzreport.sphinxbuild import timing
+
 
 _DEFAULT_BUILD_TYPE = 'latex'
 
@@ -120,13 +124,74 @@ def pdflatex(texfile, texfolder=None, interaction='batchmode', draftmode=False,
 #     return ret
 
 
+# the default maximum number of pdflatex passes (see `pdflatex_passes`):
+_PDFLATEX_MAX_PASSES = 5
+
+# the extensions of the pdflatex auxiliary files which, when changed after a pass, require
+# another pass (e.g. cross references, table of contents, longtables widths, pdf bookmarks):
+_PDFLATEX_AUX_EXTENSIONS = ('.aux', '.toc', '.out', '.lof', '.lot')
+
+
+def pdflatex_auxdigest(texfile):
+    """Returns a dict of the md5 hashes (hex strings) of the pdflatex auxiliary files of the
+    given tex file, mapped to their extensions. Non existing files are mapped to None
+    :param texfile: the tex file path
+    """
+    ret = {}
+    basepath = os.path.splitext(texfile)[0]
+    for ext in _PDFLATEX_AUX_EXTENSIONS:
+        ret[ext] = None
+        if os.path.isfile(basepath + ext):
+            with open(basepath + ext, 'rb') as opn:
+                ret[ext] = hashlib.md5(opn.read()).hexdigest()
+    return ret
+
+
+def pdflatex_passes(texfile, max_passes=_PDFLATEX_MAX_PASSES, **kwargs):
+    """
+    Runs `pdflatex` on the given tex file as many times as needed, i.e. until the auxiliary
+    files (.aux, .toc, .out and so on) do not change after a pass, or `max_passes` passes have
+    been run. If the .aux file does not exist (first build), at least two passes are needed:
+    in this case the first pass is run in draft mode (no pdf written)
+    :param texfile: (string) the input tex file path
+    :param max_passes: (int) the maximum number of passes
+    :param kwargs: keyword arguments passed to `pdflatex` (except `draftmode`)
+    :return: the tuple return_status (int), stdout (string), stderr (string), passes (list)
+    where the first three elements are relative to the last pass (see `pdflatex`) and `passes`
+    is a list of tuples (draftmode, seconds), one for each pass run
+    :raise: OsError in case of file not found, pdflatex not installed etcetera.
+    """
+    passes = []
+    digest = pdflatex_auxdigest(texfile)
+    while True:
+        draftmode = not passes and max_passes > 1 and digest['.aux'] is None
+        start = time.time()
+        with timing.phase('pdflatex.pass%d' % (len(passes) + 1)):
+            result = pdflatex(texfile, None, draftmode=draftmode, **kwargs)
+        passes.append((draftmode, time.time() - start))
+        newdigest = pdflatex_auxdigest(texfile)
+        if len(passes) >= max_passes or (newdigest == digest and not draftmode):
+            return result + (passes,)
+        digest = newdigest
+
+
+def pdflatex_passes2str(passes):
+    """Returns a string representation of the given pdflatex passes
+    :param passes: the list of pdflatex passes, as returned from `pdflatex_passes`
+    """
+    return "%d pdflatex pass(es) run in %.2f seconds: %s" % \
+        (len(passes), sum(_[1] for _ in passes),
+         ", ".join("%.2fs%s" % (secs, " (-draftmode)" if draft else "")
+                   for draft, secs in passes))
+
+
 def log_err_regexp():
     """Returns a regexp to parse the log file in order to catch lines denoting errors"""
     return re.compile(".+?:[0-9]+:\\s*ERROR\\s*:.+", re.IGNORECASE)
 
 
 def _run(sourcedir, outdir, master_doc, build=_DEFAULT_BUILD_TYPE, is_terminal=False,
-         *other_sphinxbuild_options):
+         *other_sphinxbuild_options, **kwargs):
     """Runs sphinx-build (with build either 'latex' or 'html' or 'pdf') returning the integer
     result:
     ```
@@ -142,6 +207,11 @@ def _run(sourcedir, outdir, master_doc, build=_DEFAULT_BUILD_TYPE, is_terminal=F
     :param build: either 'latex', 'html' or 'pdf'
     :param other_sphinxbuild_options: positional command line argument to be forwarded to
     sphinx-build
+    :param kwargs: optional keyword arguments. Currently supported are 'sphinx_main': a
+    function with the same signature and return value of `sphinx.build_main` (which is the
+    default when missing or None), e.g. `gfzreport.sphinxbuild.buildserver.BuildServer.main`,
+    and 'pdflatex_max_passes': the maximum number of pdflatex passes (int, see
+    `pdflatex_passes`. Ignored if build != 'pdf')
     :return: 0 on success, 1 on success with error (this holds only for build='pdf'
     meaning that pdflatex returned nonzero, but the pdf file was written), 2 on failure
     (no output written)
@@ -185,14 +255,13 @@ def _run(sourcedir, outdir, master_doc, build=_DEFAULT_BUILD_TYPE, is_terminal=F
     # ---------------
     # Still while wrapping the standard error (which will capture python errors, not pdflatex
     #    stderr, which in any case is apparently not used)
-    #        2a) run pdflatex once with the flag -draftmode. This flag speed up rendering by NOT
-    #        writing the pdf output. If
+    #        2a) run pdflatex as many times as needed (see `pdflatex_passes`). If
     #            - the process raised and exception, set R=2 and go to FINALIZE. Otherwise:
     #            - go to 2b)
-    #        2b) run again pdflatex without the flag -draftmode. Get the pdflatex return value,
-    #        R_TMP. If:
+    #        2b) Get the pdflatex return value of the last pass, R_TMP. If:
     #        - the output pdf file is NOT modified, set R=2, goto FINALIZE
-    #        - the output pdf file is modified, and R_TMP !=0, set R=1. Open pdflatex log file and
+    #        - the output pdf file is modified, and R_TMP !=0, set R=1. Write the number of
+    #        passes run and their duration, then open pdflatex log file and
     #        write its content into our captured standard error, formatting latex errors with the
     #        same format as sphinx errors. Go to FINALIZE
     #
@@ -200,7 +269,8 @@ def _run(sourcedir, outdir, master_doc, build=_DEFAULT_BUILD_TYPE, is_terminal=F
     # -----------
     # We have a return status code R in [0, 1, 2], and a captured standard error which normalizes
     # sphinx and pdflatex errors. Write the captured standard error in our log file (currently
-    # "__.gfzreport.__.log" under the build directory). Finally, return R
+    # "__.gfzreport.__.log" under the build directory). Write also the time spent in each build
+    # phase (json file, see `timing` module). Finally, return R
     #
     # Final note: all runs 1a) 2a) 2b) are wrapped in a context manager `execwrapper` that
     # catches exceptions, prints them to stderr, and has a property 'raised', that returns if
@@ -213,6 +283,11 @@ def _run(sourcedir, outdir, master_doc, build=_DEFAULT_BUILD_TYPE, is_terminal=F
     # ".+?:[0-9]+:\\s*ERROR\\s*:.+"
     # Use re_pdflatex to convert pdflatex errors to sphinx errors in order to normalize them
 
+    sphinx_main = kwargs.pop('sphinx_main', None) or sphinx_build_main
+    pdflatex_max_passes = kwargs.pop('pdflatex_max_passes', None) or _PDFLATEX_MAX_PASSES
+    if kwargs:
+        raise TypeError("_run got unexpected keyword argument(s): %s" % ", ".join(kwargs))
+
     # call sphinx:
     sphinxbuild = 'latex' if build == 'pdf' else build
     argv = ["", sourcedir, outdir, "-b", sphinxbuild] + list(other_sphinxbuild_options)
@@ -221,14 +296,15 @@ def _run(sourcedir, outdir, master_doc, build=_DEFAULT_BUILD_TYPE, is_terminal=F
     # we might have compilation errors for e.g. a bad directive, or a pdflatex warning.
     # compilation errors do not mean that the document was not created successfully, it's for
     # warning the user that not "everything" was perfect
-    with capturestderr(outdir) as new_stderr:
+    with timing.recording() as timer, capturestderr(outdir) as new_stderr:
         new_stderr.write("*** Sphinx (rst to %s) ***\n\n" % sphinxbuild)
         with execwrapper(outdir, master_doc, sphinxbuild) as checker:
             # sphinx_build_main NEVER raises and prints to stderr.
             # If it if did, however, the error would be captured by execwrapper, which
             # also NEVER raises. For safety, we can thus check if checker.raised, and if False,
             # then ret will ALWAYS be a value
-            ret = sphinx_build_main(argv)
+            with timing.phase('sphinx'):
+                ret = sphinx_main(argv)
 
         if checker.raised or ret != 0:
             if not checker.raised:  # ret != 0
@@ -257,35 +333,26 @@ def _run(sourcedir, outdir, master_doc, build=_DEFAULT_BUILD_TYPE, is_terminal=F
                 sys.stdout.write("\nRunning PdfLatex")
 
             texfilepath = checker.filepath
-            # the execwrapper wraps exceptions and prints them to stderr, so we still
-            # need the with statement although we will not check for file modifications (see below)
-            with execwrapper(outdir, master_doc, build) as checker:
-                sys.stdout.write("\n1st run (-draftmode)")
-                pdflatex(texfilepath, None, draftmode=True)
-
+            passes = []
+            with execwrapper(outdir, master_doc, build, wait=1) as checker:
+                with timing.phase('pdflatex'):
+                    ret_pdflatex, std_out, std_err, passes = \
+                        pdflatex_passes(texfilepath, pdflatex_max_passes)  # @UnusedVariable
+                if is_terminal:
+                    sys.stdout.write("\n%s" % pdflatex_passes2str(passes))
+                    if std_out:
+                        sys.stdout.write("\n%s" % std_out)
+                # we don't do this:
+                # sys.stderr.write(std_err)
+                # because we will rely on pdflatex log file and we want to avoid duplicated
+                # messages (although it seems that std_err is not used by pdflatex, is for
+                # safety)
             parselog = checker.logmodified
 
-            # do NOT check for checker.modified as we did NOT modify anything (-draftmode).
-            # However, check if it raised:
-            if checker.raised:
+            if checker.raised or not checker.modified:
                 ret = 2
-            else:
-                with execwrapper(outdir, master_doc, build, wait=1) as checker:
-                    sys.stdout.write("\n2nd run")
-                    ret_pdflatex, std_out, std_err = pdflatex(texfilepath, None)  # @UnusedVariable
-                    if is_terminal and std_out:
-                        sys.stdout.write("\n%s" % std_out)
-                    # we don't do this:
-                    # sys.stderr.write(std_err)
-                    # because we will rely on pdflatex log file and we want to avoid duplicated
-                    # messages (although it seems that std_err is not used by pdflatex, is for
-                    # safety)
-                parselog = checker.logmodified
-
-                if not checker.modified:
-                    ret = 2
-                elif not c_errors:
-                    c_errors = ret_pdflatex != 0
+            elif not c_errors:
+                c_errors = ret_pdflatex != 0
 
             if parselog:
                 # with the option "-file-line-error", the pdflatex errors are of the form:
@@ -300,7 +367,8 @@ def _run(sourcedir, outdir, master_doc, build=_DEFAULT_BUILD_TYPE, is_terminal=F
                 pdflogfile = os.path.splitext(checker.filepath)[0] + ".log"  # surely exists
                 # write pdflatex log file into our log file, re-formatting pdflatex errors
                 # to our error format, if any
-                new_stderr.write("\n*** Pdflatex (latex to pdf) ***\n")  # second newline
+                new_stderr.write("\n*** Pdflatex (latex to pdf) ***\n")
+                new_stderr.write("\n%s\n" % pdflatex_passes2str(passes))  # second newline
                 # appended in the first line read (see below)
                 with open(pdflogfile, 'r') as fopen:
                     for line in fopen:
@@ -319,6 +387,10 @@ def _run(sourcedir, outdir, master_doc, build=_DEFAULT_BUILD_TYPE, is_terminal=F
         ret = 1
 
     finalize(new_stderr, ret, outdir, is_terminal)
+    if os.path.isdir(outdir):
+        # write the timing of the build phases (see `timing` module):
+        timer.write(os.path.join(outdir, timing.get_timingfilename()), build=build,
+                    exitstatus=ret)
     return ret
 
 
@@ -341,10 +413,11 @@ def finalize(stderr, exitstatus, outdir, is_terminal):
 
     fileout = os.path.join(outdir, get_logfilename())
     if os.path.isdir(os.path.dirname(fileout)):
+        content = "%s\n%s\n\n%s" % (msg, '*' * len(msg), stderr.getvalue())
         with open(fileout, 'w') as _:
-            _.write(msg)
-            _.write('\n%s\n\n' % ('*' * len(msg)))
-            _.write(stderr.getvalue())
+            _.write(content)
+        # index the log content we have in memory (avoid re-reading the file):
+        write_logindex(fileout, StringIO(content))
         if is_terminal:
             sys.stdout.write("\n(Log file written to '%s')\n" % fileout)
 
@@ -483,6 +556,53 @@ def get_logfilename():
     return "gfzreport.build.log"
 
 
+def get_logindexfilename():
+    """Returns the name of the json file indexing the gfzreport log file (see
+    `get_logfilename` and `write_logindex`), written in the same directory"""
+    return "gfzreport.build.log.index.json"
+
+
+def logindex(lines):
+    """Returns a dict indexing the given log file lines, so that the log errors can be
+    retrieved without parsing the whole file. The dict keys are:
+    'size' (the log size, in bytes), 'sections' (list of [offset, line] elements denoting the
+    lines starting a log section, e.g. '*** Sphinx (rst to latex) ***') and 'errors' (list of
+    the offsets of the lines matching `log_err_regexp`). Offsets are in bytes from the
+    beginning of the file and lines are stripped
+    :param lines: iterable of lines including the trailing newline, e.g. an open file
+    """
+    reg = log_err_regexp()
+    sections = []
+    errors = []
+    offset = 0
+    for line in lines:
+        sline = line.strip()
+        if sline.startswith("*** Sphinx ") or sline.startswith("*** Pdflatex "):
+            sections.append([offset, sline])
+        elif reg.match(sline):
+            errors.append(offset)
+        offset += len(line)
+    return {'size': offset, 'sections': sections, 'errors': errors}
+
+
+def write_logindex(logfile, lines=None):
+    """Writes the index of the given log file (see `logindex`) as json file in the same
+    directory (see `get_logindexfilename`) and returns it. The index has the additional key
+    'mtime', the log file modification time: an index whose 'mtime' and 'size' do not match
+    the log file is outdated
+    :param lines: the log file lines, or None (read them from the file)
+    """
+    if lines is None:
+        with open(logfile, 'rb') as opn:
+            index = logindex(opn)
+    else:
+        index = logindex(lines)
+    index['mtime'] = os.stat(logfile).st_mtime
+    with open(os.path.join(os.path.dirname(logfile), get_logindexfilename()), 'w') as opn:
+        json.dump(index, opn)
+    return index
+
+
 @contextmanager
 def capturestderr(outdir):
     '''Captures standard error to a StrinIO and writes it to a file. Used in `build_report`
@@ -0,0 +1,226 @@
+'''
+In-process build server keeping "warm" sphinx applications in memory.
+
+Running sphinx via `sphinx.build_main` creates, for each build, a brand new `Sphinx` object,
+i.e. it re-parses the configuration, re-imports and sets up all extensions and re-creates (or
+un-pickles) the build environment. For long-running processes (e.g., the web app) which build
+the same reports over and over, this module provides a `BuildServer` object which keeps a
+`Sphinx` application for each (source directory, output directory, builder) and re-uses it
+in subsequent builds. A sphinx application is re-created only if the `conf.py` file changes
+(or the previous build raised)
+
+Usage:
+```
+    server = BuildServer()
+    ret = server.main(argv)  # argv as for `sphinx.build_main`
+```
+`BuildServer.main` has the same signature and return value of `sphinx.build_main`, and can
+thus be passed as `sphinx_main` argument to `gfzreport.sphinxbuild._run`
+
+Re-using a sphinx application requires to reset some of its private attributes before each
+build (tested with sphinx 1.5.1). If they are missing (e.g., other sphinx versions),
+`BuildServer.main` falls back to `sphinx.build_main`
+
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import sys
+import hashlib
+import getopt
+import threading
+from copy import copy
+from cStringIO import StringIO
+
+from docutils.parsers.rst import directives, roles
+from sphinx import build_main as sphinx_build_main
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace
+
+
+# the sphinx-build options supported by the build server. Any other option (e.g. '-D', '-t')
+# makes `BuildServer.main` fall back to `sphinx.build_main`:
+_SUPPORTED_OPTS = 'b:c:d:EaqQN'
+
+# the private attributes of a `sphinx.application.Sphinx` object reset before each build by
+# `WarmApp.build`:
+_SPHINX_PRIVATE_ATTRS = ('_status', '_warning', '_warncount', 'messagelog', '_init_env',
+                         '_init_enumerable_nodes')
+
+# the attributes set on a sphinx application by our extensions which hold the state of a
+# single build (e.g., the DOI citations fetched during the build, see
+# `gfzreport.sphinxbuild.core.extensions.doicitation.resolve_citations`). They are removed
+# before re-using the application:
+_BUILD_STATE_ATTRS = ('_doicitation_cache__',)
+
+
+class UnsupportedSphinxError(Exception):
+    '''Raised when the installed sphinx version does not support warm applications (see
+    `_SPHINX_PRIVATE_ATTRS`)'''
+
+
+def confhash(confdir):
+    '''Returns the md5 hash (hex string) of the content of the 'conf.py' file in `confdir`,
+    or None if the file does not exist'''
+    conf_file = os.path.join(confdir, 'conf.py')
+    if not os.path.isfile(conf_file):
+        return None
+    with open(conf_file, 'rb') as opn:
+        return hashlib.md5(opn.read()).hexdigest()
+
+
+class WarmApp(object):
+    '''A sphinx application kept in memory together with the docutils directives and roles
+    registered by its extensions (sphinx registers them globally in docutils, and `build_main`
+    restores the docutils registries after each build, so we need to re-install them
+    before each new build)'''
+
+    def __init__(self, srcdir, confdir, outdir, doctreedir, buildername, freshenv=False,
+                 quiet=False):
+        self.confhash = confhash(confdir)
+        self.lock = threading.Lock()
+        self.builds = 0
+        with docutils_namespace():
+            self.app = Sphinx(srcdir, confdir, outdir, doctreedir, buildername,
+                              status=None if quiet else sys.stdout, warning=sys.stderr,
+                              freshenv=freshenv)
+            self.directives = copy(directives._directives)
+            self.roles = copy(roles._roles)
+        missing = [_ for _ in _SPHINX_PRIVATE_ATTRS if not hasattr(self.app, _)]
+        if missing:
+            raise UnsupportedSphinxError("sphinx application without attribute(s) %s" %
+                                         ", ".join(missing))
+
+    def build(self, freshenv=False, force_all=False, quiet=False):
+        '''Builds the document with the underlying sphinx application, returning the
+        sphinx status code (0: success)'''
+        app = self.app
+        # status and warning streams are set when creating the app. The caller might have
+        # redirected them in the meantime (see `gfzreport.sphinxbuild.capturestderr`):
+        app._status = StringIO() if quiet else sys.stdout  # pylint: disable=protected-access
+        app._warning = sys.stderr  # pylint: disable=protected-access
+        app.quiet = quiet
+        app.statuscode = 0
+        app._warncount = 0  # pylint: disable=protected-access
+        app.messagelog.clear()
+        if freshenv and self.builds:  # (the first build has been set up already)
+            app._init_env(True)  # pylint: disable=protected-access
+            app._init_enumerable_nodes()  # pylint: disable=protected-access
+            app.builder.env = app.env
+        _reset_builder(app.builder)
+        _reset_extensions(app)
+        with docutils_namespace():
+            directives._directives.update(self.directives)  # pylint: disable=protected-access
+            roles._roles.update(self.roles)  # pylint: disable=protected-access
+            app.build(force_all)
+        self.builds += 1
+        return app.statuscode
+
+
+def _reset_builder(builder):
+    '''Resets the builder attributes which are populated during a build and, as such,
+    would accumulate across builds'''
+    if builder.name == 'latex':
+        builder.docnames = []
+        builder.document_data = []
+
+
+def _reset_extensions(app):
+    '''Removes from `app` the state of the previous build set by our extensions (see
+    `_BUILD_STATE_ATTRS`), and sets `app` as current sphinx application in our setup extension
+    (the extension sets it in the 'builder-inited' event, which is fired only once per
+    application)'''
+    for attr in _BUILD_STATE_ATTRS:
+        if hasattr(app, attr):
+            delattr(app, attr)
+    setupmod = sys.modules.get('gfzreport.sphinxbuild.core.extensions.setup', None)
+    if setupmod is not None:
+        setupmod.sphinxapp = app
+
+
+class BuildServer(object):
+    '''Keeps a `WarmApp` per (source directory, output directory, builder name) and uses it
+    for building documents. Thread-safe (builds of the same document are serialized)'''
+
+    def __init__(self):
+        self._apps = {}
+        self._lock = threading.Lock()
+        # False if warm applications are not supported (see `UnsupportedSphinxError`):
+        self.supported = True
+
+    def __len__(self):
+        return len(self._apps)
+
+    def invalidate(self, srcdir=None):
+        '''Removes from memory all sphinx applications, or only those relative to the given
+        source directory, if the latter is not None'''
+        with self._lock:
+            for key in list(self._apps.keys()):
+                if srcdir is None or key[0] == os.path.abspath(srcdir):
+                    self._apps.pop(key)
+
+    def get(self, srcdir, confdir, outdir, doctreedir, buildername, freshenv=False,
+            quiet=False):
+        '''Returns the `WarmApp` for the given arguments, creating it if not found or if the
+        sphinx config file changed since its creation.
+        Returns the tuple (WarmApp, is_new)'''
+        key = (os.path.abspath(srcdir), os.path.abspath(outdir), buildername)
+        with self._lock:
+            warmapp = self._apps.get(key, None)
+            if warmapp is not None and warmapp.confhash == confhash(confdir) and \
+                    warmapp.app.doctreedir == os.path.abspath(doctreedir):
+                return warmapp, False
+            self._apps.pop(key, None)
+        warmapp = WarmApp(srcdir, confdir, outdir, doctreedir, buildername, freshenv, quiet)
+        with self._lock:
+            self._apps[key] = warmapp
+        return warmapp, True
+
+    def main(self, argv):
+        '''Builds a sphinx document. Same signature and return value as `sphinx.build_main`:
+        `argv` is the list of command line arguments, where the first element is ignored (the
+        program name) and the first two positional arguments are the source and the output
+        directory. Falls back to `sphinx.build_main` (no warm application) if `argv` has options
+        not supported by this object or if the installed sphinx version does not support warm
+        applications, and to `sys.stderr` prints the exception messages (if any) returning 1'''
+        if not self.supported:
+            return sphinx_build_main(argv)
+        try:
+            opts, args = getopt.gnu_getopt(argv[1:], _SUPPORTED_OPTS)
+        except getopt.GetoptError:
+            return sphinx_build_main(argv)
+        if len(args) != 2:  # filenames are not supported
+            return sphinx_build_main(argv)
+
+        srcdir, outdir = [os.path.abspath(_) for _ in args]
+        opts = dict(opts)
+        buildername = opts.get('-b', 'html')
+        confdir = os.path.abspath(opts.get('-c', srcdir))
+        doctreedir = os.path.abspath(opts.get('-d', os.path.join(outdir, '.doctrees')))
+        quiet = '-q' in opts or '-Q' in opts
+
+        for dir_ in (srcdir, confdir):
+            if not os.path.isdir(dir_):
+                sys.stderr.write('Error: Cannot find directory %r.\n' % dir_)
+                return 1
+
+        try:
+            freshenv = '-E' in opts
+            try:
+                warmapp = self.get(srcdir, confdir, outdir, doctreedir, buildername, freshenv,
+                                   quiet)[0]
+            except UnsupportedSphinxError as exc:
+                self.supported = False
+                sys.stderr.write("Warning: %s, building without warm application\n" %
+                                 str(exc))
+                return sphinx_build_main(argv)
+            with warmapp.lock:
+                return warmapp.build(freshenv=freshenv, force_all='-a' in opts,
+                                     quiet=quiet)
+        except (Exception, KeyboardInterrupt) as exc:
+            # the app state might be inconsistent: discard it
+            self.invalidate(srcdir)
+            sys.stderr.write("Exception occurred:\n%s: %s\n" % (exc.__class__.__name__,
+                                                                str(exc)))
+            return 1
@@ -8,7 +8,10 @@ Implements the DOI citation role.
 in the role)
 
 The role will be rendered as the full text citation (with optional hyperlink, if found) by
-querying "https://doi.org/" + [role_value]
+querying "https://doi.org/" + [role_value]. All DOIs of a document are fetched at once
+(concurrently) after the document is resolved, and cached (see `get_citations`). The cache
+time-to-live and the max number of concurrent requests can be set in the config via
+`doicitation_cache_ttl` and `doicitation_workers`
 
 See https://doughellmann.com/blog/2010/05/09/defining-custom-roles-in-sphinx/ for a tutorial
 on how to implement Sphinx roles
@@ -19,12 +22,17 @@ Created on Jan 30, 2017
 """
 import os
 import json
+import time
 import urllib2
 import re
+import tempfile
+from multiprocessing.pool import ThreadPool
 
 from docutils import nodes
 
 from gfzreport.sphinxbuild.core import touni
+from gfzreport.sphinxbuild.filecache import get_cachedir
+from gfzreport.sphinxbuild.timing import timed
 
 _ROLE_NAME = "doi-citation"
 
@@ -33,53 +41,165 @@ _CACHE_FILENAME = "doi_citations_cache_json.log"  # this file will be saved in t
 # Log files should be safe to use. They can be disabled
 # when searching for docs to scan in the conf.py, although that just prevents them to copy to the
 # builddir apparently
+# NOTE: the file above is used only if caches are disabled (see `get_cachefile`). Otherwise,
+# it is read (if existing) as fallback for the DOIs not found in the shared cache
 
 URLOPEN_TIMEOUTS_IN_SEC = (10, 2)  # timeout if we don't have DOI in cache, timeout if we do
 
 DOI_BASE_URL = "https://data.crosscite.org/"  # OLD:  "https://doi.org/"
 
+CACHE_TTL_IN_SEC = 30 * 24 * 3600  # the default max age of cached citations
+
+MAX_WORKERS = 8  # the default max number of DOIs fetched concurrently
+
 # utilities: ==============================================================================
 
+
+def get_cachefile(root_dir):
+    """Returns the path of the json file of cached citations: this is a file in the caches
+    directory shared across reports (see `gfzreport.sphinxbuild.filecache`) or, if caches are
+    disabled, the file `_CACHE_FILENAME` in the given root (source) directory"""
+    cachedir = get_cachedir('doi')
+    if cachedir is None:
+        return os.path.join(root_dir, _CACHE_FILENAME)
+    return os.path.join(cachedir, 'citations.json')
+
+
+def _load_json(filepath):
+    try:
+        with open(filepath, 'r') as opn_:
+            data = json.load(opn_)
+        return data if isinstance(data, dict) else {}
+    except (OSError, IOError, ValueError, TypeError):
+        return {}
+
+
+class CitationCache(object):
+    """Cache of DOI citations, stored as json file mapping each DOI to the list
+    [citation, url, time] where time is the time the citation was fetched (seconds since the
+    epoch). Entries written in old versions (without time) are considered expired. Citations
+    are put in memory and written to file only when calling `save`"""
+
+    def __init__(self, filepath, fallback_filepath=None):
+        """
+        :param filepath: the json file path
+        :param fallback_filepath: optional json file path. Its entries not in `filepath` are
+            loaded as expired entries (i.e., returned only when the DOI can not be fetched)
+        """
+        self.filepath = filepath
+        self.data = _load_json(filepath)
+        if fallback_filepath is not None and fallback_filepath != filepath:
+            for doi, entry in _load_json(fallback_filepath).iteritems():
+                if doi not in self.data:
+                    self.data[doi] = list(entry[:2]) + [0]
+        self.updated = {}
+
+    def get(self, doi, maxage=None):
+        """Returns the cached tuple (citation, url) of the given doi, or None if not found
+        :param maxage: the maximum age (in seconds) of the cached citation. If given and the
+            citation was fetched longer ago, returns None. None (the default): no maximum age
+        """
+        entry = self.data.get(doi, None)
+        if entry is None or (maxage is not None and
+                             time.time() - (entry[2] if len(entry) > 2 else 0) > maxage):
+            return None
+        return entry[0], entry[1]
+
+    def put(self, doi, citation):
+        """Puts the given tuple (citation, url) under the given doi"""
+        self.data[doi] = self.updated[doi] = [citation[0], citation[1], time.time()]
+
+    def save(self):
+        """Writes all citations put in this object to file. No-op if no citation was put.
+        As the file might be shared with other (concurrent) builds, the file is re-read before
+        writing, and written atomically"""
+        if not self.updated:
+            return
+        dirpath = os.path.dirname(self.filepath)
+        if not os.path.isdir(dirpath):
+            try:
+                os.makedirs(dirpath)
+            except OSError:  # race condition: created meanwhile?
+                if not os.path.isdir(dirpath):
+                    raise
+        data = _load_json(self.filepath)
+        data.update(self.updated)
+        fdesc, tmppath = tempfile.mkstemp(suffix='.tmp', dir=dirpath)
+        try:
+            with os.fdopen(fdesc, 'w') as opn_:
+                json.dump(data, opn_)
+            os.rename(tmppath, self.filepath)
+        except:  # @IgnorePep8 pylint: disable=bare-except
+            os.remove(tmppath)
+            raise
+        self.updated = {}
+
+
+def get_citations(dois, cache, ttl=CACHE_TTL_IN_SEC, workers=MAX_WORKERS):
+    """Returns a dict mapping each given DOI to its tuple (doi-citation, url) (both strings, the
+    latter might be empty) or to the Exception raised while fetching it. DOIs are taken from
+    the cache if fetched less than `ttl` seconds ago, otherwise they are fetched from the web
+    concurrently, in at most `workers` threads. If a DOI can not be fetched, its expired cached
+    citation (if any) is returned. Fetched citations are put in the cache (call `cache.save()`
+    to write them to file)
+
+    :param dois: iterable of DOIs (strings). Duplicates are fetched only once
+    :param cache: a `CitationCache`
+    :param ttl: the time-to-live of the cached citations, in seconds. None: never expire
+    """
+    ret = {}
+    tofetch = []
+    for doi in set(dois):
+        citation = cache.get(doi, ttl)
+        if citation is not None:
+            ret[doi] = citation
+        else:
+            tofetch.append(doi)
+    if not tofetch:
+        return ret
+
+    def fetch(doi):
+        # if we have a cache, set a timeout very low (2 secs currently) and use the cache
+        # instead. Conversely, if we do not have a cache, be more patient:
+        timeout = URLOPEN_TIMEOUTS_IN_SEC[0 if cache.get(doi) is None else 1]
+        try:
+            return doi, get_citation_from_web(doi, timeout)
+        except Exception as exc:  # pylint: disable=broad-except
+            return doi, exc
+
+    pool = ThreadPool(max(1, min(workers, len(tofetch))))
+    try:
+        for doi, citation in pool.imap_unordered(fetch, tofetch):
+            if isinstance(citation, Exception):
+                ret[doi] = cache.get(doi) or citation
+            else:
+                cache.put(doi, citation)
+                ret[doi] = citation
+    finally:
+        pool.close()
+        pool.join()
+    return ret
+
+
 def get_citation(root_dir, doi):
     '''
     :return: the tuple (doi-citation, url) (both strings). The latter might be empty.
-    This method reqeusts the doi web service *always*. If an HTTP error occurs, it uses values
+    This method returns the cached citation if not expired, otherwise requests the doi web
+    service. If an HTTP error occurs, it uses the (expired) values
     stored in the cache, if no cache found, raises the HTTP error that will be then displayed
-    in the document.
+    in the document. For several DOIs, use `get_citations`
     '''
-    citation = get_citation_from_cache(root_dir, doi)
-    webcitation = None
-    # if we have a cahce, set a timeout very low (2 secs currently) and use the cache instead
-    # Conversely, if we do not have a cache, be more patient:
-    timeout = URLOPEN_TIMEOUTS_IN_SEC[0 if citation is None else 1]
-    try:
-        webcitation = get_citation_from_web(doi, timeout)
-    except Exception as exc:
-        if citation is None:
-            raise exc
-
-    if webcitation is not None:
-        outfn = os.path.join(root_dir, _CACHE_FILENAME)
-        try:
-            with open(outfn, 'r') as opn_:
-                data = json.load(opn_)
-        except (OSError, IOError, ValueError, TypeError):
-            data = {}
-        data[doi] = webcitation
-        with open(outfn, 'w') as opn_:
-            json.dump(data, opn_)
-
-    return webcitation if webcitation is not None else citation
+    cache = CitationCache(get_cachefile(root_dir), os.path.join(root_dir, _CACHE_FILENAME))
+    citation = get_citations([doi], cache)[doi]
+    cache.save()
+    if isinstance(citation, Exception):
+        raise citation
+    return citation
 
 
 def get_citation_from_cache(root_dir, doi):
-    outfn = os.path.join(root_dir, _CACHE_FILENAME)
-    try:
-        with open(outfn, 'r') as opn_:
-            return json.load(opn_).get(doi, None)
-    except (OSError, IOError, ValueError, TypeError):
-        pass
-    return None
+    cache = CitationCache(get_cachefile(root_dir), os.path.join(root_dir, _CACHE_FILENAME))
+    return cache.get(doi)
 
 
 def get_citation_from_web(doi, timeout):
@@ -137,6 +257,7 @@ class doicitnode(nodes.TextElement):
 #    def __init__(self, text, **attributes):
 
 
+@timed('doicitation.role')
 def doicitation_role(name, rawtext, text, lineno, inliner, options={}, content=[]):
     """
     Function registered in the app for the doi-citation role. Almost no-op, returns
@@ -158,15 +279,18 @@ def doicitation_role(name, rawtext, text, lineno, inliner, options={}, content=[
     return [doicitnode(text)], []
     
 
+@timed('doicitation.visit')
 def visit_doicit_node(self, node):
     '''visits the doicitnode and creates its children after querying for the DOI citation
-    to the web service. As this method does nothing the node will not be rendered,
+    to the web service, if not already done (see `resolve_citations`).
+    As this method does nothing the node will not be rendered,
     but its children (a text node plus an optional href) will be traversed and rendered
     accordingly
     :param node: the ```doicitnode```
     '''
     # setup the node properly, with substitutions if needed
-    process_node(node, self.builder.app)  
+    if not node.children:
+        process_node(node, self.builder.app)
     # as we built it, the rendering is fine. self will pass this node and process
     # its children correctly
 
@@ -177,11 +301,56 @@ def depart_doicit_node(self, node):
     pass
 
 
+@timed('doicitation.resolve')
+def resolve_citations(app, doctree, docname):
+    '''Fetches the citations of all doicitnode's of the given doctree at once (see
+    `get_citations`) and sets the nodes children (see `set_children`). The citations cache
+    is written to file once, at the end of the build (see `save_citations`)'''
+    nodez = [(node, get_doi(node, app)) for node in doctree.traverse(doicitnode)
+             if not node.children]
+    if not nodez:
+        return
+    cache = getattr(app, '_doicitation_cache__', None)
+    if cache is None:
+        cache = app._doicitation_cache__ = \
+            CitationCache(get_cachefile(app.srcdir), os.path.join(app.srcdir, _CACHE_FILENAME))
+    citations = get_citations([doi for _, doi in nodez], cache, app.config.doicitation_cache_ttl,
+                              app.config.doicitation_workers)
+    for node, doi in nodez:
+        citation = citations[doi]
+        if isinstance(citation, Exception):
+            set_children(node, str(citation), '')
+        else:
+            set_children(node, *citation)
+
+
+def save_citations(app, exception):
+    '''Writes the citations fetched during the build to the cache file'''
+    cache = getattr(app, '_doicitation_cache__', None)
+    if cache is not None:
+        cache.save()
+
+
 def process_node(node, app):
     '''Sets the children of node after querying the DOI web service. The children
     are a text node plus an optional href
     :param node: the ```doicitnode```
     '''
+    # prepare the doi
+    doitext = get_doi(node, app)
+    source_dir = app.srcdir
+    try:
+        doi_text, doi_url = get_citation(source_dir, doitext)
+    except Exception as exc:  #pylint: disable=broad-except
+        doi_text = str(exc)
+        doi_url = ''
+    return set_children(node, doi_text, doi_url)
+
+
+def get_doi(node, app):
+    '''Returns the DOI of the given node, with substitutions (see below) if needed
+    :param node: the ```doicitnode```
+    '''
     text = node.rawsource
     metadata = app.env.metadata[app.config.master_doc]
     # check strings in the form "|.*|" and substitute them with
@@ -205,14 +374,13 @@ def process_node(node, app):
         doitext += s
     if substitution_text is not None:  # some chunk open and not closed with "|"? append it:
         doitext += "|" +substitution_text
+    return doitext
 
-    # prepare the doi
-    source_dir = app.srcdir
-    try:
-        doi_text, doi_url = get_citation(source_dir, doitext)
-    except Exception as exc:  #pylint: disable=broad-except
-        doi_text = str(exc)
-        doi_url = ''
+
+def set_children(node, doi_text, doi_url):
+    '''Sets the children of node: a text node (the citation) plus an optional href (the url)
+    :param node: the ```doicitnode```
+    '''
     nodez = [nodes.Text(touni(doi_text))]  # `touni` because Text nodes want unicode
     if doi_url:
         urlnode = nodes.reference('', '')
@@ -236,3 +404,7 @@ def setup(app):
                  latex=(visit_doicit_node, depart_doicit_node))
 
     app.add_role('doi-citation', doicitation_role)
+    app.add_config_value('doicitation_cache_ttl', CACHE_TTL_IN_SEC, '')
+    app.add_config_value('doicitation_workers', MAX_WORKERS, '')
+    app.connect('doctree-resolved', resolve_citations)
+    app.connect('build-finished', save_citations)
@@ -2,14 +2,17 @@
 """
     Implements the sphinx directive to show a grid of images as a figure. This
     directive subclasses the CSVTable directive and in principle accepts all its options
-    PLUS the options `dir` (root images directory) and `errorsastext` (show text for images
+    PLUS the options `dir` (root images directory), `errorsastext` (show text for images
     not found, which is relevant because - who knows why - PdfLateX does not compile with more
-    than 100 includegraphics errors). For info see:
+    than 100 includegraphics errors) and `html-page-rows` (html only: number of rows initially
+    shown, the others being displayed on demand via a button. 0: show all rows. Defaults to
+    the config value 'gridfigure_html_page_rows'). For info see:
     http://docutils.sourceforge.net/docs/ref/rst/directives.html#csv-table
 
     .. gridfigure:: figure_caption
         :dir: folder
         :errorsastext: true
+        :html-page-rows: 20
         :delim: space
         :align: center
         :header-rows: 1
@@ -85,9 +88,18 @@
 """
 import os
 import re
+import math
+import shutil
+import struct
+import posixpath
 from docutils.nodes import Element
 from docutils.parsers.rst import directives
+from sphinx.util import ensuredir
+from sphinx.util.osutil import relative_uri
 from gfzreport.sphinxbuild.core.extensions.csvfigure import CsvFigureDirective
+from gfzreport.sphinxbuild.core.extensions.setup import filedigest
+from gfzreport.sphinxbuild.filecache import FileCache, get_cachedir, hashkey
+from gfzreport.sphinxbuild.timing import timed
 from docutils.nodes import image as img_node
 
 _DIRECTIVE_NAME = 'gridfigure'
@@ -100,8 +112,10 @@ class imggrid(Element):
 class ImgsGridDirective(CsvFigureDirective):
 
     option_spec = CsvFigureDirective.option_spec.copy()  # @UndefinedVariable
-    option_spec.update({'dir': directives.path, 'errorsastext': directives.unchanged})
+    option_spec.update({'dir': directives.path, 'errorsastext': directives.unchanged,
+                        'html-page-rows': directives.nonnegative_int})
 
+    @timed('gridfigure.directive')
     def run(self):
         nodez = CsvFigureDirective.run(self)
 
@@ -124,9 +138,14 @@ class ImgsGridDirective(CsvFigureDirective):
 
         # base dir is relative to the source directory, so get root dir to check later
         # if file exists
+        env = self.state.inliner.document.settings.env
         root_dir = base_dir if os.path.isabs(base_dir) else \
-            os.path.abspath(os.path.join(self.state.inliner.document.settings.env.srcdir,
-                                         base_dir))
+            os.path.abspath(os.path.join(env.srcdir, base_dir))
+        # the fraction of the table width of each column, used to size the images thumbnails
+        # (see `resolve_images`):
+        colwidths = [_['colwidth'] for _ in self._itercolspecs(nodez)]
+        colfractions = [float(_) / sum(colwidths) for _ in colwidths] if colwidths and \
+            all(colwidths) else []
         # now replace each string given in the csv (file or table) with an image node
         # with the correct path:
         for row, col, is_row_header, is_stub_column, node, node_text in self.itertable(nodez):
@@ -134,10 +153,19 @@ class ImgsGridDirective(CsvFigureDirective):
             if is_row_header or is_stub_column or not node:
                 continue
             filename = node_text
+            if filename:
+                # note the dependency also for non-existing files, so that the document is
+                # re-built when they will be added (e.g., uploaded):
+                env.note_dependency(os.path.join(root_dir, filename))
             fileexists = filename and os.path.isfile(os.path.join(root_dir, filename))
             if fileexists or not errastext:
                 imgnode = img_node(**self.options)
                 imgnode.attributes['uri'] = os.path.join(base_dir, filename)
+                imgnode['loading'] = 'lazy'  # see HTMLTranslator.visit_image
+                if fileexists and col < len(colfractions):
+                    imgnode['gridfigure_src'] = os.path.relpath(os.path.join(root_dir, filename),
+                                                                env.srcdir)
+                    imgnode['gridfigure_colfraction'] = colfractions[col]
                 node.replace_self(imgnode)
 
         ret = imggrid(**self.options)
@@ -145,6 +173,7 @@ class ImgsGridDirective(CsvFigureDirective):
         return nodez
 
 
+@timed('gridfigure.visit_latex')
 def visit_imggrid_node_latex(self, node):
     # Note that the directive above is built in order to delegate sphinx for everything:
     # build a figure wrapping a longtable. This also assures that custom commands
@@ -161,102 +190,136 @@ def visit_imggrid_node_latex(self, node):
     # final note: maybe in the
     # future we need some code in between which forces us to move this code to depart_imggrid...
 
-    # iterate reversed to parse content just added:
-    for i in xrange(len(self.body)-1, -1, -1):
-        # find end of longtable:
-        if self.body[i].strip() == "\\end{longtable}":
-            # re-iterate from the end of longtable:
-            for j in xrange(i-1, -1, -1):
-                # find start of longtable:
-                if self.body[j].strip() == "\\begin{longtable}":
-                    # re-iterateo from the start of longtable
-                    for k in xrange(j-1, -1, -1):
-                        # find start of wrapping figure
-                        if self.body[k].strip().startswith("\\begin{figure}"):
-                            # set the fig_start list of strings which have to be moved AFTER
-                            # the longtable:
-                            fig_start = self.body[k: j]
-                            # set the table list of strings:
-                            table = self.body[j: i+1]
-                            # set the remaining figure:
-                            fig_end = self.body[i+1:]
-                            # Inspect the 'table' list, which is the latex table we use. It might
-                            # be a longtable. In case, sphinx uses the longtable \endfirsthead,
-                            # \endhead etc... commands which issue strings when the longtable
-                            # overflows the page.
-                            # By default, tables have the caption BEFORE the table, whilst
-                            # figures not. Thus longtables have a header in the form of:
-                            # "Table 3 -- continued from previous page"
-                            # and a footer in the form of
-                            # "Continued on next page"
-                            # As said, headers and footer strings appear if the longtable overflows
-                            # Now, as this is a figure-like directive, we put the
-                            # caption at the bottom, and consequently we want to have headers
-                            # of the form:
-                            # "Continued from previous page"
-                            # and footers of the form:
-                            # "Table 3 -- continued on next page"
-                            # Final Note: if these headers are present, i.e. the variable 'table'
-                            # hosts a latex longtable, then we need to set the
-                            # figure counter forward in the table, so that \thefigure{} points
-                            # to the next latex figure, which is in fact an empty figure
-                            # used for the caption (use latex \addtocounter)
-                            reset_counter_fig = 0  # when non-zero, 'table' hosts a latex longtable
-                            # when 2, we can break the loop below (nothing more to be replaced)
-
-                            # define longtable header and footer (search and replace strings):
-                            # note that we search for tablecontinued and NOT \tablecontinued
-                            # to be compliant with future versions where \sphinxtablecontinued
-                            # might be used
-
-                            # lt_header replaces e.g.
-                            # "Table 1 -- continued from previous page" with
-                            # "Continued from previous page" (no fig number in the header):
-                            # Note that this will NOT appear on the FIRST header of the longtable
-                            lt_header = [r'tablecontinued{\tablename\ \thetable{} -- continued '
-                                         r'from previous page}',
-                                         r'tablecontinued{Continued from previous page}']
-                            # lt_footer replaces e.g. "Continued on next page" with
-                            # "Fig. 7 -- continued on next page" (fig num. in the footer):
-                            # Note that this will NOT appear on the LAST footer of the longtable
-                            lt_footer = [r'tablecontinued{Continued on next page}',
-                                         r'tablecontinued{\figurename\ \thefigure{} -- '
-                                         r'continued on next page}']
-
-                            for x in xrange(len(table)):
-                                if lt_header[0] in table[x]:
-                                    table[x] = table[x].replace(lt_header[0], lt_header[1])
-                                    reset_counter_fig += 1
-
-                                elif lt_footer[0] in table[x]:
-                                    table[x] = table[x].replace(lt_footer[0], lt_footer[1])
-                                    reset_counter_fig += 1
-
-                                if reset_counter_fig == 2:
-                                    break
-
-                            if reset_counter_fig:
-                                # hack reset figure counter so that the command \thefigure points
-                                # to the correct number:
-                                table = ["\n\n\\addtocounter{figure}{1}\n\n"] + table + \
-                                        ["\n\n\\addtocounter{figure}{-1}\n\n"]
-
-                            # move the figure up of a \textfloatsep length, so to give the
-                            # impression it's the caption
-                            self.body = self.body[:k] + table + \
-                                ["\n\\vspace{-\\textfloatsep}\n"] + \
-                                fig_start + fig_end
-                            return
+    # The positions (indices in self.body) of the wrapping figure and of the longtable are
+    # recorded by our LatexTranslator when written (see gfzreport.sphinxbuild.core.writers.latex)
+    # so we do not need to search them in the (possibly huge) body. They must refer to the
+    # current body and be in the order \begin{figure} ... \begin{longtable} ... \end{longtable}
+    figure = getattr(self, 'last_figure', None)
+    longtable = getattr(self, 'last_longtable', None)
+    if figure is None or longtable is None or figure[0] is not self.body or \
+            longtable[0] is not self.body:
+        return
+    k, j, i = figure[1], longtable[1], longtable[2]
+    if k is None or j is None or not k < j < i:
+        return
+    # the positions will change, reset them:
+    self.last_figure = self.last_longtable = None
+    # set the fig_start list of strings which have to be moved AFTER
+    # the longtable:
+    fig_start = self.body[k: j]
+    # set the table list of strings:
+    table = self.body[j: i+1]
+    # set the remaining figure:
+    fig_end = self.body[i+1:]
+    # Inspect the 'table' list, which is the latex table we use. It might
+    # be a longtable. In case, sphinx uses the longtable \endfirsthead,
+    # \endhead etc... commands which issue strings when the longtable
+    # overflows the page.
+    # By default, tables have the caption BEFORE the table, whilst
+    # figures not. Thus longtables have a header in the form of:
+    # "Table 3 -- continued from previous page"
+    # and a footer in the form of
+    # "Continued on next page"
+    # As said, headers and footer strings appear if the longtable overflows
+    # Now, as this is a figure-like directive, we put the
+    # caption at the bottom, and consequently we want to have headers
+    # of the form:
+    # "Continued from previous page"
+    # and footers of the form:
+    # "Table 3 -- continued on next page"
+    # Final Note: if these headers are present, i.e. the variable 'table'
+    # hosts a latex longtable, then we need to set the
+    # figure counter forward in the table, so that \thefigure{} points
+    # to the next latex figure, which is in fact an empty figure
+    # used for the caption (use latex \addtocounter)
+    reset_counter_fig = 0  # when non-zero, 'table' hosts a latex longtable
+    # when 2, we can break the loop below (nothing more to be replaced)
+
+    # define longtable header and footer (search and replace strings):
+    # note that we search for tablecontinued and NOT \tablecontinued
+    # to be compliant with future versions where \sphinxtablecontinued
+    # might be used
+
+    # lt_header replaces e.g.
+    # "Table 1 -- continued from previous page" with
+    # "Continued from previous page" (no fig number in the header):
+    # Note that this will NOT appear on the FIRST header of the longtable
+    lt_header = [r'tablecontinued{\tablename\ \thetable{} -- continued '
+                 r'from previous page}',
+                 r'tablecontinued{Continued from previous page}']
+    # lt_footer replaces e.g. "Continued on next page" with
+    # "Fig. 7 -- continued on next page" (fig num. in the footer):
+    # Note that this will NOT appear on the LAST footer of the longtable
+    lt_footer = [r'tablecontinued{Continued on next page}',
+                 r'tablecontinued{\figurename\ \thefigure{} -- '
+                 r'continued on next page}']
+
+    for x in xrange(len(table)):
+        if lt_header[0] in table[x]:
+            table[x] = table[x].replace(lt_header[0], lt_header[1])
+            reset_counter_fig += 1
+
+        elif lt_footer[0] in table[x]:
+            table[x] = table[x].replace(lt_footer[0], lt_footer[1])
+            reset_counter_fig += 1
+
+        if reset_counter_fig == 2:
+            break
+
+    if reset_counter_fig:
+        # hack reset figure counter so that the command \thefigure points
+        # to the correct number:
+        table = ["\n\n\\addtocounter{figure}{1}\n\n"] + table + \
+                ["\n\n\\addtocounter{figure}{-1}\n\n"]
+
+    # move the figure up of a \textfloatsep length, so to give the
+    # impression it's the caption. Replace the body tail in place (the body before the
+    # figure is not copied):
+    self.body[k:] = table + ["\n\\vspace{-\\textfloatsep}\n"] + fig_start + fig_end
 
 
 def depart_imggrid_node_latex(self, node):
     pass
 
 
+@timed('gridfigure.visit_html')
 def visit_imggrid_node_html(self, node):
     # as we built it, the rendering is fine. self will pass this node and process
-    # its children correctly
-    pass
+    # its children correctly. The only thing we do is paginating the table rows (images are
+    # lazily loaded, see the directive, but a grid of hundreds of rows makes the page heavy
+    # anyway): hide (html 'hidden' attribute) all table body rows after the first `page_rows`.
+    # Then add a button showing the next `page_rows` rows.
+    # As in visit_imggrid_node_latex, the position (indices in self.body) of the table is
+    # recorded by our HTMLTranslator when written (see gfzreport.sphinxbuild.core.writers.html)
+    # so we do not need to search it in the (possibly huge) body
+    page_rows = node.get('html-page-rows', self.builder.config.gridfigure_html_page_rows)
+    table = getattr(self, 'last_table', None)
+    if not page_rows or table is None or table[0] is not self.body:
+        return
+    i, end = table[1], table[2]
+    if not (self.body[i].startswith('<table') and 'gridfigure' in self.body[i]):
+        return
+    # the positions will change, reset them:
+    self.last_table = None
+    # html ids must be unique, use a counter of this translator (i.e., of the html page):
+    self._gridfigure_tables_ = getattr(self, '_gridfigure_tables_', 0) + 1
+    tableid = 'gridfigure-table-%d' % self._gridfigure_tables_
+    self.body[i] = '<table id="%s"%s' % (tableid, self.body[i][len('<table'):])
+    rows, tbody = 0, False
+    for j in xrange(i+1, end):
+        if self.body[j].startswith('<tbody'):
+            tbody = True
+        elif tbody and self.body[j].startswith('<tr'):
+            rows += 1
+            if rows > page_rows:
+                self.body[j] = '<tr hidden%s' % self.body[j][len('<tr'):]
+    if rows > page_rows:
+        onclick = ("var r=document.querySelectorAll('#%s tr[hidden]');"
+                   "for(var i=0;i&lt;r.length&amp;&amp;i&lt;%d;i++){r[i].hidden=false;}"
+                   "if(r.length&lt;=%d){this.parentNode.hidden=true;}") % \
+            (tableid, page_rows, page_rows)
+        self.body.append('<p class="gridfigure-more"><button type="button" onclick="%s">'
+                         'Show more rows</button></p>\n' % onclick)
 
 
 def depart_imggrid_node_html(self, node):
@@ -265,8 +328,152 @@ def depart_imggrid_node_html(self, node):
     pass
 
 
+# Images thumbnails. Grid figures might display tens of (big) images which are in most cases
+# copied as they are in the build directory, slowing down the html page load and pdflatex.
+# After the doctree is resolved, each image is thus replaced with a downscaled copy
+# (thumbnail) whose width is the image column fraction times the width given in the
+# config ('gridfigure_html_width' or 'gridfigure_latex_width', in pixels). Thumbnails are cached
+# (see `gfzreport.sphinxbuild.filecache`) under the md5 of the source image and the thumbnail
+# width. Only PNG images are downscaled (we cannot rely on PIL being installed, and we use
+# matplotlib to read and write images): other images, images not sufficiently bigger than
+# their thumbnail, and images which could not be downscaled are left as they are.
+# In html, the pixel size of PNG images is also set, so that lazily loaded images have their
+# final size before being loaded
+
+_THUMBS_VERSION = '1'  # change this if the thumbnails change for the same source and width
+
+_THUMBS_CACHE_MAXSIZE = 200 * 1024 * 1024  # bytes
+
+_thumbs_cache = None
+
+
+def get_thumbs_cache():
+    """Returns the `FileCache` of the grid figure images thumbnails, or None if caches are
+    disabled"""
+    global _thumbs_cache  # pylint: disable=global-statement
+    dirpath = get_cachedir('gridthumbs')
+    if dirpath is None:
+        return None
+    if _thumbs_cache is None or _thumbs_cache.dirpath != dirpath:
+        _thumbs_cache = FileCache(dirpath, _THUMBS_CACHE_MAXSIZE, '.png')
+    return _thumbs_cache
+
+
+def pnginfo(filepath):
+    """Returns the tuple (width, height, dpi) of the given PNG image by reading its header
+    only. dpi is None if not given in the image. Returns None if the file is not a PNG image
+    """
+    with open(filepath, 'rb') as opn:
+        if opn.read(8) != b'\x89PNG\r\n\x1a\n':
+            return None
+        size, dpi = None, None
+        while True:
+            chunk = opn.read(8)
+            if len(chunk) < 8:
+                break
+            length, ctype = struct.unpack('>I4s', chunk)
+            if ctype == b'IHDR':
+                size = struct.unpack('>II', opn.read(8))
+                length -= 8
+            elif ctype == b'pHYs':
+                ppux, _, unit = struct.unpack('>IIB', opn.read(9))
+                if unit == 1:  # pixels per meter
+                    dpi = ppux * 0.0254
+                length -= 9
+            elif ctype == b'IDAT':  # pHYs must precede the image data
+                break
+            opn.seek(length + 4, 1)  # skip the chunk data (if any left) and the crc
+        return None if size is None else (size[0], size[1], dpi)
+
+
+def make_thumbnail(srcpath, factor, dpi, outpath):
+    """Writes in `outpath` the PNG image `srcpath` downscaled by the given integer factor
+    (each `factor` x `factor` block of pixels is averaged into a single pixel). The
+    thumbnail dpi is `dpi/factor`, so that it has the same physical size of the source
+    image (which is relevant in LaTeX)"""
+    import matplotlib.image as mpimg
+    data = mpimg.imread(srcpath)
+    hgt, wdt = data.shape[0] // factor, data.shape[1] // factor
+    data = data[:hgt * factor, :wdt * factor]
+    data = data.reshape((hgt, factor, wdt, factor) + data.shape[2:]).mean(axis=(1, 3))
+    mpimg.imsave(outpath, data, vmin=0, vmax=1, cmap='gray' if data.ndim == 2 else None,
+                 format='png', dpi=dpi / factor)
+
+
+def thumbnail(app, srcpath, info, width, outdir):
+    """Creates (or copies from the cache) the thumbnail of the given image into outdir, and
+    returns its file name. Returns None if the image does not need to (or can not) be
+    downscaled
+    :param info: the value of `pnginfo(srcpath)`
+    """
+    if info is None:
+        return None
+    factor = info[0] // width
+    if factor < 2:
+        return None
+    key = hashkey(_THUMBS_VERSION, filedigest(app.env, srcpath), width)
+    fname = 'gridfigure-%s.png' % key
+    outpath = os.path.join(outdir, fname)
+    if os.path.isfile(outpath):  # already created in this build (same image and width)
+        return fname
+    ensuredir(outdir)
+    cache = get_thumbs_cache()
+    cached = None if cache is None else cache.get(key)
+    if cached is not None:
+        shutil.copy2(cached, outpath)
+        return fname
+    make_thumbnail(srcpath, factor, info[2] or 72.0, outpath)
+    if cache is not None:
+        cache.put(key, outpath)
+    return fname
+
+
+@timed('gridfigure.images')
+def resolve_images(app, doctree, docname):
+    """Replaces the grid figures images with their thumbnails (see `thumbnail`) and sets the
+    images pixel size in html"""
+    fmt = app.builder.format
+    if fmt not in ('html', 'latex'):
+        return
+    if fmt == 'html':
+        maxwidth = app.config.gridfigure_html_width
+        imagedir = app.builder.imagedir
+        imgpath = relative_uri(app.builder.get_target_uri(docname), imagedir)
+    else:
+        maxwidth = app.config.gridfigure_latex_width
+        imagedir = imgpath = ''
+    outdir = os.path.join(app.builder.outdir, imagedir)
+    for node in doctree.traverse(img_node):
+        if 'gridfigure_colfraction' not in node:
+            continue
+        srcpath = os.path.join(app.srcdir, node['gridfigure_src'])
+        width = int(math.ceil(maxwidth * node['gridfigure_colfraction']))
+        try:
+            info = pnginfo(srcpath)
+            # skip images with 'scale', as their rendered size depends on their pixel size:
+            if app.config.gridfigure_thumbnails and 'scale' not in node:
+                fname = thumbnail(app, srcpath, info, width, outdir)
+                if fname is not None:
+                    node['uri'] = posixpath.join(imgpath, fname) if imgpath else fname
+                    # do not let sphinx rewrite the uri (and copy the original image):
+                    node['candidates'] = {'?': node['uri']}
+                    info = pnginfo(os.path.join(outdir, fname))
+        except Exception as exc:  # pylint: disable=broad-except
+            app.warn("gridfigure: could not create thumbnail of '%s' (%s), using original "
+                     "image" % (srcpath, str(exc)))
+            continue
+        if fmt == 'html' and info is not None and not any(_ in node for _ in
+                                                          ('width', 'height', 'scale')):
+            node['pixels'] = info[:2]  # see HTMLTranslator.visit_image
+
+
 def setup(app):
     app.add_directive(_DIRECTIVE_NAME, ImgsGridDirective)
+    app.add_config_value('gridfigure_thumbnails', True, '')
+    app.add_config_value('gridfigure_html_width', 1200, '')
+    app.add_config_value('gridfigure_latex_width', 2000, '')
+    app.add_config_value('gridfigure_html_page_rows', 20, '')
+    app.connect('doctree-resolved', resolve_images)
     app.add_node(imggrid, latex=(visit_imggrid_node_latex, depart_imggrid_node_latex),
                  html=(visit_imggrid_node_html, depart_imggrid_node_html))
     # there is an options which might be handy: return a custom node and add it as enumerable
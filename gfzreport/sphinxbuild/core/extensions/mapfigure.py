@@ -60,18 +60,33 @@ from docutils import nodes
 from sphinx.util import ensuredir
 import os
 import re
+import shutil
 import inspect
+import threading
 from itertools import izip
 from gfzreport.sphinxbuild.map import plotmap, torgba, _shapeargs
 from gfzreport.sphinxbuild.core.extensions.csvfigure import CsvFigureDirective
+from gfzreport.sphinxbuild import timing
+from gfzreport.sphinxbuild.timing import timed
+from gfzreport.sphinxbuild.filecache import FileCache, get_cachedir, hashkey
 import math
 import numpy as np
+import matplotlib.pyplot as plt
+from collections import OrderedDict
+from multiprocessing import Pool, cpu_count, current_process
 
 _OVERWRITE_IMAGE_ = False  # set to True while debugging / testing to force map image creation
 # (otherwise, it check if the image is already present according to the arguments given)
 
 _DIRECTIVE_NAME = "mapfigure"
 
+# the maximum size, in bytes, of the cache of rendered map images (see `get_map_cache`):
+_CACHE_MAXSIZE = 512 * 1024 ** 2
+
+# increment this number when the map rendering changes (e.g. `plotmap` code), in order to
+# invalidate the images cached so far:
+_CACHE_VERSION = 1
+
 SUPPORTED_MARKERS = ('o', 's', '^', 'v', 'D', '<', '>', 'h', 'H', 'd')
 
 JS_SVG_FUNC = '''function getSvgURL(marker, size, fillColor, fillOpacity, strokeColor, strokeOpacity){
@@ -223,6 +238,7 @@ class MapImgDirective(CsvFigureDirective):
     option_spec = CsvFigureDirective.option_spec.copy()  # @UndefinedVariable
     option_spec.update(own_option_spec)
 
+    @timed('mapfigure.directive')
     def run(self):
 
         nodez = CsvFigureDirective.run(self)
@@ -263,6 +279,7 @@ class MapImgDirective(CsvFigureDirective):
         return nodez
 
 
+@timed('mapfigure.visit_html')
 def visit_map_node_html(self, node):
     """self seems to be the app Translator object. Source code of the Sphinx object here:
     http://www.sphinx-doc.org/en/stable/_modules/sphinx/application.html
@@ -413,20 +430,117 @@ def get_map_from_csv(**map_args):
     return f
 
 
+_map_cache = None  # pylint: disable=invalid-name
+
+
+def get_map_cache():
+    """Returns the `FileCache` of rendered map images, shared across reports and builds, or
+    None if caches are disabled (see `gfzreport.sphinxbuild.filecache`)"""
+    global _map_cache  # pylint: disable=global-statement,invalid-name
+    cachedir = get_cachedir('maps')
+    if cachedir is None:
+        return None
+    if _map_cache is None or _map_cache.dirpath != cachedir:
+        _map_cache = FileCache(cachedir, _CACHE_MAXSIZE, '.png')
+    return _map_cache
+
+
+def map_cachekey(plotmapargs):
+    """Returns the key (string) of the map image rendered from the given `plotmap` arguments
+    in the map cache. The key accounts also for the versions of the libraries used for
+    rendering"""
+    import matplotlib
+    try:
+        from mpl_toolkits.basemap import __version__ as basemap_version
+    except ImportError:
+        basemap_version = None
+    return hashkey(plotmapargs, _CACHE_VERSION, matplotlib.__version__, basemap_version,
+                   matplotlib.rcParams['savefig.dpi'])
+
+
+def map_filename(node):
+    """Returns the file name of the map image of the given node (latex builder only)"""
+    return 'map_plot-%s.png' % str(node._data_hash__)  # pylint: disable=protected-access
+
+
+def render_map(outfn, plotmapargs, overwrite=False):
+    """Renders the map image with the given `plotmap` arguments into `outfn`, reading the
+    image from the map cache, if found, unless overwrite is True"""
+    ensuredir(os.path.dirname(outfn))
+    cache = get_map_cache()
+    key = map_cachekey(plotmapargs) if cache is not None else None
+    cached = cache.get(key) if cache is not None and not overwrite else None
+    if cached is not None:
+        shutil.copyfile(cached, outfn)
+    else:
+        fig = get_map_from_csv(**plotmapargs)
+        fig.savefig(outfn)
+        # cache the image only if it was fully rendered (i.e., the background image was
+        # fetched. Note that bgimage_error is missing if basemap is not installed):
+        if cache is not None and getattr(fig, 'bgimage_error', True) is None:
+            cache.put(key, outfn)
+        plt.close(fig)
+
+
+def _render_map_job(args):
+    """Renders a map in a worker process (see `render_maps`). Returns None on success, or
+    the exception message"""
+    try:
+        render_map(*args)
+        return None
+    except Exception as exc:  # @IgnorePep8 pylint: disable=broad-except
+        return "%s: %s" % (exc.__class__.__name__, str(exc))
+
+
+def render_maps(app, doctree, docname):
+    """Renders in parallel, before the doctree is written, all map images of the given
+    resolved doctree which need to be rendered. The images are created by a pool of
+    processes (see the config value 'mapfigure_processes'), and later picked up by
+    `visit_map_node_latex`. Images which failed to render in a worker process are rendered
+    (again) in the visitor, so that errors are reported as usual"""
+    if app.builder.name != 'latex':
+        return
+    jobs = OrderedDict()
+    for node in doctree.traverse(mapnode):
+        outfn = os.path.join(app.builder.outdir, map_filename(node))
+        if outfn not in jobs and (_OVERWRITE_IMAGE_ or not os.path.isfile(outfn)):
+            jobs[outfn] = (outfn, node.attributes['__plotmapargs__'], _OVERWRITE_IMAGE_)
+        node['map_rendered'] = False
+    processes = app.config.mapfigure_processes
+    if processes is None:
+        processes = cpu_count()
+    processes = min(processes, len(jobs))
+    # render serially in daemonic processes, which can not have children, and outside the
+    # main thread (e.g., the web app building within a threaded server), as the forked
+    # children might deadlock on locks held by the other threads:
+    if processes < 2 or current_process().daemon or \
+            not isinstance(threading.current_thread(), threading._MainThread):
+        return
+    with timing.phase('mapfigure.render_maps'):
+        pool = Pool(processes)
+        try:
+            errors = pool.map(_render_map_job, jobs.values())
+        finally:
+            pool.close()
+            pool.join()
+    rendered = set(outfn for outfn, err in izip(jobs, errors) if err is None)
+    for node in doctree.traverse(mapnode):
+        outfn = os.path.join(app.builder.outdir, map_filename(node))
+        node['map_rendered'] = outfn in rendered
+
+
+@timed('mapfigure.visit_latex')
 def visit_map_node_latex(self, node):
     """
     self is the app, although not well documented
     http://www.sphinx-doc.org/en/stable/_modules/sphinx/application.html
     """
-    _uuid = node._data_hash__
-    fname = 'map_plot-%s.png' % str(_uuid)
+    fname = map_filename(node)
     outfn = os.path.join(self.builder.outdir, fname)
 
-    if _OVERWRITE_IMAGE_ or not os.path.isfile(outfn):
-        data = node.attributes['__plotmapargs__']
-        fig = get_map_from_csv(**data)
-        ensuredir(os.path.dirname(outfn))
-        fig.savefig(outfn)
+    # render the image unless already rendered in `render_maps`:
+    if not node.get('map_rendered', False) and (_OVERWRITE_IMAGE_ or not os.path.isfile(outfn)):
+        render_map(outfn, node.attributes['__plotmapargs__'], _OVERWRITE_IMAGE_)
 
     node['uri'] = fname
     self.visit_image(node)
@@ -445,3 +559,7 @@ def setup(app):
                  html=(visit_map_node_html, depart_map_node_html),
                  latex=(visit_map_node_latex, depart_map_node_latex))
     app.add_directive(_DIRECTIVE_NAME, MapImgDirective)
+    # the number of processes rendering map images in parallel (latex builder only). None:
+    # number of cpus. Set to 0 or 1 to render maps serially:
+    app.add_config_value('mapfigure_processes', None, '')
+    app.connect('doctree-resolved', render_maps)
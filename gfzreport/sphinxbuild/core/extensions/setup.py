@@ -8,10 +8,12 @@ Created on Apr 4, 2016
 import re
 import sys
 import os
+import hashlib
 from os import path
 from gfzreport.sphinxbuild.core.writers.latex import LatexTranslator
 from gfzreport.sphinxbuild.core.writers.html import HTMLTranslator
 from docutils import nodes
+from gfzreport.sphinxbuild import timing
 # from docutils import nodes
 
 
@@ -194,6 +196,92 @@ def missing_reference(app, env, node, contnode):
     # should be a child of the returned reference node.
 
 
+def filedigest(env, filepath):
+    """Returns the md5 hex digest of the given file content, or None if the file does not
+    exist. Digests are cached in the environment (and thus pickled with it) together with
+    the file size and modification time: the file content is re-read only if any of the latter
+    changed
+    """
+    cache = env.__dict__.setdefault('gfzreport_filedigests', {})
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        cache.pop(filepath, None)
+        return None
+    key = (stat.st_size, stat.st_mtime)
+    cached = cache.get(filepath, None)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    md5 = hashlib.md5()
+    with open(filepath, 'rb') as opn:
+        for chunk in iter(lambda: opn.read(1024 * 1024), b''):
+            md5.update(chunk)
+    digest = md5.hexdigest()
+    cache[filepath] = (key, digest)
+    return digest
+
+
+def docdigest(app, env, docname):
+    """Returns the md5 hex digest of the given document, computed from the content of the
+    config file, of the document source file and of all its dependencies (included files,
+    csv files, images, ...)
+    """
+    md5 = hashlib.md5()
+    files = [path.join(app.confdir, 'conf.py'), env.doc2path(docname)] + \
+        sorted(path.join(env.srcdir, dep) for dep in env.dependencies.get(docname, ()))
+    for filepath in files:
+        md5.update(filepath.encode('utf8') if isinstance(filepath, unicode) else filepath)
+        md5.update(str(filedigest(env, filepath)))
+    return md5.hexdigest()
+
+
+def env_get_outdated(app, env, added, changed, removed):
+    """Content-hash based change detection. Sphinx checks the modification times of the
+    documents and their dependencies, so that e.g. git checkouts re-read documents whose
+    content did not change, and files copied preserving an older modification time (e.g.,
+    uploaded images) are not detected. Thus, for any document already read in a previous
+    build, compare its stored digest (see `env_updated`) with the current one, and return
+    it as changed if they differ, or remove it from `changed` if they are equal
+    """
+    digests = getattr(env, 'gfzreport_docdigests', {})
+    newchanged = []
+    for docname in env.found_docs - added - removed:
+        if docname not in digests or docname in env.reread_always or \
+                not path.isfile(env.doc2path(docname, env.doctreedir, '.doctree')):
+            continue  # let sphinx decide
+        if docdigest(app, env, docname) != digests[docname]:
+            newchanged.append(docname)
+        else:
+            # note: we need to modify the set in place as sphinx does not provide a way
+            # to mark documents as unchanged:
+            changed.discard(docname)
+    return newchanged
+
+
+def env_updated(app, env):
+    """Stores in the environment the digest (see `docdigest`) of all documents"""
+    env.gfzreport_docdigests = {docname: docdigest(app, env, docname)
+                                for docname in env.found_docs}
+    return []
+
+
+def env_before_read_docs(app, env, docnames):
+    """Starts timing the sphinx read phase (see `gfzreport.sphinxbuild.timing`)"""
+    timing.start('sphinx.read')
+
+
+def env_updated_timing(app, env):
+    """Stops timing the sphinx read phase and starts timing the write phase"""
+    timing.stop('sphinx.read')
+    timing.start('sphinx.write')
+    return []
+
+
+def build_finished(app, exception):
+    """Stops timing the sphinx write phase"""
+    timing.stop('sphinx.write')
+
+
 def doctree_resolved(app, doctree, docname):
     """Not used, will be removed in the future"""
     pass
@@ -207,6 +295,11 @@ def setup(app):
     app.connect('builder-inited', app_builder_inited)
     app.connect("missing-reference", missing_reference)
     app.connect("doctree-resolved", doctree_resolved)
+    app.connect('env-get-outdated', env_get_outdated)
+    app.connect('env-updated', env_updated)
+    app.connect('env-before-read-docs', env_before_read_docs)
+    app.connect('env-updated', env_updated_timing)
+    app.connect('build-finished', build_finished)
 
 
 # REMINDER: all Element nodes (docutils.nodes) have constructors like this:
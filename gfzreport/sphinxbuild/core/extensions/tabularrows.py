@@ -19,6 +19,8 @@ import re
 import sys
 from docutils import nodes
 from docutils.parsers.rst import Directive
+
+from gfzreport.sphinxbuild.timing import timed
 # import numpy as np
 
 _DIRECTIVE_NAME = "tabularrows"
@@ -55,6 +57,7 @@ class TabularRowsDirective(Directive):
                    }
     has_content = False
 
+    @timed('tabularrows.directive')
     def run(self):
         hide = self.options.pop('hline-hide', [])
         show = self.options.pop('hline-show', [])
@@ -70,6 +73,7 @@ class TabularRowsDirective(Directive):
         return [node]
 
 
+@timed('tabularrows.visit_html')
 def visit_tr_node_html(self, node):
     pass
 
@@ -78,6 +82,7 @@ def depart_tr_node_html(self, node):
     pass
 
 
+@timed('tabularrows.visit_latex')
 def visit_tr_node_latex(self, node):
     """Visits this node in latex.
     Note that this node has already been put AFTER the next table in the document
@@ -27,6 +27,9 @@ class HTMLTranslator(SmartyPantsHTMLTranslator):
         SmartyPantsHTMLTranslator.__init__(self, *args, **kwds)  # old style class...
         # set custom attributes:
         self._visiting_author_field__ = False
+        # positions of tables in the body (see methods below):
+        self._tables_start__ = []
+        self.last_table = None
 
     def visit_field_body(self, node):
         '''just replace all asterix in authors if present'''
@@ -46,6 +49,19 @@ class HTMLTranslator(SmartyPantsHTMLTranslator):
         self._visiting_author_field__ = node.rawsource.lower().strip() in ('author', 'authors')
         SmartyPantsHTMLTranslator.visit_field_name(self, node)
 
+    def visit_table(self, node):
+        self._tables_start__.append((self.body, len(self.body)))
+        SmartyPantsHTMLTranslator.visit_table(self, node)
+
+    def depart_table(self, node):
+        """Sets `self.last_table`, the tuple (body, start, end) where body is the list of html
+        strings where the last departed table has been written, and start (end) is the index
+        of the <table (</table>) element in body. This is used by some directives to modify
+        the table without re-parsing the whole body"""
+        SmartyPantsHTMLTranslator.depart_table(self, node)
+        body, start = self._tables_start__.pop()
+        self.last_table = (body, start, len(body) - 1)
+
     def visit_raw(self, node):
         '''replaces script tags for safety in thml raw directives'''
         # instead of copying here the node, we let the superclass do it's job and
@@ -71,3 +87,22 @@ class HTMLTranslator(SmartyPantsHTMLTranslator):
 
         if shouldraise:
             raise nodes.SkipNode  # copied from docutils.writers._html_base
+
+    def visit_image(self, node):
+        '''adds the attribute 'loading' to the img tag if the node has it (e.g. 'lazy', see
+        gridfigure directive). If the node has the attribute 'pixels' (tuple of the image width
+        and height) sets also the img width and height so that the page layout does not change
+        while images are loaded (the image is anyway scaled down to fit its container)'''
+        mark = len(self.body)
+        SmartyPantsHTMLTranslator.visit_image(self, node)
+        atts = ''
+        if node.get('loading', None):
+            atts += ' loading="%s"' % node['loading']
+        if node.get('pixels', None):
+            atts += ' width="%d" height="%d" style="max-width:100%%;height:auto"' % \
+                tuple(node['pixels'])
+        if atts:
+            for idx in xrange(mark, len(self.body)):
+                if self.body[idx].startswith('<img '):
+                    self.body[idx] = '<img%s%s' % (atts, self.body[idx][len('<img'):])
+                    break
@@ -38,6 +38,10 @@ class LatexTranslator(LT):
         self._current_fieldbody_start__ = -1
         self._current_field_name__ = ''
         self._current_field_body__ = ''
+        # positions of figures and longtables in the body (see methods below):
+        self._figures_start__ = []
+        self.last_figure = None
+        self.last_longtable = None
 
     # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
     # Bib. Fields management methods (in "chronological" order)
@@ -116,6 +120,7 @@ class LatexTranslator(LT):
         """
             Horrible hack which removes the TERRIBLE (and HARD CODED) frame in the
             bottom of longtable saying "continued on next page". WHY Sphinx does that? WHY??!!!??
+            Sets also `self.last_longtable` (see `depart_figure`)
         """
         # get the current body length. Tables in sphinx writer superclass work weirdly.
         # The real body is allocated as last element of self.bodystack. self.body at this point
@@ -124,11 +129,34 @@ class LatexTranslator(LT):
         strt = len(self.bodystack[-1])
         LT.depart_table(self, node)
         if self.body[-1].strip() == "\\end{longtable}":
+            begin = None
             for i in xrange(strt, len(self.body)):
+                if begin is None and self.body[i].strip() == '\\begin{longtable}':
+                    begin = i
                 if self.body[i].strip() == '\\endlastfoot':
                     break
                 elif self.body[i].startswith(r'\hline \multicolumn{'):
                     self.body[i] = self.body[i].replace("\\hline", "").replace("{|r|}", "{r}")
+            self.last_longtable = (self.body, begin, len(self.body) - 1)
+
+    def visit_figure(self, node):
+        strt = len(self.body)
+        LT.visit_figure(self, node)
+        for i in xrange(strt, len(self.body)):
+            if self.body[i].strip().startswith("\\begin{figure}"):
+                self._figures_start__.append((self.body, i))
+                break
+        else:  # not a float (e.g., figure in table or wrapfigure)
+            self._figures_start__.append((self.body, None))
+
+    def depart_figure(self, node):
+        """Sets `self.last_figure`. Together with `self.last_longtable`, it is the tuple
+        (body, start[, end]) where body is the list of latex strings where the last departed
+        figure (or longtable) has been written, and start (end) is the index of the
+        \\begin{figure} (\\begin{longtable} and \\end{longtable}) element in body. This is
+        used by some directives to move latex chunks without re-parsing the whole body"""
+        LT.depart_figure(self, node)
+        self.last_figure = self._figures_start__.pop()
 
     def astext(self):
         # build a dict of bibliographic fields, and inject them as newcommand
@@ -0,0 +1,134 @@
+'''
+Persistent, size-bounded file caches shared across builds (and reports).
+
+A `FileCache` stores files in a directory under a given key (usually a hash of all the
+parameters used to create the file, see `hashkey`). When the cache size exceeds its
+maximum, the least recently used files are removed. The modification time of a cached file
+is the time it was stored, its access time the time it was last used.
+
+The caches root directory is given by the environment variable 'GFZREPORT_CACHE_DIR'
+(defaults to '~/.gfzreport/cache' when missing). Set the variable to an empty string to
+disable all caches
+
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import json
+import shutil
+import time
+import hashlib
+import tempfile
+
+
+def get_cachedir(name):
+    '''Returns the directory of the cache with the given name, or None if caches are disabled
+    (see module docstring)'''
+    root = os.environ.get('GFZREPORT_CACHE_DIR', None)
+    if root is None:
+        root = os.path.join(os.path.expanduser('~'), '.gfzreport', 'cache')
+    elif not root:
+        return None
+    return os.path.join(root, name)
+
+
+def hashkey(*objs):
+    '''Returns a stable hash (hex string) from the given json serializable objects. Dicts are
+    hashed regardless of the order of their keys. Non json serializable objects are
+    converted via `repr`'''
+    return hashlib.md5(json.dumps(objs, sort_keys=True, default=repr)).hexdigest()
+
+
+class FileCache(object):
+    '''A persistent Least Recently Used (LRU) cache of files'''
+
+    def __init__(self, dirpath, maxsize, ext=''):
+        '''
+        :param dirpath: the cache directory. It will be created if it does not exist
+        :param maxsize: the maximum size of the cache, in bytes
+        :param ext: the extension (including the dot) of the cached files
+        '''
+        self.dirpath = dirpath
+        self.maxsize = maxsize
+        self.ext = ext
+
+    def path(self, key):
+        '''Returns the path of the file cached under the given key. The file might not exist'''
+        return os.path.join(self.dirpath, key + self.ext)
+
+    def get(self, key, maxage=None):
+        '''Returns the path of the file cached under the given key, or None if not found
+        :param maxage: the maximum age (in seconds) of the cached file. If given and the file
+            was stored longer ago, returns None. None (the default): no maximum age
+        '''
+        path = self.path(key)
+        try:
+            mtime = os.stat(path).st_mtime
+            now = time.time()
+            if maxage is not None and now - mtime > maxage:
+                return None
+            os.utime(path, (now, mtime))  # mark as recently used (see `evict`)
+        except OSError:  # file not found
+            return None
+        return path
+
+    def put(self, key, filepath):
+        '''Copies the given file into this cache under the given key, removing the least
+        recently used files if the cache exceeds its maximum size. Returns the path of the
+        cached file'''
+        with open(filepath, 'rb') as src:
+            return self._store(key, lambda dst: shutil.copyfileobj(src, dst))
+
+    def write(self, key, data):
+        '''Same as `put` but writes the given data (bytes) instead of copying a file'''
+        return self._store(key, lambda dst: dst.write(data))
+
+    def _store(self, key, writefunc):
+        if not os.path.isdir(self.dirpath):
+            try:
+                os.makedirs(self.dirpath)
+            except OSError:  # race condition: created meanwhile?
+                if not os.path.isdir(self.dirpath):
+                    raise
+        # write to a temporary file first and then rename (atomic), so that concurrent builds
+        # never see partially written files:
+        fdesc, tmppath = tempfile.mkstemp(suffix='.tmp', dir=self.dirpath)
+        try:
+            with os.fdopen(fdesc, 'wb') as dst:
+                writefunc(dst)
+            os.rename(tmppath, self.path(key))
+        except:  # @IgnorePep8 pylint: disable=bare-except
+            os.remove(tmppath)
+            raise
+        self.evict()
+        return self.path(key)
+
+    def evict(self):
+        '''Removes the least recently used files until the cache size does not exceed its
+        maximum size'''
+        files = []
+        size = 0
+        for fname in os.listdir(self.dirpath):
+            if not fname.endswith(self.ext) or fname.endswith('.tmp'):
+                continue
+            path = os.path.join(self.dirpath, fname)
+            try:
+                stat = os.stat(path)
+            except OSError:  # removed meanwhile
+                continue
+            files.append((stat.st_atime, stat.st_size, path))
+            size += stat.st_size
+        for _, fsize, path in sorted(files):
+            if size <= self.maxsize:
+                break
+            try:
+                os.remove(path)
+            except OSError:  # removed meanwhile
+                pass
+            size -= fsize
+
+    def clear(self):
+        '''Removes all files from this cache'''
+        if os.path.isdir(self.dirpath):
+            shutil.rmtree(self.dirpath)
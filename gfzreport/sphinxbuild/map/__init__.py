@@ -8,9 +8,15 @@ Created on Mar 10, 2016
 
 @author: riccardo
 '''
+import os
+import threading
+from copy import copy
+from collections import OrderedDict
 import numpy as np
 import re
 from itertools import izip, chain
+from io import BytesIO
+import urllib2
 from urllib2 import URLError, HTTPError
 import socket
 import matplotlib.pyplot as plt
@@ -19,6 +25,18 @@ from mpl_toolkits.basemap import Basemap
 from matplotlib.font_manager import FontProperties
 from matplotlib import rcParams
 
+from gfzreport.sphinxbuild.filecache import FileCache, get_cachedir, hashkey
+
+
+# the default ArcGIS server (same as `Basemap.arcgisimage`):
+ARCGIS_SERVER = 'http://server.arcgisonline.com/ArcGIS'
+
+# the maximum size, in bytes, of the cache of ArcGIS background images (see `arcgisimage`):
+_ARCGIS_CACHE_MAXSIZE = 512 * 1024 ** 2
+
+# the maximum number of Basemap objects kept in memory (see `get_basemap`):
+_BASEMAP_CACHE_SIZE = 16
+
 
 def parse_margins(obj, parsefunc=lambda margins: [float(val) for val in margins]):
     """Parses obj returning a 4 element numpy array denoting the top, right, bottom and left
@@ -377,6 +395,137 @@ def _setprop(iterator_of_mp_objects, props):
 
 
 # values below CAN be None but CANNOT be arrays containing None's
+_basemaps = OrderedDict()  # pylint: disable=invalid-name
+_basemaps_lock = threading.Lock()  # pylint: disable=invalid-name
+
+
+def get_basemap(ax=None, **kwargs):
+    """Returns `Basemap(ax=ax, **kwargs)`. As creating a Basemap might be time consuming
+    (projection setup, coastlines and boundaries processing), Basemaps are memoized by their
+    arguments (except `ax`): the returned object is a shallow copy of the memoized Basemap,
+    sharing with the latter the (read-only) projection and boundary data. The least recently
+    used Basemaps are discarded when their number exceeds `_BASEMAP_CACHE_SIZE`
+    """
+    key = hashkey(kwargs)
+    with _basemaps_lock:
+        bmap = _basemaps.pop(key, None)
+        if bmap is not None:
+            _basemaps[key] = bmap  # set as most recently used
+    if bmap is None:
+        bmap = Basemap(**kwargs)
+        with _basemaps_lock:
+            _basemaps[key] = bmap
+            while len(_basemaps) > _BASEMAP_CACHE_SIZE:
+                _basemaps.popitem(last=False)
+    bmap = copy(bmap)
+    bmap.ax = ax
+    # Basemap keeps track of the axes initialized by the object, do not share it:
+    bmap._initialized_axes = set()  # pylint: disable=protected-access
+    return bmap
+
+
+def is_offline():
+    """Returns True if the offline mode is set, i.e. if the environment variable
+    'GFZREPORT_OFFLINE' is set and not in ('', '0', 'false', 'no'). In offline mode, ArcGIS
+    background images are read from the cache only (see `arcgisimage`)"""
+    return os.environ.get('GFZREPORT_OFFLINE', '').lower() not in ('', '0', 'false', 'no')
+
+
+_arcgis_cache = None  # pylint: disable=invalid-name
+
+
+def get_arcgis_cache():
+    """Returns the `FileCache` of ArcGIS background images, or None if caches are disabled
+    (see `gfzreport.sphinxbuild.filecache`)"""
+    global _arcgis_cache  # pylint: disable=global-statement,invalid-name
+    cachedir = get_cachedir('arcgis')
+    if cachedir is None:
+        return None
+    if _arcgis_cache is None or _arcgis_cache.dirpath != cachedir:
+        _arcgis_cache = FileCache(cachedir, _ARCGIS_CACHE_MAXSIZE, '.png')
+    return _arcgis_cache
+
+
+def arcgis_url(bmap, server=ARCGIS_SERVER, service='ESRI_Imagery_World_2D', xpixels=400,
+               ypixels=None, dpi=96):
+    """Returns the url of the ArcGIS Server REST API for fetching the background image of
+    the given Basemap. Code copied from `Basemap.arcgisimage`, see the latter for details"""
+    import pyproj
+    from mpl_toolkits.basemap import _cylproj, _geoslib
+    if not hasattr(bmap, 'epsg'):
+        raise ValueError("Basemap instance must be creating using an EPSG code "
+                         "(http://spatialreference.org) in order to use the wmsmap method")
+    proj = pyproj.Proj(init="epsg:%s" % bmap.epsg, preserve_units=True)
+    xmin, ymin = proj(bmap.llcrnrlon, bmap.llcrnrlat)
+    xmax, ymax = proj(bmap.urcrnrlon, bmap.urcrnrlat)
+    if bmap.projection in _cylproj:
+        dateline = _geoslib.Point(bmap(180., 0.5 * (bmap.llcrnrlat + bmap.urcrnrlat)))
+        if dateline.within(bmap._boundarypolyxy):  # pylint: disable=protected-access
+            raise ValueError("arcgisimage cannot handle images that cross "
+                             "the dateline for cylindrical projections.")
+    if bmap.projection != 'cyl':
+        xmin, xmax = (180. / np.pi) * xmin, (180. / np.pi) * xmax
+        ymin, ymax = (180. / np.pi) * ymin, (180. / np.pi) * ymax
+    if ypixels is None:
+        ypixels = int(bmap.aspect * xpixels)
+    return ("%s/rest/services/%s/MapServer/export?bbox=%s,%s,%s,%s&bboxSR=%s&imageSR=%s&"
+            "size=%s,%s&dpi=%s&format=png32&transparent=true&f=image") % \
+        (server, service, xmin, ymin, xmax, ymax, bmap.epsg, bmap.epsg, xpixels, ypixels, dpi)
+
+
+def get_arcgis_image(url):
+    """Returns the ArcGIS image (numpy array) from the given url. The image is read from the
+    ArcGIS cache if found, otherwise it is downloaded and stored in the cache.
+    In offline mode (see `is_offline`), raises URLError if the image is not cached
+    """
+    from matplotlib.image import imread
+    cache = get_arcgis_cache()
+    key = hashkey(url)
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        return imread(cached, format='png')
+    if is_offline():
+        raise URLError("offline mode, ArcGIS image not cached: %s" % url)
+    data = urllib2.urlopen(url).read()
+    # read the image before caching it, so that invalid images (e.g. error pages) are not
+    # cached:
+    img = imread(BytesIO(data), format='png')
+    if cache is not None:
+        cache.write(key, data)
+    return img
+
+
+def arcgisimage(bmap, server=ARCGIS_SERVER, service='ESRI_Imagery_World_2D', xpixels=400,
+                ypixels=None, dpi=96, verbose=False, ax=None):
+    """Same as `Basemap.arcgisimage`, but the image is read from the ArcGIS cache, if found
+    (see `get_arcgis_image`)"""
+    url = arcgis_url(bmap, server, service, xpixels, ypixels, dpi)
+    if verbose:
+        print(url)
+    return bmap.imshow(get_arcgis_image(url), ax=ax or bmap._check_ax(),  # @IgnorePep8 pylint: disable=protected-access
+                       origin='upper')
+
+
+def prewarm_arcgis_cache(min_lon, min_lat, max_lon, max_lat, mapmargins='0.5deg',
+                         arcgis_service='World_Street_Map', arcgis_xpixels=1500, arcgis_dpi=96):
+    """Downloads into the ArcGIS cache the background image used by `plotmap` for points
+    within the given bounds. The arguments after `max_lat` have the same meaning as in
+    `plotmap`. Returns True if the image has been downloaded, False if it was already cached
+    """
+    cache = get_arcgis_cache()
+    if cache is None:
+        raise ValueError('Caches are disabled (GFZREPORT_CACHE_DIR is empty)')
+    handler = MapHandler([min_lon, max_lon], [min_lat, max_lat], mapmargins)
+    bmap = get_basemap(llcrnrlon=handler.llcrnrlon, llcrnrlat=handler.llcrnrlat,
+                       urcrnrlon=handler.urcrnrlon, urcrnrlat=handler.urcrnrlat,
+                       epsg='4326', resolution=None)
+    url = arcgis_url(bmap, service=arcgis_service, xpixels=arcgis_xpixels, dpi=arcgis_dpi)
+    if cache.get(hashkey(url)) is not None:
+        return False
+    get_arcgis_image(url)
+    return True
+
+
 def plotmap(lons,
             lats,
             labels=None,
@@ -505,7 +654,8 @@ def plotmap(lons,
     A bigger number will ask a bigger image, so the image will have more detail.
     So when the zoom is bigger, `xsize` must be bigger to maintain the resolution
     :param urlfail: (string, 'raise' or 'ignore'. Default: 'ignore'). Tells what to do if the
-    ArcGIS requet fails (URLError, no internet connection etcetera). By default, on failure a raw
+    ArcGIS requet fails (URLError, no internet connection, image not cached in offline mode
+    etcetera: see `arcgisimage`). By default, on failure a raw
     map with continents contour, and oceans will be plotted (good for
     debug). Otherwise, the exception resulting from the web request is raised
     :param maxmeridians: (numeric default: 5). The number of maximum meridians to be drawn. Set to
@@ -615,16 +765,19 @@ def plotmap(lons,
                     epsg='4326',  # 4326,  # 3395,  # 3857,
                     resolution='i', # 'h',
                     ax=map_ax)
-    bmap = Basemap(**kwa)
+    bmap = get_basemap(**kwa)
+    # the exception raised fetching the background image, if any (see below):
+    fig.bgimage_error = None
 
     try:
         kwa = _joinargs("arcgis", kwargs, service=arcgis_service, xpixels=arcgis_xpixels,
                         dpi=arcgis_dpi)
         # set the map image via a map service. In case you need the returned values, note that
         # This function returns an ImageAxis (or AxisImage, check matplotlib doc)
-        bmap.arcgisimage(**kwa)
+        arcgisimage(bmap, **kwa)
     except (URLError, HTTPError, socket.error) as exc:
         # failed, maybe there is not internet connection
+        fig.bgimage_error = exc
         if urlfail == 'ignore':
             # Print a simple map offline
             bmap.drawcoastlines()
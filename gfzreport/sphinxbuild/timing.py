@@ -0,0 +1,157 @@
+'''
+Timing of the build phases.
+
+`gfzreport.sphinxbuild._run` records, for each build, the wall-clock and CPU time spent in
+each build phase (sphinx read and write, our custom directives and node visitors, pdflatex
+passes) and writes them as json file in the build directory (see `get_timingfilename`).
+
+Usage:
+```
+    with recording() as timer:
+        ... code here. Any phase (see below) run in the same thread is recorded in timer ...
+    timer.todict()
+```
+and for timing a phase:
+```
+    with phase('my_phase'):
+        ... code here ...
+
+    @timed('my_phase')
+    def func(...):
+        ...
+
+    start('my_phase')
+    ... code here ...
+    stop('my_phase')
+```
+Phases run outside a `recording` block are not recorded (no-op). Phases with the same name are
+summed up, and phases might be nested (e.g. the time of a directive is also included in the
+time of the sphinx read phase). Note that the CPU time is the process CPU time (user + system,
+including child processes such as pdflatex) and thus it might include the CPU time of other
+threads running concurrently
+
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import time
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+
+_local = threading.local()
+
+
+def get_timingfilename():
+    """Returns the name of the gfzreport json file with the timing of the last build, written
+    in the build directory next to the build log file (see
+    `gfzreport.sphinxbuild.get_logfilename`)"""
+    return "gfzreport.build.timing.json"
+
+
+def _now():
+    '''Returns the tuple (wall-clock time, process cpu time), in seconds'''
+    times = os.times()
+    return time.time(), sum(times[:4])
+
+
+class BuildTimer(object):
+    '''Records the wall-clock and cpu time of named phases'''
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self._started = {}
+        self._start = _now()
+
+    def start(self, name):
+        self._started[name] = _now()
+
+    def stop(self, name):
+        '''Stops the given phase. No-op if the phase was not started'''
+        started = self._started.pop(name, None)
+        if started is not None:
+            now = _now()
+            self.add(name, now[0] - started[0], now[1] - started[1])
+
+    def add(self, name, wall, cpu):
+        record = self.phases.get(name, None)
+        if record is None:
+            record = self.phases[name] = OrderedDict([('calls', 0), ('wall', 0.0),
+                                                      ('cpu', 0.0)])
+        record['calls'] += 1
+        record['wall'] += wall
+        record['cpu'] += cpu
+
+    def todict(self):
+        '''Returns a (json serializable) dict of the timing recorded so far'''
+        now = _now()
+        return OrderedDict([('started', time.strftime('%Y-%m-%dT%H:%M:%S',
+                                                      time.gmtime(self._start[0]))),
+                            ('wall', now[0] - self._start[0]),
+                            ('cpu', now[1] - self._start[1]),
+                            ('phases', self.phases)])
+
+    def write(self, filepath, **extra):
+        '''Writes `self.todict()` as json to the given file path, adding all `extra` items'''
+        dic = self.todict()
+        dic.update(extra)
+        with open(filepath, 'w') as opn:
+            json.dump(dic, opn, indent=2)
+
+
+def current():
+    '''Returns the `BuildTimer` currently recording in this thread, or None'''
+    return getattr(_local, 'timer', None)
+
+
+@contextmanager
+def recording():
+    '''Records all phases run within a with statement in the current thread. Yields the
+    `BuildTimer`'''
+    previous = current()
+    _local.timer = timer = BuildTimer()
+    try:
+        yield timer
+    finally:
+        _local.timer = previous
+
+
+def start(name):
+    timer = current()
+    if timer is not None:
+        timer.start(name)
+
+
+def stop(name):
+    timer = current()
+    if timer is not None:
+        timer.stop(name)
+
+
+@contextmanager
+def phase(name):
+    timer = current()
+    if timer is None:
+        yield
+        return
+    started = _now()
+    try:
+        yield
+    finally:
+        now = _now()
+        timer.add(name, now[0] - started[0], now[1] - started[1])
+
+
+def timed(name):
+    '''Decorator recording the time spent in the decorated function as phase `name`'''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
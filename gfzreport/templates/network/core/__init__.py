@@ -17,7 +17,7 @@ import re
 from collections import defaultdict, OrderedDict
 import urllib2
 from cStringIO import StringIO
-from itertools import product, cycle, izip
+from itertools import product, cycle, izip, chain
 from lxml import etree
 from lxml.etree import XMLSyntaxError
 from glob import glob
@@ -48,8 +48,14 @@ def geofonstations_df(network, start_after_year):
         ival = int(val)
         return ival if ival == val else val
 
+    columns = ['Label', 'Lat', 'Lon', 'Ele', 'Azi', 'Rate', 'Sensor', 'ID', 'Logger', 'Id',
+               'Start', 'End', 'Channels']
+    channels = set()
+
     def func(net, sta):
-        retdict = defaultdict(OrderedDict)
+        # group channels by start date. Each group is a row, i.e. a list of values in
+        # `columns` order (except 'Channels', which is a list of channel codes, see below):
+        rows = OrderedDict()
         strfrmt = "%0.4d-%0.2d-%0.2d"
         for cha in sta.channels:
             start = strfrmt % (cha.start_date.year, cha.start_date.month, cha.start_date.day)
@@ -57,41 +63,32 @@ def geofonstations_df(network, start_after_year):
                 strfrmt % (cha.end_date.year, cha.end_date.month, cha.end_date.day)
             # identify each row by its channel tuple:
             id_ = (sta.code, start)
-            mydic = retdict[id_]  # add if does not exist
-            mydic['Label'] = sta.code
-            mydic['Lat'] = sta.latitude
-            mydic['Lon'] = sta.longitude
-            mydic['Ele'] = int_(cha.elevation)
-            mydic['Azi'] = int_(max(mydic['Azi'], cha.azimuth) if 'Azi' in mydic else cha.azimuth)
-            mydic['Rate'] = int_(cha.sample_rate)
-            mydic['Sensor'] = cha.sensor.model or 'unknown sensor model'
-            mydic['ID'] = cha.sensor.serial_number
-            mydic['Logger'] = cha.data_logger.model
-            mydic['Id'] = cha.data_logger.serial_number
-            mydic['Start'] = start
-            mydic['End'] = end
-            if 'Channels' in mydic:
-                mydic['Channels'] += [cha.code]
+            row = rows.get(id_, None)
+            azi = cha.azimuth
+            if row is None:
+                row = rows[id_] = [None] * len(columns)
+                row[-1] = []
             else:
-                mydic['Channels'] = [cha.code]
-#             mydic['Channels'] = "%s %s" % (mydic['Channels'], cha.code) \
-#                 if 'Channels' in mydic else cha.code
-
-        return retdict.itervalues()
+                azi = max(row[4], azi)
+            row[:-1] = [sta.code, sta.latitude, sta.longitude, int_(cha.elevation), int_(azi),
+                        int_(cha.sample_rate), cha.sensor.model or 'unknown sensor model',
+                        cha.sensor.serial_number, cha.data_logger.model,
+                        cha.data_logger.serial_number, start, end]
+            row[-1].append(cha.code)
+
+        # sort the channels of each row according to `sortchannels`. Put all channels in the
+        # `channels` set and sort it at the end into a list, which will populate
+        # dframe.metadata['channels']
+        for row in rows.itervalues():
+            channels.update(row[-1])
+            row[-1] = " ".join(sortchannels(row[-1], True))
+            yield tuple(row)
 
     # convert to df. Note: rows are sorted alphabetically ascending according to station.code
     # (the station name, or station.station in EDIA naming convention) and THEN by start time
     # which is stored in strings ISO format (e.g. '2013-04-29')
-    dframe = todf(geofon_inventory, func, funclevel='station', sortby=['Label', 'Start'])
-
-    # sort the channels of each row according to `sortchannels`. Put all channels in the
-    # `channels` set and sort it at the end into a list, which will populate
-    # dframe.metadata['channels']
-    channels = set()
-    for idx, cha_list in izip(dframe.index, dframe['Channels']):
-        cha_list = sortchannels(cha_list, True)
-        dframe.loc[idx, 'Channels'] = " ".join(cha_list)
-        channels.update(cha_list)
+    dframe = todf(geofon_inventory, func, funclevel='station', sortby=['Label', 'Start'],
+                  columns=columns)
 
     # add metadata:
     dframe.metadata = {'start_date': None, 'end_date': None, 'desc': '',
@@ -136,6 +133,9 @@ def otherstations_df(geofonstations_df, margins_in_deg):
     # use standard python process pool thread:
     # see second post here:
     # https://stackoverflow.com/questions/16181121/a-very-simple-multithreading-parallel-url-fetching-without-queue
+    # Note that read_stations limits the concurrent connections per data center and caches
+    # the responses (see utils.URLFetcher), so the pool size is not the number of
+    # connections to a single data center
     timeout = 240
 
     def fetch_inv(tup):
@@ -169,10 +169,9 @@ def otherstations_df(geofonstations_df, margins_in_deg):
 
     # parse all inventories and return dataframes
     def func(net, sta):
-        retdict = defaultdict(OrderedDict)
         # Code: # net.code
         if net.code == 'SY':  # ignore synthetic data
-            return retdict
+            return None
 
         # get symbols (cycle iterates on infinity and returns to top)
         marker = net2markers[net.code]
@@ -204,25 +203,14 @@ def otherstations_df(geofonstations_df, margins_in_deg):
 
         color = '#FFFFFF00' if nooverlap else '#FFFFFF'
 
-        mydic = OrderedDict()
-        mydic['Label'] = sta.code
-        mydic['Lat'] = sta.latitude
-        mydic['Lon'] = sta.longitude
-        mydic['Network'] = net.code
-        mydic['Marker'] = marker
-        mydic['Legend'] = caption
-        mydic['Color'] = color
-        return mydic
-
-    dfs = []
-    for inv in invs:
-        dframe = todf(inv, func, funclevel='station')  # , sortkey=lambda val: val['Name'])
-        if not dframe.empty:
-            dfs.append(dframe)
+        return (sta.code, sta.latitude, sta.longitude, net.code, marker, caption, color)
+
+    # parse all inventories at once (the networks of all inventories are chained):
+    dframe = todf(chain.from_iterable(invs), func, funclevel='station',
+                  columns=['Label', 'Lat', 'Lon', 'Network', 'Marker', 'Legend', 'Color'])
 
     # return stations active in the relative timespan:
-    return pd.DataFrame() if not dfs else \
-        pd.concat(dfs, axis=0, ignore_index=True, copy=False)
+    return pd.DataFrame() if dframe.empty else dframe
 
 
 def get_map_df(geofonstations_df, otherstations_df):
@@ -289,15 +277,38 @@ def get_noise_pdfs_content(directory, stations_df, delimiter=" ", quotechar='"')
     '''
 
     channels = stations_df.metadata['channels']
-    # setup a dataframe where at each station and channel corresponds a file name
+    # setup a grid where at each station and channel corresponds a file name
     # stations_df is already sorted according to 'Label' and then 'Start'
-    ret_df = pd.DataFrame(index=stations_df['Label'], columns=channels, dtype=str, data=None)
+    labels = list(stations_df['Label'])
+    grid = np.empty((len(labels), len(channels)), dtype=object)
     splitre = re.compile("[A-Za-z0-9]+|[^A-Za-z0-9]+")
     # store separators used. The most used separator will be set for those files not found
     separators = defaultdict(int)
     extensions = defaultdict(int)
-    # set a dict of location to speedup search: We work with indices cause we might have duplicates
-    col_locations = {c: ret_df.columns.get_loc(c) for c in ret_df.columns}
+    # build the indexes to speedup search. Stations are mapped to their row positions (a
+    # station might have several rows, with different start times), channels to their column
+    # position:
+    sta_rows = OrderedDict()
+    for i, label in enumerate(labels):
+        sta_rows.setdefault(label, []).append(i)
+    cha_cols = {c: j for j, c in enumerate(channels)}
+    # lower case indexes for case insensitive search (see `find` below):
+    ista_rows = {}
+    icha_cols = {}
+    for index_, iindex in [(sta_rows, ista_rows), (cha_cols, icha_cols)]:
+        for key, val in index_.iteritems():
+            iindex.setdefault(key.lower(), val)
+
+    def find(name, index_, iindex):
+        """Returns the value mapped to name, or name.upper() in `index_`, or the value mapped
+        to name.lower() in `iindex` (lower case index). Returns None if no match is found"""
+        ret = index_.get(name, None)
+        if ret is None:
+            ret = index_.get(name.upper(), None)
+            if ret is None:
+                ret = iindex.get(name.lower(), None)
+        return ret
+
     # first sort files according to their chunk: process first those with lower chunks:
     filez = []
     for fl in os.listdir(directory):
@@ -305,8 +316,6 @@ def get_noise_pdfs_content(directory, stations_df, delimiter=" ", quotechar='"')
         extensions[ext] += 1
         # findall, instead of split, returns ALL chunks, also the separators:
         chunks = splitre.findall(fname)
-        stamatch = False
-        chamatch = False
         index = None
         if len(chunks) > 2:
             staname = chunks[0]
@@ -316,65 +325,50 @@ def get_noise_pdfs_content(directory, stations_df, delimiter=" ", quotechar='"')
                     index = int(chunks[4])
                 except:
                     index = None
-            try:
-                # double try-catch cause file names might be not upper-case
-                try:
-                    sta_slice_or_int = ret_df.index.get_loc(staname)
-                except KeyError:
-                    sta_slice_or_int = ret_df.index.get_loc(staname.upper())
-                stamatch = True
-                try:
-                    cha_index = col_locations[chaname]
-                except KeyError:
-                    cha_index = col_locations[chaname.upper()]
-                chamatch = True
-            except KeyError:
-                pass
         else:
             print("noise pdfs fig. will not display file '%s' (cannot infer station and channel)" %
                   fl)
             continue
 
-        if not stamatch:
+        sta_indices = find(staname, sta_rows, ista_rows)
+        if sta_indices is None:
             print("noise pdfs fig. will not display file '%s' (no match for station '%s')" %
                   (fl, staname))
             continue
-        elif not chamatch:
+        cha_index = find(chaname, cha_cols, icha_cols)
+        if cha_index is None:
             print("noise pdfs fig. will not display file '%s' (no match for channel '%s')" %
                   (fl, chaname))
             continue
 
         separators[chunks[1]] += 1
-        filez.append([fl, sta_slice_or_int, cha_index, index, len(chunks)])
+        filez.append([fl, sta_indices, cha_index, index, len(chunks)])
 
     # sort according to the chunk length (ascending):
     filez.sort(key=lambda arr: arr[-1])
 
     # process the files:
-    indices = range(len(ret_df))
-    for fl, sta_slice_or_int, cha_index, index, _ in filez:
-        fname, ext = os.path.splitext(fl)
-
-        idxs = indices[sta_slice_or_int]
-
+    for fl, sta_indices, cha_index, index, _ in filez:
         discard_reason = ''
-        if hasattr(idxs, "__len__"):  # multiple stations found
+        if len(sta_indices) > 1:  # multiple stations found
             if index is None:
-                discard_reason = '%d matching station found, cannot infer index' % (len(idxs))
-            elif index - 1 >= len(idxs):
-                discard_reason = '%d matching station found, %d out of bound' % (len(idxs), index)
+                discard_reason = '%d matching station found, cannot infer index' % \
+                    (len(sta_indices))
+            elif index - 1 >= len(sta_indices):
+                discard_reason = '%d matching station found, %d out of bound' % \
+                    (len(sta_indices), index)
             else:
-                sta_index = idxs[index-1]
+                sta_index = sta_indices[index-1]
         else:
-            sta_index = idxs
+            sta_index = sta_indices[0]
 
-        if not discard_reason and not pd.isnull(ret_df.iloc[sta_index, cha_index]):
+        if not discard_reason and grid[sta_index, cha_index] is not None:
             discard_reason = 'a matching file has already been found'
 
         if discard_reason:
             print("noise pdfs fig. will not display file '%s' (%s)" % (fl, discard_reason))
             continue
-        ret_df.iloc[sta_index, cha_index] = fl
+        grid[sta_index, cha_index] = fl
 
     # replace null values with the "expected" file name.
     # get most used separator and extension to build a likely file (not found anyway)
@@ -382,26 +376,20 @@ def get_noise_pdfs_content(directory, stations_df, delimiter=" ", quotechar='"')
     # (max of empty sequence raises)
     sep = "." if not separators else max(separators.iteritems(), key=lambda _: _[1])[0]
     ext = ".png" if not extensions else max(extensions.iteritems(), key=lambda _: _[1])[0]
-    # First add incrementing indices:
-    tmpdf = pd.DataFrame(index=ret_df.index, columns=['index'], data='')
-    # check duplicated and assign incremental index:
-    dupes = tmpdf.index[tmpdf.index.duplicated()]
-    for staname in dupes:
-        leng = len(tmpdf.loc[staname, :])
-        tmpdf.loc[staname, 'index'] = ["%s%d" % (sep, i) for i in xrange(1, leng+1)]
-
-    for c in ret_df.columns:
-        nulls = pd.isnull(ret_df[c])
-        if not nulls.any():
-            continue
-        nullfiles_stations = ret_df.index[nulls]
-        indices = tmpdf[nulls]['index']
-        ret_df.loc[nulls, c] = nullfiles_stations.str.cat([sep + c] * len(nullfiles_stations)).\
-            str.cat(indices).str.cat([ext] * len(nullfiles_stations))
-
-    return ret_df.to_csv(None, columns=channels, sep=delimiter, header=True, index=False,
-                         encoding='utf-8',
-                         quotechar=quotechar, line_terminator='\n', quoting=csv.QUOTE_MINIMAL)
+    # stations with several rows get incrementing indices:
+    for staname, sta_indices in sta_rows.iteritems():
+        for i, sta_index in enumerate(sta_indices, 1):
+            suffix = "%s%d" % (sep, i) if len(sta_indices) > 1 else ''
+            row = grid[sta_index]
+            for cha_index, cha in enumerate(channels):
+                if row[cha_index] is None:
+                    row[cha_index] = "%s%s%s%s%s" % (staname, sep, cha, suffix, ext)
+
+    return pd.DataFrame(grid, columns=channels).to_csv(None, sep=delimiter, header=True,
+                                                       index=False, encoding='utf-8',
+                                                       quotechar=quotechar,
+                                                       line_terminator='\n',
+                                                       quoting=csv.QUOTE_MINIMAL)
 
 #     # We want to provide empty delimiter because is more readable from the rst than commas or
 #     # semicolons
@@ -0,0 +1,173 @@
+'''
+Streaming (lxml iterparse) reader of FDSN StationXML data.
+
+`read_stationxml` is a lightweight alternative to `obspy.read_inventory`: it parses only
+the fields used to build the network template (network, station and channel codes, dates,
+restricted status, coordinates, sensor and data logger info) and clears the parsed xml
+elements as it goes, so that e.g. channel responses are never materialized.
+The returned objects can be iterated as obspy inventories (network -> stations ->
+channels) and have the same attribute names, so they can be passed to
+`gfzreport.templates.network.core.utils.todf`
+
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+from lxml import etree
+from obspy import UTCDateTime
+
+
+class Equipment(object):
+    '''A channel sensor or data logger'''
+    __slots__ = ('description', 'model', 'serial_number')
+
+    def __init__(self, description=None, model=None, serial_number=None):
+        self.description = description
+        self.model = model
+        self.serial_number = serial_number
+
+
+class Channel(object):
+    __slots__ = ('code', 'location_code', 'start_date', 'end_date', 'restricted_status',
+                 'latitude', 'longitude', 'elevation', 'azimuth', 'sample_rate', 'sensor',
+                 'data_logger')
+
+    def __init__(self, attrib):
+        self.code = attrib.get('code')
+        self.location_code = attrib.get('locationCode', '')
+        self.start_date = _date(attrib.get('startDate'))
+        self.end_date = _date(attrib.get('endDate'))
+        self.restricted_status = attrib.get('restrictedStatus')
+        self.latitude = self.longitude = self.elevation = self.azimuth = None
+        self.sample_rate = None
+        self.sensor = Equipment()
+        self.data_logger = Equipment()
+
+
+class Station(object):
+    '''A station. Iterating over it yields its `Channel`s'''
+    __slots__ = ('code', 'start_date', 'end_date', 'restricted_status', 'latitude',
+                 'longitude', 'elevation', 'channels')
+
+    def __init__(self, attrib):
+        self.code = attrib.get('code')
+        self.start_date = _date(attrib.get('startDate'))
+        self.end_date = _date(attrib.get('endDate'))
+        self.restricted_status = attrib.get('restrictedStatus')
+        self.latitude = self.longitude = self.elevation = None
+        self.channels = []
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    def __len__(self):
+        return len(self.channels)
+
+
+class Network(object):
+    '''A network. Iterating over it yields its `Station`s'''
+    __slots__ = ('code', 'start_date', 'end_date', 'restricted_status', 'description',
+                 'stations')
+
+    def __init__(self, attrib):
+        self.code = attrib.get('code')
+        self.start_date = _date(attrib.get('startDate'))
+        self.end_date = _date(attrib.get('endDate'))
+        self.restricted_status = attrib.get('restrictedStatus')
+        self.description = None
+        self.stations = []
+
+    def __iter__(self):
+        return iter(self.stations)
+
+    def __len__(self):
+        return len(self.stations)
+
+
+def _date(value):
+    return None if not value else UTCDateTime(value)
+
+
+def _float(value):
+    return None if value is None else float(value)
+
+
+def _localname(tag):
+    return tag[tag.find('}') + 1:]
+
+
+def _children(elem):
+    '''Returns a dict of the text of the given element's children, keyed by their tag local
+    name'''
+    return {_localname(child.tag): child.text for child in elem
+            if isinstance(child.tag, basestring)}
+
+
+def _equipment(elem):
+    if elem is None:
+        return Equipment()
+    texts = _children(elem)
+    return Equipment(texts.get('Description'), texts.get('Model'), texts.get('SerialNumber'))
+
+
+def _free(elem):
+    '''Clears the given element and removes from the tree its preceding siblings with the
+    same tag (already parsed and freed). Other siblings (e.g. station coordinates preceding
+    the station channels) are kept as they still need to be parsed'''
+    elem.clear()
+    parent = elem.getparent()
+    prev = elem.getprevious()
+    while prev is not None and prev.tag == elem.tag:
+        parent.remove(prev)
+        prev = elem.getprevious()
+
+
+def read_stationxml(source):
+    '''Reads the given StationXML and returns a list of `Network`s
+
+    :param source: a file path or a file-like object
+    :raise: `lxml.etree.XMLSyntaxError` if source is not valid xml, ValueError if it is not
+        StationXML
+    '''
+    networks = []
+    net = sta = None
+    nsprefix = None
+    for event, elem in etree.iterparse(source, events=('start', 'end'), remove_comments=True):
+        tag = _localname(elem.tag)
+        if nsprefix is None:
+            if tag != 'FDSNStationXML':
+                raise ValueError("Not a StationXML document (root element: '%s')" % tag)
+            nsprefix = elem.tag[:len(elem.tag) - len(tag)]
+        if event == 'start':
+            if tag == 'Network':
+                net = Network(elem.attrib)
+                networks.append(net)
+            elif tag == 'Station' and net is not None:
+                sta = Station(elem.attrib)
+                net.stations.append(sta)
+            continue
+
+        if tag == 'Channel' and sta is not None:
+            cha = Channel(elem.attrib)
+            texts = _children(elem)
+            cha.latitude = _float(texts.get('Latitude'))
+            cha.longitude = _float(texts.get('Longitude'))
+            cha.elevation = _float(texts.get('Elevation'))
+            cha.azimuth = _float(texts.get('Azimuth'))
+            cha.sample_rate = _float(texts.get('SampleRate'))
+            cha.sensor = _equipment(elem.find(nsprefix + 'Sensor'))
+            cha.data_logger = _equipment(elem.find(nsprefix + 'DataLogger'))
+            sta.channels.append(cha)
+            _free(elem)
+        elif tag == 'Station' and sta is not None:
+            texts = _children(elem)
+            sta.latitude = _float(texts.get('Latitude'))
+            sta.longitude = _float(texts.get('Longitude'))
+            sta.elevation = _float(texts.get('Elevation'))
+            sta = None
+            _free(elem)
+        elif tag == 'Network' and net is not None:
+            net.description = elem.findtext(nsprefix + 'Description')
+            net = None
+            _free(elem)
+    return networks
@@ -5,10 +5,22 @@ Created on Jan 9, 2017
 '''
 import pandas as pd
 import urllib2
+import httplib
+import socket
 import os
 import re
+import time
+import threading
+from collections import OrderedDict
+from urlparse import urlparse
 from obspy import read_inventory
 from io import BytesIO
+import requests
+from requests.adapters import HTTPAdapter
+
+from gfzreport.sphinxbuild.filecache import FileCache, get_cachedir, hashkey
+from gfzreport.sphinxbuild.map import is_offline
+from gfzreport.templates.network.core.stationxml import read_stationxml
 
 def relpath(path, reference_path):
     """Almost the same as os.path.relpath but prepends a "./", so the returned value is
@@ -34,26 +46,224 @@ def read_geofonstations(network, start_after_year, **kwargs):
                                    **kwargs))
 
 
-def read_stations(url, timeout=None):
+def read_stations(url, timeout=None, backend='lxml'):
     """Returns an inventory object representing the stations xml file downloaded from the
-    given url
-    :param timeout: the value of the timeout passed to `urllib2`. None defaults to the
-    library default
+    given url. The response is fetched via `urlread` (i.e., it might be read from the local
+    cache)
+    :param timeout: the timeout, in seconds (see `urlopen`). None: no timeout
+    :param backend: either 'lxml' (the default) or 'obspy'. The former parses the xml via
+    `stationxml.read_stationxml`, which is faster and returns a list of lightweight network
+    objects with only the fields used in this package. The latter returns a full obspy
+    Inventory. In both cases the returned object can be passed to `todf`
+    """
+    if backend == 'obspy':
+        def parse(data):
+            return read_inventory(BytesIO(data), format='STATIONXML')
+    elif backend == 'lxml':
+        def parse(data):
+            return read_stationxml(BytesIO(data))
+    else:
+        raise ValueError("Invalid backend '%s', use either 'lxml' or 'obspy'" % str(backend))
+    return urlread(url, timeout, parse=parse)
+
+
+# the maximum number of concurrent connections to the same host (see `URLFetcher`), also
+# the number of connections kept alive for re-use for each host (see `get_session`):
+MAX_CONNECTIONS_PER_HOST = 4
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def get_session():
+    """Returns the `requests.Session` shared by all downloads of this module (see `urlopen`).
+    The session keeps a pool of connections alive for each host, so that subsequent
+    requests to the same data center do not open new connections"""
+    global _SESSION  # pylint: disable=global-statement
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=MAX_CONNECTIONS_PER_HOST)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _SESSION = session
+        return _SESSION
+
+
+class _Response(BytesIO):
+    '''A file-like response of `urlopen`'''
+
+    def __init__(self, content, code):
+        BytesIO.__init__(self, content)
+        self.code = code
+
+    def getcode(self):
+        return self.code
+
+
+def urlopen(url, timeout=None, method='GET'):
+    """Opens the given url via the shared `requests.Session` (see `get_session`) and returns
+    a file-like object of the response (with the `getcode()` method).
+    For compatibility with `urllib2.urlopen`, errors are raised as `urllib2.HTTPError` (HTTP
+    status >= 400) or `urllib2.URLError`, whose reason is a `socket.timeout` (timeouts), a
+    `socket.gaierror` (names not resolved by the DNS) or a `socket.error` (other connection
+    errors)
+    :param timeout: the timeout, in seconds. None: no timeout
+    :param method: the HTTP method
     """
-    # format_ = get_format(url)
-    response = None
     try:
-        response = urllib2.urlopen(url) if timeout is None else \
-            urllib2.urlopen(url, timeout=timeout)
-        return read_inventory(BytesIO(response.read()), format='STATIONXML')
-#         return response.read() if format_ == 'text' else read_inventory(BytesIO(response.read()),
-#                                                                         format='STATIONXML')
-    finally:
-        if response:
+        response = get_session().request(method, url, timeout=timeout)
+    except requests.exceptions.Timeout as exc:
+        raise urllib2.URLError(socket.timeout(str(exc)))
+    except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) \
+            as exc:
+        # requests does not expose the underlying socket error. Check if the host name is
+        # resolved (we are in the failure path, the additional DNS query is negligible):
+        try:
+            socket.getaddrinfo(urlparse(url).hostname, None)
+        except socket.gaierror as gexc:
+            raise urllib2.URLError(gexc)
+        raise urllib2.URLError(socket.error(str(exc)))
+    except requests.exceptions.RequestException as exc:  # e.g., invalid url
+        raise urllib2.URLError(str(exc))
+    if response.status_code >= 400:
+        raise urllib2.HTTPError(url, response.status_code, response.reason, response.headers,
+                                None)
+    return _Response(response.content, response.status_code)
+
+
+class URLFetcher(object):
+    """Fetches the content of urls:
+    - limiting the number of concurrent connections to the same host, so that
+      many threads can fetch from several data centers without flooding any of them,
+    - retrying (with exponential backoff) on transient errors (connection errors,
+      timeouts, HTTP status 429 or 5xx),
+    - storing the responses in a persistent `FileCache` (see
+      `gfzreport.sphinxbuild.filecache`) and reading them from there for `ttl` seconds.
+      In offline mode (see `gfzreport.sphinxbuild.map.is_offline`) responses are read from
+      the cache only, regardless of their age
+    Downloads are issued via `urlopen`, i.e. connections to the same host are kept alive and
+    re-used
+    """
+
+    RETRY_HTTP_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, cachename, ttl, cache_maxsize,
+                 max_connections_per_host=MAX_CONNECTIONS_PER_HOST, retries=2, backoff=1.0):
+        """
+        :param cachename: the name of the cache directory (see
+            `gfzreport.sphinxbuild.filecache.get_cachedir`)
+        :param ttl: the time, in seconds, a cached response is valid
+        :param cache_maxsize: the maximum size of the cache, in bytes
+        :param max_connections_per_host: the maximum number of concurrent connections to the
+            same host
+        :param retries: the number of retries on transient errors
+        :param backoff: the time, in seconds, to wait before the first retry (it doubles at
+            each retry)
+        """
+        self.cachename = cachename
+        self.ttl = ttl
+        self.cache_maxsize = cache_maxsize
+        self.max_connections_per_host = max_connections_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self._cache = None
+        self._hostlocks = {}
+        self._lock = threading.Lock()
+
+    def get_cache(self):
+        """Returns the `FileCache` of the responses, or None if caches are disabled"""
+        cachedir = get_cachedir(self.cachename)
+        if cachedir is None:
+            return None
+        if self._cache is None or self._cache.dirpath != cachedir:
+            self._cache = FileCache(cachedir, self.cache_maxsize, '.dat')
+        return self._cache
+
+    def hostlock(self, url):
+        """Returns the semaphore limiting the concurrent connections to the host of url"""
+        host = urlparse(url).netloc
+        with self._lock:
+            lock = self._hostlocks.get(host, None)
+            if lock is None:
+                lock = self._hostlocks[host] = \
+                    threading.BoundedSemaphore(self.max_connections_per_host)
+        return lock
+
+    def read(self, url, timeout=None, parse=None, method='GET'):
+        """Returns the content (bytes) of the given url, or `parse(content)` if parse is given.
+        In the latter case, the content is cached only if `parse` does not raise, so that
+        invalid responses (e.g. error pages) are not cached.
+        In offline mode, raises URLError if the content is not cached
+        :param timeout: the timeout, in seconds (see `urlopen`). None: no timeout
+        :param method: the HTTP method. If 'HEAD', the content is the response status code, as
+            string (e.g. '200')
+        """
+        cache = self.get_cache()
+        key = hashkey(url) if method == 'GET' else hashkey(method, url)
+        offline = is_offline()
+        cached = None if cache is None else cache.get(key, None if offline else self.ttl)
+        if cached is not None:
+            with open(cached, 'rb') as opn:
+                data = opn.read()
+            return data if parse is None else parse(data)
+        if offline:
+            raise urllib2.URLError("offline mode, response not cached: %s" % url)
+        data = self.download(url, timeout, method)
+        ret = data if parse is None else parse(data)
+        if cache is not None:
+            cache.write(key, data)
+        return ret
+
+    def download(self, url, timeout=None, method='GET'):
+        """Downloads and returns the content (bytes) of the given url, retrying on transient
+        errors. See `read` for details"""
+        with self.hostlock(url):
+            attempt = 0
+            while True:
+                try:
+                    return self._download(url, timeout, method)
+                except Exception as exc:  # pylint: disable=broad-except
+                    if attempt >= self.retries or not self.isretriable(exc):
+                        raise
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+
+    @staticmethod
+    def _download(url, timeout, method):
+        kwargs = {} if timeout is None else {'timeout': timeout}
+        if method != 'GET':
+            kwargs['method'] = method
+        response = urlopen(url, **kwargs)
+        try:
+            return response.read() if method != 'HEAD' else str(response.getcode())
+        finally:
             response.close()
 
+    @classmethod
+    def isretriable(cls, exc):
+        """Returns True if the given exception, raised while downloading, denotes a transient
+        error worth retrying. Names not resolved by the DNS are not transient errors"""
+        if isinstance(exc, urllib2.HTTPError):
+            return exc.code in cls.RETRY_HTTP_CODES
+        if isinstance(exc, urllib2.URLError):
+            exc = exc.reason
+        if isinstance(exc, socket.gaierror):
+            return False
+        return isinstance(exc, (socket.error, httplib.HTTPException))
 
-def todf(stations_xml, func, funclevel='station', sortby=None):
+
+_FDSN_FETCHER = URLFetcher('fdsn', ttl=24 * 3600, cache_maxsize=500 * 1024 * 1024)
+
+
+def urlread(url, timeout=None, parse=None):
+    """Reads the content of the given url via the `URLFetcher` of fdsn web services (with
+    per-host connection limits, retries and a persistent cache whose responses are valid
+    for one day). See `URLFetcher.read` for details"""
+    return _FDSN_FETCHER.read(url, timeout, parse)
+
+
+def todf(stations_xml, func, funclevel='station', sortby=None, columns=None):
     """
         Converts stations_xml to pandas DataFrame: Loops through the `stations_xml`'s
         network(s), station(s) and channel(s) and executes
@@ -63,6 +273,7 @@ def todf(stations_xml, func, funclevel='station', sortby=None):
         ```
             obspy.read_inventory(..., format='STATIONSXML')
         ```
+        or the list of networks returned by `stationxml.read_stationxml`
         :param func: a function called on each network / station / channel (depending
         on the value of `funclevel`) returning a row of the resulting dataframe as dictionary
         (the dictionary keys will make up the DataFrame columns).
@@ -88,14 +299,22 @@ def todf(stations_xml, func, funclevel='station', sortby=None):
         :param sortkey (str or list of str): Behaves like the pandas 'by` argument to sort the
         dataframe before returning it: its the name(s) of the column(s) to sort by. If None
         (default when missing) no sort takes place
+        :param columns: list of str or None (the default). If given, the DataFrame is built
+        column-wise, which is much faster for big inventories: `func` must return each row
+        as `tuple` (instead of `dict`) of values in the same order as `columns`. As for
+        dicts, everything not instance of `tuple` will be interpreted as an iterable of
+        tuples, and empty tuples or iterables will be skipped. Rows are collected in a single
+        pass, transposed into one list per column and passed once to the DataFrame
+        constructor
     """
     arr = []
+    rowtype = dict if columns is None else tuple
 
     def add(val):
         """Function executing `list.add` or `list.extend` depending on `val` argument"""
         if not val:
             return
-        if isinstance(val, dict):
+        if isinstance(val, rowtype):
             arr.append(val)
         else:
             arr.extend((v for v in val if v))
@@ -112,7 +331,11 @@ def todf(stations_xml, func, funclevel='station', sortby=None):
                 for cha in sta:
                     add(func(net, sta, cha))
 
-    ret_df = pd.DataFrame(arr)
+    if columns is None:
+        ret_df = pd.DataFrame(arr)
+    else:
+        coldata = [list(col) for col in zip(*arr)] if arr else [[] for _ in columns]
+        ret_df = pd.DataFrame(OrderedDict(zip(columns, coldata)), columns=columns)
     if sortby:
         ret_df.sort_values(by=sortby, inplace=True)
 
@@ -167,9 +390,28 @@ def get_query(*urlpath, **query_args):
                           "&".join("{}={}".format(k, v) for k, v in query_args.iteritems()))
 
 
-def iterdcurl(**query_args):
+EIDA_ROUTING_URL = 'http://geofon.gfz-potsdam.de/eidaws/routing/1/query'
+
+IRIS_STATION_URL = "http://service.iris.edu/fdsnws/station/1/query"
+
+# routing responses (and IRIS availability) change rarely: cache them for one week:
+_ROUTING_FETCHER = URLFetcher('routing', ttl=7 * 24 * 3600, cache_maxsize=10 * 1024 * 1024)
+
+
+def get_routing_file():
+    """Returns the path of the local routing file set in the environment variable
+    'GFZREPORT_ROUTING_FILE', or None if the variable is missing or empty (see `iterdcurl`)"""
+    return os.environ.get('GFZREPORT_ROUTING_FILE', '') or None
+
+
+def iterdcurl(routing_file=None, **query_args):
     """Returns an iterator over all datacenter urls found in the eida routing service, plus
     iris station ws url
+    :param routing_file: optional path to a local routing file, i.e. a text file in the
+    format returned by the eida routing service with 'format=post'. If given, no web service
+    is queried and only the datacenters listed in the file are returned (IRIS is not added:
+    write its url in the file if needed). Useful for offline or reproducible builds. None
+    (the default) uses the path returned by `get_routing_file`, if any
     :param query_args: optional set of **eida routing service keyword arguments** which will be
     appended to the query url. Note that the arguments are not 100% the same as the fdsn arguments
     (for instance, endbefore is not supported), so please use only arguments valid in both cases.
@@ -177,18 +419,21 @@ def iterdcurl(**query_args):
     values 'station' and 'post', respectively.
     For IRIS, due to a bug in the eida routing service, the arguments will be forwarded to the IRIS
     station web service, so they need to be
-    valid fdsn arguments. The IRIS datacenter is yielded if the station web service response
-    returns at least one byte, otherwise not
+    valid fdsn arguments. The IRIS datacenter is yielded if the station web service has data
+    (HTTP status 200 on a HEAD request)
+    Web service responses are cached persistently for one week (see `URLFetcher`)
     """
-    query_args['service'] = 'station'
-    query_args['format'] = 'post'
-    query = get_query('http://geofon.gfz-potsdam.de/eidaws/routing/1/query', **query_args)
+    if routing_file is None:
+        routing_file = get_routing_file()
 
-    url_open = urllib2.urlopen(query)
-    try:
-        dc_result = url_open.read().decode('utf8') or u''
-    finally:
-        url_open.close()
+    if routing_file:
+        with open(routing_file, 'rb') as opn:
+            dc_result = opn.read().decode('utf8') or u''
+    else:
+        query_args['service'] = 'station'
+        query_args['format'] = 'post'
+        query = get_query(EIDA_ROUTING_URL, **query_args)
+        dc_result = _ROUTING_FETCHER.read(query).decode('utf8') or u''
 
     # 1) parse dc_result string and assume any new line starting with http:// is a valid station
     # query url
@@ -198,24 +443,21 @@ def iterdcurl(**query_args):
     for i, char in enumerate(dc_result):
         if char in (u'\n', u'\r') or i == lastcharidx:
             if dc_result[last_idx:last_idx+7] == u"http://":
-                yield dc_result[last_idx:i]
+                yield dc_result[last_idx:i + (1 if char not in (u'\n', u'\r') else 0)]
             last_idx = i + 1
 
-    # return IRIS manually. Do a simple query as long as we get one byte, stop the connection
-    # and return the url
-    iris_url = "http://service.iris.edu/fdsnws/station/1/query"
+    if routing_file:
+        return
+
+    # return IRIS manually, if it has data. Send a HEAD request (without downloading any data)
     # delete / modify eida routing service specific arguments
     del query_args['service']
     query_args['format'] = 'text'
     query_args['level'] = 'station'
-    query = get_query(iris_url, **query_args)
-    url_open = urllib2.urlopen(query)
-    try:
-        dc_result = url_open.read(1)
-        if dc_result:
-            yield iris_url
-    finally:
-        url_open.close()
+    query_args['nodata'] = 204  # no data: return 204 (no content) instead of 404 (error)
+    query = get_query(IRIS_STATION_URL, **query_args)
+    if _ROUTING_FETCHER.read(query, method='HEAD') == '200':
+        yield IRIS_STATION_URL
     # (fix bug in eida routing service when querying without network arguments):
 
 
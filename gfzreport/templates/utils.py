@@ -11,9 +11,17 @@ import os
 import sys
 import shutil
 import inspect
+import hashlib
 from glob import glob
 from contextlib import contextmanager
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from uuid import uuid4
 import errno
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # pylint: disable=invalid-name
 
 from io import BytesIO
 
@@ -36,7 +44,7 @@ def makedirs(path):
 
 def copyfiles(src, dst_dir, move=False):
     """Copies /move files recursively, extending shutil and allowing glob expressions
-    in src
+    in src. Returns the number of files copied / moved. See `stagefiles` for details
 
     :param src: a file/directory which MUST not be a system directory, denoting:
         * an existing file. In this case `shutil.copy2(src, dst)` will be called
@@ -48,35 +56,185 @@ def copyfiles(src, dst_dir, move=False):
     :param dst: a destination DIRECTORY. If it does not exists, it will be created
         (os.makedirs, basically alias of 'mkdir -p').
     """
-    files_count = 0
+    return stagefiles(src, dst_dir, move).files
 
-    if os.path.isdir(src):
-        for fle in os.listdir(src):  # FIXME: use shutil.cptree?
-            files_count += copyfiles(os.path.join(src, fle), dst_dir, move)
-        # since we moved all files, we remove the dir if it's empty:
-        if move and not os.listdir(src):
-            shutil.rmtree(src, ignore_errors=True)
 
-    elif os.path.isfile(src):
-        dst_dir_exists = os.path.isdir(dst_dir)
-        # copytree does not work if dest exists. So
-        # for file in os.listdir(src):
-        if not move:
-            if not dst_dir_exists:
-                # copy2 requires a dst folder to exist,
-                makedirs(dst_dir)
-            shutil.copy2(src, dst_dir)
-        else:
+class StageStats(object):
+    '''The statistics of staged (copied or moved) files, see `stagefiles`'''
+
+    METHODS = ('reflinked', 'linked', 'copied', 'moved', 'skipped')
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.methods = dict((m, 0) for m in self.METHODS)
+
+    def add(self, method, size):
+        '''Adds a staged file of the given size (in bytes) and staging method (one of
+        `self.METHODS`)'''
+        self.files += 1
+        self.bytes += size
+        self.methods[method] += 1
+
+    def __iadd__(self, other):
+        self.files += other.files
+        self.bytes += other.bytes
+        for method, count in other.methods.iteritems():
+            self.methods[method] += count
+        return self
+
+    def __str__(self):
+        size = float(self.bytes)
+        for unit in ('B', 'KB', 'MB', 'GB'):
+            if size < 1024 or unit == 'GB':
+                break
+            size /= 1024
+        methods = ", ".join("%d %s" % (self.methods[m], m) for m in self.METHODS
+                            if self.methods[m])
+        return "%d file(s), %s%s" % (self.files, ("%d %s" if unit == 'B' else "%.1f %s") %
+                                     (size, unit), " (%s)" % methods if methods else "")
+
+
+# Linux ioctl request number cloning a file (reflink) on copy-on-write filesystems:
+_FICLONE = 0x40049409
+
+
+def stagefiles(srcs, dst_dir, move=False, workers=8):
+    """Stages (copies or moves) files into the given directory and returns a `StageStats`.
+    Files are copied as in `copyfiles`, except that:
+        * a file already existing in `dst_dir` with the same size and content is skipped
+        * when source and destination are on the same filesystem, files are cloned
+          (reflink) if the filesystem supports it, or hard-linked otherwise. Note that hard
+          links share the file content with the source: staged files should not be modified
+          in place (which is the case for the data files of a report)
+        * otherwise, files are copied in parallel
+    In any case, destination files are written atomically (temporary file + rename).
+    Moving files is done as in `copyfiles`
+
+    :param srcs: a file, directory or glob expression (see `copyfiles`), or a list of them
+    :param dst_dir: the destination directory. If it does not exists, it will be created
+    :param move: whether to move files instead of copying them
+    :param workers: the maximum number of threads copying files
+    """
+    if isinstance(srcs, basestring):
+        srcs = [srcs]
+    files, dirs = [], []
+    for src in srcs:
+        _expand(src, files, dirs)
+    stats = StageStats()
+    if not files:
+        return stats
+    makedirs(dst_dir)
+
+    if move:
+        for src in files:
+            size = os.path.getsize(src)
             shutil.move(src, dst_dir)
+            stats.add('moved', size)
+        # since we moved all files, we remove the dirs if they are empty:
+        for src in dirs:
+            if not os.listdir(src):
+                shutil.rmtree(src, ignore_errors=True)
+        return stats
+
+    # map each destination file to its source (the last source wins, as when copying
+    # sequentially):
+    jobs = OrderedDict((os.path.join(dst_dir, os.path.basename(src)), src) for src in files)
+    workers = max(1, min(workers, len(jobs)))
+    if workers == 1:
+        results = [_stagefile(src, dst) for dst, src in jobs.iteritems()]
+    else:
+        pool = ThreadPool(workers)
+        try:
+            results = pool.map(lambda item: _stagefile(item[1], item[0]), jobs.iteritems())
+        finally:
+            pool.close()
+            pool.join()
+    for method, size in results:
+        stats.add(method, size)
+    return stats
 
-        files_count = 1
+
+def _expand(src, files, dirs):
+    """Appends to `files` all files denoted by `src` (file, directory or glob expression),
+    and to `dirs` all directories, in post order (i.e., sub-directories before their parent)
+    """
+    if os.path.isdir(src):
+        for fle in os.listdir(src):
+            _expand(os.path.join(src, fle), files, dirs)
+        dirs.append(src)
+    elif os.path.isfile(src):
+        files.append(src)
     else:
         # in principle, if src denotes a non-existing file or dir, glb_list is empty, if it
         # denotes an existing file or dir, it has a single element equal to src.
         for srcf in glob(src):  # glob returns joined pathname, it's not os.listdir!
-            files_count += copyfiles(srcf, dst_dir, move)
-
-    return files_count
+            _expand(srcf, files, dirs)
+
+
+def _stagefile(src, dst):
+    """Stages (links or copies) the file `src` into `dst`. Returns the tuple
+    (staging method, file size)"""
+    stat = os.stat(src)
+    if os.path.isfile(dst) and _samecontent(src, dst, stat.st_size):
+        return 'skipped', stat.st_size
+    dst_dir = os.path.dirname(dst)
+    tmp = os.path.join(dst_dir, ".%s.%s.tmp" % (os.path.basename(dst), uuid4().hex))
+    try:
+        if stat.st_dev == os.stat(dst_dir).st_dev and _reflink(src, tmp):
+            method = 'reflinked'
+        elif stat.st_dev == os.stat(dst_dir).st_dev and _hardlink(src, tmp):
+            method = 'linked'
+        else:
+            shutil.copy2(src, tmp)
+            method = 'copied'
+        os.rename(tmp, dst)
+    except:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+    return method, stat.st_size
+
+
+def _reflink(src, dst):
+    """Clones src into dst (copy-on-write). Returns False if not supported"""
+    if fcntl is None:
+        return False
+    try:
+        with open(src, 'rb') as srcf, open(dst, 'wb') as dstf:
+            fcntl.ioctl(dstf.fileno(), _FICLONE, srcf.fileno())
+    except (IOError, OSError):
+        if os.path.lexists(dst):
+            os.remove(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def _hardlink(src, dst):
+    """Hard links src into dst. Returns False if not supported"""
+    try:
+        os.link(os.path.realpath(src), dst)
+    except (OSError, AttributeError):  # AttributeError: os.link not available (Windows)
+        return False
+    return True
+
+
+def _samecontent(src, dst, size):
+    """Returns True if the two files have the same content"""
+    if os.path.samefile(src, dst):
+        return True
+    if os.path.getsize(dst) != size:
+        return False
+    return _md5(src) == _md5(dst)
+
+
+def _md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as opn:
+        for chunk in iter(lambda: opn.read(1024 * 1024), b''):
+            md5.update(chunk)
+    return md5.digest()
 
 
 def setupdir(src_path, dest_path, confirm, update_config_only):
@@ -308,8 +466,8 @@ class Templater(object):
                     makedirs(dest)
                     if not hasattr(files, "__iter__") or isinstance(files, (bytes, str)):
                         files = [files]
-                    for src in files:
-                        copyfiles(src, dest, self._mv_data_files)
+                    stats = stagefiles(files, dest, self._mv_data_files)
+                    print("  '%s': %s" % (os.path.relpath(dest, destpath), str(stats)))
                 print("Creating '%s' in '%s'" % (self.masterdoc, destpath))
                 self.render_rst(destpath, self.getrstkwargs(destpath, destdatapath, datafiles,
                                 *args, **kwargs) or {})
@@ -359,14 +517,13 @@ class Templater(object):
 
         Use `collections.OrderedDict` to preserve the order of the keys
 
-        For each item `destdir, files`, and for each `filepath` in `files`, the function
-        will call:
+        For each item `destdir, files`, the function will call:
 
-        :ref:`gfzreport.templates.utils.copyfiles(filepath, destdir, self._mv_data_files)`
+        :ref:`gfzreport.templates.utils.stagefiles(files, destdir, self._mv_data_files)`
 
-        Thus `filepath` can be a file (copy/move that file into `destdir`) a directory
-        (copy/move each file into `destdir`) or a glob expression (copy/move each matching
-        file into `destdir`)
+        Thus each `filepath` in `files` can be a file (copy/move that file into `destdir`) a
+        directory (copy/move each file into `destdir`) or a glob expression (copy/move each
+        matching file into `destdir`)
 
         :param destpath: the destination directory, as returned from `self.getdestpath`
         :param destdatapath: the destination directory for the data files, currently
@@ -61,8 +61,6 @@ def get_app(config_obj='gfzreport.web.config_example.BaseConfig', data_path=None
     for key, val in custom_config_settings.items():
         app.config[key] = val
 
-    app.config['REPORT_BASENAMES'] = {}  # will be populatedwhen querying pages
-
     app.config['DATA_PATH'] = data_path
     app.config['BUILD_PATH'] = os.path.abspath(os.path.join(app.config['DATA_PATH'], "build"))
     app.config['SOURCE_PATH'] = os.path.abspath(os.path.join(app.config['DATA_PATH'], "source"))
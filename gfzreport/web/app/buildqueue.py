@@ -0,0 +1,256 @@
+'''
+Asynchronous build queue for the web app.
+
+Building a report (sphinx + pdflatex) might take several seconds, and when done within the
+request it blocks a WSGI worker for the whole time. This module provides a `BuildQueue`
+which runs `core.build_report` in a pool of processes, returning immediately a job id which
+can be used to query the job status. Requests of a build for the same report and build type
+of a job still running are not queued again: the id of the running job is returned instead.
+
+The status of each job is also written to a json file in the report build directory (see
+`core.get_buildjobfile`): as WSGI servers might run several processes, each with its own
+queue, the status of a job submitted in another process is read from there
+
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import re
+import json
+import uuid
+import pickle
+import threading
+from collections import OrderedDict
+from multiprocessing import Process
+from multiprocessing.pool import Pool
+
+from gfzreport.web.app import core
+
+
+class _AppProxy(object):
+    '''Minimal picklable replacement of the flask app in the worker processes: the core
+    functions need the app `config` only'''
+
+    def __init__(self, config):
+        self.config = config
+
+
+class GitUser(object):
+    '''Minimal picklable replacement of the current user in the worker processes: the core
+    functions need the `asgitauthor` attribute only'''
+
+    def __init__(self, asgitauthor):
+        self.asgitauthor = asgitauthor
+
+
+class _WorkerProcess(Process):
+    '''A non-daemonic process: `multiprocessing.Pool` creates daemonic processes, which can not
+    have children, whereas builds might render images in parallel processes (see
+    `gfzreport.sphinxbuild.core.extensions.mapfigure.render_maps`)'''
+
+    @property
+    def daemon(self):
+        return False
+
+    @daemon.setter
+    def daemon(self, value):
+        pass
+
+
+class WorkerPool(Pool):
+    '''A `multiprocessing.Pool` of non-daemonic processes. Note that, as such, its processes
+    are not terminated when the parent process exits: call `terminate` explicitly (see
+    `BuildQueue.close`)'''
+    Process = _WorkerProcess
+
+
+# the app used in each worker process. Note that it is kept across builds, which allows
+# to re-use the sphinx applications stored in the config (see `core.sphinx_main`):
+_WORKER_APP = None
+
+
+def _init_worker(config):
+    global _WORKER_APP  # pylint: disable=global-statement
+    _WORKER_APP = _AppProxy(config)
+
+
+def _build(job_id, reportdirname, buildtype, gitauthor, force):
+    status = jobstatus(job_id, reportdirname, buildtype)
+    try:
+        status['exitcode'] = core.build_report(_WORKER_APP, reportdirname, buildtype,
+                                               GitUser(gitauthor) if gitauthor else None,
+                                               force=force)
+        status['status'] = 'done'
+        return status['exitcode']
+    except Exception as exc:
+        status['status'] = 'error'
+        status['message'] = str(exc)
+        raise
+    finally:
+        write_jobstatus(_WORKER_APP, status)
+
+
+def jobstatus(job_id, reportdirname, buildtype, status='running', exitcode=None, message=''):
+    '''Returns the status (dict) of a build job. See `BuildJob.status`'''
+    return {'job_id': job_id, 'reportdirname': reportdirname, 'buildtype': buildtype,
+            'status': status, 'exitcode': exitcode, 'message': message}
+
+
+def write_jobstatus(app, status):
+    '''Writes the given job status (dict) to its json file (see `core.get_buildjobfile`)'''
+    filepath = core.get_buildjobfile(app, status['reportdirname'], status['job_id'])
+    core._write_json(filepath, status)  # pylint: disable=protected-access
+
+
+def read_jobstatus(app, reportdirname, job_id):
+    '''Reads the status (dict) of the given job from its json file (see
+    `core.get_buildjobfile`). Raises KeyError if the file is not found'''
+    # job ids are hex strings (see `BuildQueue.submit`). Check it, as they are used in a path:
+    if not re.match(r'^[0-9a-f]+$', str(job_id)):
+        raise KeyError(job_id)
+    try:
+        with open(core.get_buildjobfile(app, reportdirname, job_id)) as opn:
+            return json.load(opn)
+    except (IOError, ValueError):  # file not found or corrupted
+        raise KeyError(job_id)
+
+
+def picklable_config(config):
+    '''Returns a dict from the given flask config with all picklable items of the latter'''
+    ret = {}
+    for key, val in config.items():
+        try:
+            pickle.dumps(val)
+        except Exception:  # @IgnorePep8 pylint: disable=broad-except
+            continue
+        ret[key] = val
+    return ret
+
+
+class BuildJob(object):
+    '''A build job. The `result` attribute is the `multiprocessing.pool.AsyncResult`
+    of the build'''
+
+    def __init__(self, job_id, reportdirname, buildtype, result):
+        self.id = job_id
+        self.reportdirname = reportdirname
+        self.buildtype = buildtype
+        self.result = result
+
+    def status(self):
+        '''Returns the job status as dict. The 'status' key is either 'running', 'done' or
+        'error'. In the latter case, the key 'message' holds the error message. When done,
+        'exitcode' is the build exit code (see `core.build_report`)'''
+        ret = jobstatus(self.id, self.reportdirname, self.buildtype)
+        if self.result.ready():
+            try:
+                ret['exitcode'] = self.result.get()
+                ret['status'] = 'done'
+            except Exception as exc:  # @IgnorePep8 pylint: disable=broad-except
+                ret['status'] = 'error'
+                ret['message'] = str(exc)
+        return ret
+
+
+class BuildQueue(object):
+    '''Runs report builds in a pool of processes, created lazily at the first submitted job'''
+
+    def __init__(self, config, processes, max_finished_jobs=100):
+        '''
+        :param config: the app config (dict). Only its picklable items will be forwarded to
+            the worker processes
+        :param processes: the number of processes of the pool
+        :param max_finished_jobs: the maximum number of finished jobs whose status can be
+            queried. Older finished jobs are discarded
+        '''
+        self._config = picklable_config(config)
+        self._app = _AppProxy(self._config)
+        self._processes = processes
+        self._max_finished_jobs = max_finished_jobs
+        self._pool = None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = WorkerPool(self._processes, initializer=_init_worker,
+                                    initargs=(self._config,))
+        return self._pool
+
+    def running_job(self, reportdirname, buildtype):
+        '''Returns the job (`BuildJob`) currently running for the given report and build type,
+        or None'''
+        with self._lock:
+            return self._running_job(reportdirname, buildtype)
+
+    def _running_job(self, reportdirname, buildtype):
+        for job in self._jobs.itervalues():
+            if job.reportdirname == reportdirname and job.buildtype == buildtype and \
+                    not job.result.ready():
+                return job
+        return None
+
+    def submit(self, reportdirname, buildtype, user, force=False):
+        '''Submits a new build job and returns it (`BuildJob`). If a job for the same
+        report and build type is still running, returns the latter'''
+        try:
+            gitauthor = user.asgitauthor if user else None
+        except AttributeError:  # e.g., flask-login AnonymousUserMixin
+            gitauthor = None
+        with self._lock:
+            job = self._running_job(reportdirname, buildtype)
+            if job is None:
+                job_id = uuid.uuid4().hex
+                # write the status before submitting, as the job might write it (when done)
+                # before this method returns:
+                write_jobstatus(self._app, jobstatus(job_id, reportdirname, buildtype))
+                result = self.pool.apply_async(_build, (job_id, reportdirname, buildtype,
+                                                        gitauthor, force))
+                job = BuildJob(job_id, reportdirname, buildtype, result)
+                self._jobs[job.id] = job
+                self._purge()
+            return job
+
+    def _purge(self):
+        finished = [jid for jid, job in self._jobs.iteritems() if job.result.ready()]
+        for jid in finished[:max(0, len(finished) - self._max_finished_jobs)]:
+            job = self._jobs.pop(jid)
+            try:
+                os.remove(core.get_buildjobfile(self._app, job.reportdirname, jid))
+            except OSError:
+                pass
+
+    def status(self, job_id, reportdirname):
+        '''Returns the status (dict) of the given job of the given report. If the job was not
+        submitted by this object (e.g., it was submitted in another server process), reads the
+        status from the job json file. Raises KeyError if the job is not found'''
+        with self._lock:
+            job = self._jobs.get(job_id, None)
+        if job is not None:
+            return job.status()
+        return read_jobstatus(self._app, reportdirname, job_id)
+
+    def close(self):
+        '''Terminates the pool processes (if any). Running jobs are lost'''
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+
+def get_build_queue(app):
+    '''Returns the `BuildQueue` of the given app, lazily created and stored in
+    app.config['BUILD_QUEUE'], or None if app.config['BUILD_QUEUE_SIZE'] (the number of
+    processes of the queue) is missing or not positive: in this case, reports should be built
+    synchronously'''
+    size = app.config.get('BUILD_QUEUE_SIZE', 0)
+    if not size or size <= 0:
+        return None
+    try:
+        return app.config['BUILD_QUEUE']
+    except KeyError:
+        queue = BuildQueue(app.config, size)
+        app.config['BUILD_QUEUE'] = queue
+        return queue
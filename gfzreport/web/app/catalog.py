@@ -0,0 +1,155 @@
+'''
+In-memory catalog of the reports of the web app.
+
+Listing the reports (index page) requires, for each report directory, to list its files and
+get their modification times, and to check whether the report is locked (not editable). On
+network filesystems and with hundreds of reports this takes seconds. A `ReportCatalog` keeps
+the metadata of each report in memory and refreshes them only when needed:
+
+- the reports root directory is re-listed only when its modification time changes (a report
+  directory or a lock file was added or removed, see `core.set_editable`),
+- a report directory is re-scanned only when its modification time changes (a file was added
+  or removed) or the report was explicitly invalidated (`invalidate`, see
+  `core.save_sourcefile`).
+
+Thus, when nothing changed, listing the reports costs one `os.stat` per report.
+Note that the modification of an existing file which is not issued by the app (e.g., edited
+from the terminal) does not change the directory modification time and might not be
+reflected in the reports order until the report is invalidated.
+
+The catalog also caches the master doc of each report (see `master_doc`) and the exit status
+of their last builds (see `build_status`). A `ReportCatalog` is thread safe. It is not
+picklable (each process has its own catalog)
+
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import threading
+
+from gfzreport.sphinxbuild import get_master_doc
+
+
+class Report(object):
+    '''The metadata of a report'''
+    __slots__ = ('name', 'editable', 'mtime', 'dirmtime')
+
+    def __init__(self, name, editable):
+        self.name = name
+        self.editable = editable
+        # the report modification time (None: no file found):
+        self.mtime = None
+        # the report directory modification time when mtime was computed (None: to be
+        # computed):
+        self.dirmtime = None
+
+
+class ReportCatalog(object):
+    '''An in-memory catalog of the reports found in a given directory'''
+
+    def __init__(self, rootpath):
+        '''
+        :param rootpath: the reports root directory (the web app source directory): any
+            sub-directory not starting with '_' is a report
+        '''
+        self.rootpath = rootpath
+        self._lock = threading.RLock()
+        self._rootmtime = None
+        self._reports = {}
+        self._master_docs = {}
+        self._builds = {}
+
+    def reports(self):
+        '''Returns all reports (see `Report`) containing at least one file, sorted from most
+        recent to oldest'''
+        with self._lock:
+            self._refresh()
+            return sorted((_ for _ in self._reports.itervalues() if _.mtime is not None),
+                          key=lambda report: report.mtime, reverse=True)
+
+    def _refresh(self):
+        try:
+            rootmtime = os.stat(self.rootpath).st_mtime
+        except OSError:  # root directory removed
+            rootmtime = None
+            self._reports = {}
+        if rootmtime is not None and rootmtime != self._rootmtime:
+            fnames = os.listdir(self.rootpath)
+            locked = set(_[:-len('.locked')] for _ in fnames if _.endswith('.locked'))
+            reports = {}
+            for fname in fnames:
+                report = self._reports.get(fname, None)
+                if report is None:
+                    if fname[0] == '_' or not os.path.isdir(self.path(fname)):
+                        continue
+                    report = Report(fname, True)
+                report.editable = fname not in locked
+                reports[fname] = report
+            self._reports = reports
+        self._rootmtime = rootmtime
+
+        for name, report in self._reports.items():
+            dirpath = self.path(name)
+            try:
+                dirmtime = os.stat(dirpath).st_mtime
+            except OSError:  # removed meanwhile
+                del self._reports[name]
+                continue
+            if dirmtime == report.dirmtime:
+                continue
+            mtime = None
+            for fle in (os.path.join(dirpath, _) for _ in os.listdir(dirpath)):
+                if os.path.isfile(fle):
+                    mtime_ = os.stat(fle).st_mtime
+                    if mtime is None or mtime_ < mtime:
+                        mtime = mtime_
+            report.mtime = mtime
+            report.dirmtime = dirmtime
+
+    def path(self, name):
+        '''Returns the directory path of the given report'''
+        return os.path.join(self.rootpath, name)
+
+    def invalidate(self, name=None):
+        '''Invalidates the given report, i.e. its metadata will be re-computed on the next
+        call to `reports`. If name is None, invalidates all reports and the reports list'''
+        with self._lock:
+            if name is None:
+                self._rootmtime = None
+                for report in self._reports.itervalues():
+                    report.dirmtime = None
+            elif name in self._reports:
+                self._reports[name].dirmtime = None
+
+    def master_doc(self, name):
+        '''Returns the master doc defined in the sphinx config of the given report'''
+        # Lazily parse the config (copying code from sphinx), which might be relatively
+        # expensive, and store the master_doc for any given report (in principle, all the same
+        # string 'report', but it needs not to)
+        with self._lock:
+            try:
+                return self._master_docs[name]
+            except KeyError:
+                mdoc = get_master_doc(os.path.join(self.path(name), "conf.py"))
+                self._master_docs[name] = mdoc
+                return mdoc
+
+    def build_status(self, name, buildtype, logmtime):
+        '''Returns the exit status of the last build of the given report and build type, or
+        None if not set or set with a different log file modification time (see
+        `set_build_status`)'''
+        with self._lock:
+            status = self._builds.get((name, buildtype), None)
+            if status is None or status[0] != logmtime:
+                return None
+            return status[1]
+
+    def set_build_status(self, name, buildtype, logmtime, exitstatus):
+        '''Sets the exit status of the last build of the given report and build type.
+        :param logmtime: the modification time of the build log file: as builds might be
+            run in other processes, the status is valid as long as the log file is not
+            modified
+        '''
+        with self._lock:
+            self._builds[(name, buildtype)] = (logmtime, exitstatus)
@@ -44,18 +44,25 @@ Note that each build directory is structured as follows:
 '''
 import os
 import sys
-import subprocess
 from subprocess import CalledProcessError
 import shutil
 from datetime import datetime, timedelta
 import json
 import re
-from cStringIO import StringIO
+import time
+import tempfile
+import threading
 from itertools import count
+from cStringIO import StringIO
 from werkzeug.utils import secure_filename
 
-from gfzreport.sphinxbuild import _run, get_master_doc, get_logfilename, log_err_regexp,\
-    exitstatus2str
+from gfzreport.sphinxbuild import _run, get_logfilename, exitstatus2str, \
+    get_logindexfilename, write_logindex
+from gfzreport.sphinxbuild.buildserver import BuildServer
+from gfzreport.sphinxbuild.timing import get_timingfilename
+from gfzreport.web.app.locks import FileLock
+from gfzreport.web.app.gitrepo import GitRepo, GitRepos
+from gfzreport.web.app.catalog import ReportCatalog
 
 
 def nocache(response):
@@ -79,6 +86,37 @@ def gitkwargs(app, reportdirname):
     return dict(cwd=get_sourcedir(app, reportdirname), shell=False)
 
 
+def gitrepo(app, reportdirname):
+    '''returns the `GitRepo` of the given report. GitRepo's are stored in
+    app.config['GIT_REPOS'] (lazily created) and re-used, so that their git processes serving
+    read operations (see `GitRepo.cat`) are kept alive across requests. At most
+    app.config['GIT_REPOS_MAXSIZE'] (default when missing: 20) GitRepo's are kept: the least
+    recently used ones are closed'''
+    try:
+        repos = app.config['GIT_REPOS']
+    except KeyError:
+        repos = app.config['GIT_REPOS'] = GitRepos(app.config.get('GIT_REPOS_MAXSIZE', 20))
+
+    def factory():
+        kwargs = gitkwargs(app, reportdirname)
+        return GitRepo(kwargs.pop('cwd'), **kwargs)
+
+    return repos.get(reportdirname, factory)
+
+
+# The replacements (in this order) performed by `js_escape`:
+_JS_ESCAPES = (('\\', '\\\\'), ('"', '\\"'), ('\n', '\\n'), ('\r', '\\r'))
+
+
+def js_escape(content):
+    """Escapes the given string so that it can be written inside a javascript double quoted
+    string literal: backslashes, double quotes, newlines and carriage returns are escaped.
+    Works on the whole string (no parsing) so it is fast also for big files"""
+    for old, new in _JS_ESCAPES:
+        content = content.replace(old, new)
+    return content
+
+
 def get_sourcefile_content(app, reportdirname, commit_hash='HEAD', as_js=True):
     """
         Reads the source rst from the sphinx source file. If the argument is True, returns
@@ -88,65 +126,39 @@ def get_sourcefile_content(app, reportdirname, commit_hash='HEAD', as_js=True):
     filename = get_sourcefile(app, reportdirname)
 
     if not commit_hash == 'HEAD':
-        kwargs = gitkwargs(app, reportdirname)
-        content = subprocess.check_output(['git', 'show',
-                                           '%s:%s' % (commit_hash,
-                                                      os.path.basename(filename))], **kwargs)
-        fpoint = StringIO(content)
-        fpoint.seek(0)
+        content = gitrepo(app, reportdirname).show(commit_hash, os.path.basename(filename))
     else:
-        fpoint = open(filename, "r")
+        with open(filename, "r") as fpoint:
+            content = fpoint.read()
 
     # json dump might do what we want, but it fails with e.g. "===" (rst headers, not javascript
     # equal sign. So this procedure might not be optimal but it works:
-    sio = StringIO()
+    if as_js:
+        content = js_escape(content)
+    return content.decode('utf8')
+
+
+def report_catalog(app):
+    '''returns the `ReportCatalog` of the app reports, stored in app.config['REPORT_CATALOG']
+    (lazily created)'''
     try:
-        if not as_js:
-            return fpoint.read().decode('utf8')
-        while True:
-            c = fpoint.read(1)
-            if not c:
-                break
-            elif c == '\n' or c == '\r':
-                sio.write("\\")
-                c = 'n' if c == '\n' else 'r'
-            elif c == '\\' or c == '"':
-                sio.write("\\")
-            sio.write(c)
-        return sio.getvalue().decode('utf8')
-    finally:
-        if hasattr(fpoint, 'close'):
-            fpoint.close()
+        return app.config['REPORT_CATALOG']
+    except KeyError:
+        catalog = app.config['REPORT_CATALOG'] = ReportCatalog(get_sourceroot(app))
+        return catalog
 
 
 def get_reports(app):
     '''returns all the report folders in `basedir`, sorted from most recent to
     oldest (i.e., sorted descending according to their
-    modification time: max modification time of all files in the directory)
+    modification time: max modification time of all files in the directory).
+    The reports metadata are cached (see `report_catalog`)
 
     :return: a list of tuples (report_directory_name, is_editable) where the first item is
     a string, the second one is a boolean telling if the report is editable
 
     '''
-    basedir = get_sourceroot(app)
-    ret = []
-    for subdir in os.listdir(basedir):
-        if subdir[0] == "_":
-            continue
-        dirpath = os.path.join(basedir, subdir)
-        if not os.path.isdir(dirpath):
-            continue
-        mtime = None
-        for fle in (os.path.join(dirpath, _) for _ in os.listdir(dirpath)):
-            if os.path.isfile(fle):
-                mtime_ = os.stat(fle).st_mtime
-                if mtime is None or mtime_ < mtime:
-                    mtime = mtime_
-        if mtime is None:
-            continue
-        ret.append([subdir, is_editable(app, subdir), mtime])
-    ret.sort(key=lambda obj: obj[-1], reverse=True)
-    return [_[:-1] for _ in ret]
+    return [[_.name, _.editable] for _ in report_catalog(app).reports()]
 
 
 def _get_locked_file(app, reportdirname):
@@ -165,11 +177,14 @@ def set_editable(app, reportdirname, value):
     locked_file = _get_locked_file(app, reportdirname)
     if value:
         os.remove(locked_file)
-        return not os.path.isfile(locked_file)
     else:
         with open(_get_locked_file(app, reportdirname), 'w') as _:
             pass
-        return os.path.isfile(locked_file)
+    # invalidate after the lock file change: the root modification time might not change with
+    # coarse mtime resolutions, and an earlier invalidation might let a concurrent listing
+    # cache the old editable flag:
+    report_catalog(app).invalidate()
+    return os.path.isfile(locked_file) is not value
 
 
 def get_sourceroot(app):
@@ -199,10 +214,24 @@ def get_buildfile(app, reportdirname, buildtype):
                         ('.tex' if buildtype == 'latex' else "." + buildtype))
 
 
+def get_lockfile(app, reportdirname, name):
+    '''returns the path of the lock file with the given name (e.g. 'git', 'html') used to
+    serialize operations on the given report. See `locks.FileLock`'''
+    return os.path.join(get_buildroot(app), reportdirname, '.gfzreport.%s.lock' % name)
+
+
 def get_logfile(app, reportdirname, buildtype):
     return os.path.join(get_builddir(app, reportdirname, buildtype), get_logfilename())
 
 
+def get_logindexfile(app, reportdirname, buildtype):
+    return os.path.join(get_builddir(app, reportdirname, buildtype), get_logindexfilename())
+
+
+def get_timingfile(app, reportdirname, buildtype):
+    return os.path.join(get_builddir(app, reportdirname, buildtype), get_timingfilename())
+
+
 def get_updloaddir(app, reportdirname, tmp=True, mkdir=True):
     basedir = os.path.join(get_buildroot(app), reportdirname) if tmp else \
         get_sourcedir(app, reportdirname)
@@ -226,9 +255,15 @@ def gitcommit(app, reportdirname, user=None):
     https://stackoverflow.com/questions/11579311/git-commit-as-different-user-without-email-or-only-email
     if None or evaluates to False, no author argument will be provided for the commit
     """
-    args = gitkwargs(app, reportdirname)
-    gitcwd = args.get("cwd", os.getcwd())  # that's used only for exc messages (see below)
+    # git operations on the same report must not run concurrently (e.g., two users saving or
+    # building at the same time):
+    with FileLock(get_lockfile(app, reportdirname, 'git')):
+        return _gitcommit(app, reportdirname, user)
+
 
+def _gitcommit(app, reportdirname, user=None):
+    """Issues a git commit. See `gitcommit`, which calls this function while holding a file
+    lock"""
     # user might be an AnonymousUserMixin user, i.e. what flask-login sets as default
     # In this case, it has no asgitauthor method
     try:
@@ -244,101 +279,101 @@ def gitcommit(app, reportdirname, user=None):
         # IMPORTANT: that git wants 'name <email>' format, 'name <>' seems to work
         gitauthor = "anonymous user <>"
 
-    gitinited = False
-    k = subprocess.call(['git', 'status'], **args)
-    if k == 128:
-        k = subprocess.call(['git', 'init', '.'], **args)
-        gitinited = True
-        if k == 0:  # FIXME: why do we do this?
-            k = subprocess.call(['git', 'status'], **args)
-
-    if k != 0:
-        raise ValueError("Unable to run git on the specified folder '%s'. "
-                         "Please contact the administrator" % gitcwd)
-
-    # check the output:
-    k = subprocess.check_output(['git', 'status'], **args)
-    if 'nothing to commit' in k or ' working directory clean' in k:
-        # we might have nothing to commit BUT outdated build dir
-        return False
-    else:
-        k = subprocess.call(['git', 'add', '-A', '.'], **args)
-        # the dot is to commit only the working tree. We are on the source root, is just for safety
-        if k == 0:
-            commit_msg = '"%scommit from webapp"' % ('git-init and ' if gitinited else '')
-            gitargs = ['git', 'commit']
-            if gitauthor:
-                gitargs.append("--author=\"%s\"" % gitauthor)
-            gitargs.extend(['-am', commit_msg])
-            k = subprocess.call(gitargs, **args)
-            if k != 0:
-                raise ValueError("Unable to run commit -am . on the specified folder '%s'. "
-                                 "Please contact the administrator" % gitcwd)
-        else:
-            raise ValueError("Unable to run git -A . on the specified folder '%s'. "
-                             "Please contact the administrator" % gitcwd)
-    return True
+    # we might have nothing to commit BUT outdated build dir (this is handled elsewhere)
+    return gitrepo(app, reportdirname).commit_all('commit from webapp', gitauthor)
+
+
+def githead(app, reportdirname):
+    """Returns the hash of the HEAD commit of the given report, or None if git failed"""
+    with FileLock(get_lockfile(app, reportdirname, 'git')):
+        return gitrepo(app, reportdirname).head()
 
 
 def build_report(app, reportdirname, buildtype, user, force=False):
     """Builds the given report according to the specified network. Returns
-    the tuple reportfile (string), hasChanged (boolean)"""
+    the tuple reportfile (string), hasChanged (boolean).
+    Builds of the same report and build directory are serialized via a file lock: a request
+    waiting for an ongoing build returns the exit status of the latter, if no commit was issued
+    in the meantime"""
     # we return reportfile, exit_status, has_changed
-    if not needs_build(app, reportdirname, buildtype, user):
-        if not force:
-            return -1
-
     sourcedir = get_sourcedir(app, reportdirname)
     builddir = get_builddir(app, reportdirname, buildtype)
-    # _run should never raise as a context manager catches exceptions printing to stderr,
-    # which is temporary set to a StringIO. The StringIO will be written to our out directory
-    # See get_logs
-    ret = _run(sourcedir, builddir, master_doc(app, reportdirname), buildtype, False, '-E')
-
-    # write to the last git commit the returned status. Note that in git we need to override
-    # completely the notes, so in order to override only relevant stuff, first read the notes,
-    # if any:
-    args = gitkwargs(app, reportdirname)
-    notes = subprocess.check_output(["git", "log", "-1", "--pretty=format:%N"], **args).strip()
-    # IMPORTANT: do NOT quote pretty format values (e.g.: "--pretty=format:%N", AVOID
-    # "--pretty=format:'%N'"), otherwise the quotes
-    # will appear in the output (if value has spaces, we did not test it,
-    # so better avoid it)
-    if notes:
-        notes_dict = json.loads(notes)
-    else:
-        notes_dict = {}
-    if 'Report generation' not in notes_dict:
-        notes_dict['Report generation'] = {}
-    notes_dict['Report generation'][buildtype] = exitstatus2str(ret)
 
-    # write back to the notes, overriding it:
-    subprocess.call(['git', 'notes', 'add', 'HEAD', '--force', '-m',
-                     json.dumps(notes_dict)], **args)
-    # git notes add HEAD --force -m "-Build report exit code: 1 (Successfull with  warnings/errors)"
+    # builds writing in the same build directory must not run concurrently. Note that the lock
+    # is per build directory and not per buildtype, as 'pdf' and 'latex' share the same
+    # directory:
+    with FileLock(get_lockfile(app, reportdirname, os.path.basename(builddir))) as lock:
+        if not force:
+            last = lock.read() if lock.waited else None
+            if last and last['buildtype'] == buildtype and last['time'] >= lock.waitstart \
+                    and last['commit'] is not None and last['commit'] == githead(app,
+                                                                                 reportdirname):
+                # an identical build finished while we were waiting for the lock, and no
+                # commit was issued meanwhile (e.g. no one saved the report): return its exit
+                # status. Note that we do not check uncommitted changes as builds might write
+                # in the source directory (e.g., the doi citations cache)
+                return last['exitcode']
+        # always call needs_build, as it commits pending changes, if any: forced builds, too,
+        # must build (and write their notes to) the committed content
+        if not needs_build(app, reportdirname, buildtype, user) and not force:
+            return -1
+
+        # _run should never raise as a context manager catches exceptions printing to stderr,
+        # which is temporary set to a StringIO. The StringIO will be written to our out
+        # directory. See get_logs.
+        # Note that we do not pass '-E' (fresh environment): sphinx re-reads only the documents
+        # whose content (or the content of any file they depend on) changed. See
+        # gfzreport.sphinxbuild.core.extensions.setup.env_get_outdated
+        commit = githead(app, reportdirname)
+        ret = _run(sourcedir, builddir, master_doc(app, reportdirname), buildtype, False,
+                   sphinx_main=sphinx_main(app),
+                   pdflatex_max_passes=app.config.get('PDFLATEX_MAX_PASSES', None))
+        # store the result for the requests waiting for this build:
+        lock.write({'buildtype': buildtype, 'exitcode': ret, 'time': time.time(),
+                    'commit': commit})
+
+        # write to the last git commit the returned status. Note that in git we need to override
+        # completely the notes, so in order to override only relevant stuff, first read the
+        # notes, if any:
+        with FileLock(get_lockfile(app, reportdirname, 'git')):
+            repo = gitrepo(app, reportdirname)
+            notes = repo.note('HEAD').strip()
+            if notes:
+                notes_dict = json.loads(notes)
+            else:
+                notes_dict = {}
+            if 'Report generation' not in notes_dict:
+                notes_dict['Report generation'] = {}
+            notes_dict['Report generation'][buildtype] = exitstatus2str(ret)
+
+            # write back to the notes, overriding it:
+            repo.set_note(json.dumps(notes_dict), 'HEAD')
+            # git notes add HEAD --force -m "-Build report exit code: 1 (Successfull with
+            # warnings/errors)"
 
     return ret
 
 
-def master_doc(app, reportdirname):
-    '''returns the master doc defined in the sphinx config, which acts as basename
-    (without extension) for all source and dest files'''
-    # Lazily create the variable if not stored. Remember that the variable is obtained
-    # by parsing conf.py (copying code from sphinx) and might be relatively expensive.
-    # Store the master_doc in a dict so to have the correct master_cod for any given reportdirname
-    # and avoid conflicts (in principle. all the same string 'report', but it needs not to)
+def sphinx_main(app):
+    '''returns the function used to run sphinx, or None (use the default `sphinx.build_main`).
+    If app.config['WARM_SPHINX_APPS'] is True (the default when missing), returns the `main`
+    method of a `BuildServer` stored in app.config['BUILD_SERVER'] (lazily created), which
+    keeps a sphinx application in memory for each report and build type, and re-uses it
+    in subsequent builds'''
+    if not app.config.get('WARM_SPHINX_APPS', True):
+        return None
     try:
-        dic = app.config['REPORT_BASENAMES']
+        server = app.config['BUILD_SERVER']
     except KeyError:
-        dic = {}
-        app.config['REPORT_BASENAMES'] = dic
+        server = BuildServer()
+        app.config['BUILD_SERVER'] = server
+    return server.main
 
-    try:
-        return dic[reportdirname]
-    except KeyError:
-        mdoc = get_master_doc(os.path.join(get_sourcedir(app, reportdirname), "conf.py"))
-        dic[reportdirname] = mdoc
-        return mdoc
+
+def master_doc(app, reportdirname):
+    '''returns the master doc defined in the sphinx config, which acts as basename
+    (without extension) for all source and dest files'''
+    return report_catalog(app).master_doc(reportdirname)
 
 
 def needs_build(app, reportdirname, buildtype, user, commit_if_needed=False):
@@ -346,7 +381,7 @@ def needs_build(app, reportdirname, buildtype, user, commit_if_needed=False):
         Returns True if the git repo has uncommitted changes or the source rst file last
         modification time (LMT) is greater or equal than the destination file LMT
         (see `is_build_updated`).
-        Calls `git` (via the `subprocess` module)
+        Calls `git` (see `gitrepo`)
         :param reportdirname: the report dirrecotory name. Its full path will be retrieved
         via app config settings
         :param user: The User currently authenticated. It is up to the view restrict the access
@@ -393,56 +428,162 @@ def save_sourcefile(app, reportdirname, unicode_text, user):
             filedest = os.path.join(destdir, fle)
             shutil.copy2(filesrc, filedest)
         shutil.rmtree(srcdir)
+    report_catalog(app).invalidate(reportdirname)
     # return True if commits where saved, False if 'nothing to commit'
     needsRefresh = gitcommit(app, reportdirname, user)
     return {'needs_refresh': needsRefresh,
-            'commit_hash': get_commits(app, reportdirname, -1)[0]['hash']}
+            'commit_hash': gitrepo(app, reportdirname).head()}
+
+
+# The fields of each commit stored in the commits index (see `get_commit_index`):
+_COMMIT_FIELDS = ('hash', 'author', 'date', 'email', 'msg')
+
+# guards app.config['COMMIT_INDEXES'], shared by the request threads (see `get_commit_index`):
+_COMMIT_INDEXES_LOCK = threading.Lock()
+
+
+def get_commitindexfile(app, reportdirname):
+    '''returns the path of the json file storing the commits index of the given report (see
+    `get_commit_index`)'''
+    return os.path.join(get_buildroot(app), reportdirname, '.gfzreport.commits.json')
+
 
+def get_buildjobfile(app, reportdirname, job_id):
+    '''returns the path of the json file storing the status of the given build job of the
+    given report (see `buildqueue.BuildQueue`)'''
+    return os.path.join(get_buildroot(app), reportdirname, '.gfzreport.buildjob.%s.json' % job_id)
 
-def get_commits(app, reportdirname, revision_range=None):
-    ''':param revision_range: None => include all commits. Otherwise works like git 'revison_range'
-        (e.g.: -1 for the last one only)
+
+def _gitlog(repo, revision_range):
+    '''returns the commits in the given revision range as list of lists (one per commit,
+    newest first) with the values of `_COMMIT_FIELDS` plus the space separated parents hashes
+    as last element'''
+    # get a separator which is most likely not present in each key:
+    # please no spaces in sep!
+    # Note according to git log, we could provide also %n for newlines in the command
+    # maybe implement later ...
+    sep = "_;<!>;_"
+    pretty_format_arg = "%H{0}%an{0}%ad{0}%ae{0}%s{0}%P".format(sep)
+    # IMPORTANT: do NOT quote pretty format values (e.g.: "--pretty=format:%N", NOT
+    # "--pretty=format:'%N'"), otherwise the quotes
+    # will appear in the output (if value has spaces, we did not test it,
+    # so better avoid it)
+    cmts = repo.output("log", "--pretty=format:%s" % (pretty_format_arg), revision_range)
+    return [[_.rstrip() for _ in commit.split(sep)] for commit in cmts.split("\n") if commit]
+
+
+def get_commit_index(app, reportdirname):
+    '''returns the commits index of the given report, i.e. the list of all commits (newest
+    first) as lists of `_COMMIT_FIELDS` values. The index is keyed on the HEAD commit and
+    stored in memory (app.config['COMMIT_INDEXES']) and in a json file (see
+    `get_commitindexfile`): when HEAD changes, only the new commits are read from git log.
+    Commit notes are not part of the index as they change after the commit is issued (see
+    `build_report`)
+    :raise: OSError or CalledProcessError if git fails
+    '''
+    repo = gitrepo(app, reportdirname)
+    head = repo.head()
+    if head is None:
+        return []
+    with _COMMIT_INDEXES_LOCK:
+        index = app.config.setdefault('COMMIT_INDEXES', {}).get(reportdirname, None)
+    if index is None or index['head'] != head:
+        # (git is called outside the lock: concurrent updates of the same index are harmless,
+        # as they compute the same index)
+        filepath = get_commitindexfile(app, reportdirname)
+        try:
+            with open(filepath) as opn:
+                index = json.load(opn)
+        except (IOError, ValueError):  # file not found or corrupted
+            index = None
+        if index is None or index.get('head', None) != head:
+            index = _update_commit_index(repo, head, index)
+            _write_json(filepath, index)
+        with _COMMIT_INDEXES_LOCK:
+            app.config.setdefault('COMMIT_INDEXES', {})[reportdirname] = index
+    return index['commits']
+
+
+def _update_commit_index(repo, head, index):
+    '''returns a new commits index with the commits from index['head'] (excluded) to head
+    prepended to the index commits. If index is None or is not an ancestor of head (e.g., the
+    history was rewritten), returns a new index built from all commits'''
+    if index and index.get('head', None) and index.get('commits', None):
+        try:
+            new = _gitlog(repo, "%s..%s" % (index['head'], head))
+            # webapp commits are linear: the oldest new commit must be a child of index head:
+            if new and index['head'] in new[-1][-1].split():
+                return {'head': head, 'commits': [_[:-1] for _ in new] + index['commits']}
+        except CalledProcessError:  # index head not found
+            pass
+    return {'head': head, 'commits': [_[:-1] for _ in _gitlog(repo, head)]}
+
+
+def _write_json(filepath, obj):
+    '''writes obj as json to the given file path. The file is written to a temporary file
+    first and then renamed (atomic), so that concurrent readers never see partially written
+    files'''
+    dirpath = os.path.dirname(filepath)
+    if not os.path.isdir(dirpath):
+        os.makedirs(dirpath)
+    fdesc, tmppath = tempfile.mkstemp(suffix='.tmp', dir=dirpath)
+    try:
+        with os.fdopen(fdesc, 'w') as opn:
+            json.dump(obj, opn)
+        os.rename(tmppath, filepath)
+    except:  # @IgnorePep8 pylint: disable=bare-except
+        os.remove(tmppath)
+        raise
+
+
+def get_commits(app, reportdirname, offset=0, limit=None, since=None, notes=True):
+    '''returns the commits of the given report (newest first) as list of dicts with keys
+    'hash', 'author', 'date', 'email', 'msg' and 'notes'. See `get_commit_index`
+    :param offset: the index of the first commit to return (0: the newest)
+    :param limit: the maximum number of commits to return. None (the default): no limit
+    :param since: a commit hash, or None. If given, only the commits newer than it are
+        taken into account (offset and limit are then applied). If the commit is not found
+        (e.g., the history was rewritten), returns an empty list
+    :param notes: whether to return the commits notes (True by default). Notes are read for
+        the returned commits only. If False, the 'notes' key is missing
     '''
     def prettify(jsonstr):
         if not jsonstr:
             return jsonstr
         return json.dumps(json.loads(jsonstr), indent=4).replace('"', "").replace("{", "").replace("}", "")
     try:
-        commits = []
-        kwargs = gitkwargs(app, reportdirname)
-
-        # get a separator which is most likely not present in each key:
-        # please no spaces in sep!
-        # Note according to git log, we could provide also %n for newlines in the command
-        # maybe implement later ...
-        sep = "_;<!>;_"
-        pretty_format_arg = "%H{0}%an{0}%ad{0}%ae{0}%s{0}%N".format(sep)
-        args = ["git", "log", "--pretty=format:%s" % (pretty_format_arg)]
-        if revision_range:
-            args.append(str(revision_range))
-        cmts = subprocess.check_output(args, **kwargs)
-        # IMPORTANT: do NOT quote pretty format values (e.g.: "--pretty=format:%N", NOT
-        # "--pretty=format:'%N'"), otherwise the quotes
-        # will appear in the output (if value has spaces, we did not test it,
-        # so better avoid it)
-
-        for commit in cmts.split("\n"):
-            if commit:
-                clist = [_.rstrip() for _ in commit.split(sep)]
+        commits = get_commit_index(app, reportdirname)
+        if since:
+            try:
+                commits = commits[:[_[0] for _ in commits].index(since)]
+            except ValueError:  # since not found
+                return []
+        commits = commits[offset:] if limit is None else commits[offset:offset + limit]
+        repo = gitrepo(app, reportdirname)
+        ret = []
+        for clist in commits:
+            commit = dict(zip(_COMMIT_FIELDS, clist))
+            if notes:
                 # parse notes by removing curly brackets and quotes (")
-                clist[-1] = prettify(clist[-1]).rstrip()
-                commits.append({'hash': clist[0], 'author': clist[1], 'date': clist[2],
-                                'email': clist[3], 'msg': clist[4], 'notes': clist[-1]})
-        return commits
+                commit['notes'] = prettify(repo.note(clist[0]).rstrip()).rstrip()
+            ret.append(commit)
+        return ret
     except (OSError, CalledProcessError):
         return []
 
 
+def count_commits(app, reportdirname):
+    '''returns the number of commits of the given report (0 if git fails)'''
+    try:
+        return len(get_commit_index(app, reportdirname))
+    except (OSError, CalledProcessError):
+        return 0
+
+
 def get_git_diff(app, reportdirname, hash1, hash2):
     '''returns the git diff between hash1 and hash2'''
     masterdoc = os.path.basename(get_sourcefile(app, reportdirname))
-    args = gitkwargs(app, reportdirname)
-    cmts = subprocess.check_output(["git", "diff", str(hash1), str(hash2), masterdoc], **args)
+    cmts = gitrepo(app, reportdirname).output("diff", str(hash1), str(hash2), masterdoc)
     reg = re.compile("^\\@\\@\\s+.+\\s+\\@\\@\\s*$", re.MULTILINE)
     val = reg.split(cmts)[1:]
     return [_.strip("\r\n") for _ in val]
@@ -525,37 +666,100 @@ def get_logs_(app, reportdirname, buildtype):
     the second, with the only the errors (if any)
     Returns two empty strings if file not found
     """
-    FILENOTFOUND = 'Log file not found'
-    logfilecontent = [FILENOTFOUND]
-    logfileerrors = [FILENOTFOUND]
-    logerrreg = log_err_regexp()
-    logfileiter = _logiter(app, reportdirname, buildtype)
-    exit_status = next(logfileiter)
+    return get_log_content(app, reportdirname, buildtype)[0], \
+        get_log_errors(app, reportdirname, buildtype)
+
+
+def get_logindex(app, reportdirname, buildtype):
+    """Returns the index of the log file (see `gfzreport.sphinxbuild.logindex`), or None if
+    the log file is not found. The index is written at build time: if missing or outdated
+    (e.g., log written by an older version of the program), it is re-computed and written"""
+    logfile = get_logfile(app, reportdirname, buildtype)
+    try:
+        stat = os.stat(logfile)
+    except OSError:  # file not found
+        return None
+    try:
+        with open(get_logindexfile(app, reportdirname, buildtype)) as opn:
+            index = json.load(opn)
+        if index['mtime'] == stat.st_mtime and index['size'] == stat.st_size:
+            return index
+    except (IOError, ValueError, KeyError):  # index not found or corrupted
+        pass
+    return write_logindex(logfile)
+
+
+def get_log_errors(app, reportdirname, buildtype):
+    """Returns a utf8 text with the log sections titles and the errors found in each of them
+    (if any). The log file is not parsed: error lines are read via the log index (see
+    `get_logindex`)"""
+    index = get_logindex(app, reportdirname, buildtype)
+    if index is None:
+        return u'Log file not found'
     NOERRFOUND = '   No compilation error found'
-    if exit_status == 2:
+    if lastbuildexitcode(app, reportdirname, buildtype) == 2:
         NOERRFOUND += " (critical errors or exceptions are reported in the full log)"
-    firstline = True
-    for line in logfileiter:
-        if firstline:  # file found, remove first line
-            del logfileerrors[-1]
-            del logfilecontent[-1]
-            firstline = False
-        logfilecontent.append(line)
-        if line.startswith("*** Sphinx ") or line.startswith("*** Pdflatex "):
-            logfileerrors.append(line)
-            logfileerrors.append(NOERRFOUND)
-        elif logerrreg.match(line):
-            if logfileerrors[-1] == NOERRFOUND:
-                del logfileerrors[-1]
-            # if it's the first error, remove the last line 'No error found'
-            logfileerrors.append(line)
+    lines = [(offset, line) for offset, line in index['sections']] + \
+        [(offset, None) for offset in index['errors']]
+    logfileerrors = []
+    with open(get_logfile(app, reportdirname, buildtype)) as fopen:
+        for offset, line in sorted(lines):
+            if line is not None:  # section title
+                # the title is unicode (loaded from json): keep all lines as bytes, as they
+                # are read from the log file (see below), and decode them only once at the end:
+                logfileerrors.append(line.encode('utf8'))
+                logfileerrors.append(NOERRFOUND)
+            else:
+                fopen.seek(offset)
+                if logfileerrors and logfileerrors[-1] == NOERRFOUND:
+                    del logfileerrors[-1]
+                # if it's the first error, remove the last line 'No error found'
+                logfileerrors.append(fopen.readline().strip())
     # we should dig into python2 to understand why the line below gives us
     # unicode / decode erros, although logfilecontent are always strings.
     # Probably it's due to how we write/read it from/to file.
     # Setting 'errors=ignore' solves the problem with drawbacks negligible since
     # it's a log file and the relevant log messages should be correctly decoded
-    return "\n".join(logfilecontent).decode('utf8', errors='replace'), \
-        "\n".join(logfileerrors).decode('utf8', errors='replace')
+    return "\n".join(logfileerrors).decode('utf8', errors='replace')
+
+
+def get_log_content(app, reportdirname, buildtype, offset=0, limit=None):
+    """Returns the tuple (content, next_offset, size) where content is the utf8 text of the
+    log file starting at the given offset (in bytes), next_offset is the offset of the
+    remaining content (None if the end of file was reached) and size is the log size, in
+    bytes. Lines are stripped.
+    :param limit: the maximum number of bytes to read, or None (read until the end). The
+        content is extended to the end of the last line read, so the returned content
+        might exceed it
+    """
+    logfile = get_logfile(app, reportdirname, buildtype)
+    if not os.path.isfile(logfile):
+        return u'Log file not found', None, 0
+    with open(logfile) as fopen:
+        fopen.seek(0, os.SEEK_END)
+        size = fopen.tell()
+        fopen.seek(offset)
+        if limit is None:
+            data = fopen.read()
+        else:
+            data = fopen.read(limit)
+            if data and data[-1] != '\n':
+                data += fopen.readline()
+    next_offset = offset + len(data)
+    content = "\n".join(line.strip() for line in StringIO(data))
+    # see note in get_log_errors about errors='replace':
+    return content.decode('utf8', errors='replace'), \
+        (next_offset if next_offset < size else None), size
+
+
+def get_timing(app, reportdirname, buildtype):
+    """Returns the timing of the last build (dict, see `gfzreport.sphinxbuild.timing`), or
+    an empty dict if no timing file was found"""
+    timingfile = get_timingfile(app, reportdirname, buildtype)
+    if not os.path.isfile(timingfile):
+        return {}
+    with open(timingfile) as opn:
+        return json.load(opn)
 
 
 def lastbuildexitcode(app, reportdirname, buildtype):
@@ -564,10 +768,21 @@ def lastbuildexitcode(app, reportdirname, buildtype):
     :return: the exit code, -1 (unkwnown), 0 (ok, no errors), 1 (ok, compilation errors), 2 faile
     (no file created)
     """
-    # try to make a regexp which is general and accounts for potential changes in the
-    # output string msg:
-    for line in _logiter(app, reportdirname, buildtype):
-        return line  # first element is the exit status
+    # The status is cached until the log file changes (see `report_catalog`)
+    try:
+        logmtime = os.stat(get_logfile(app, reportdirname, buildtype)).st_mtime
+    except OSError:  # file not found
+        return -1
+    catalog = report_catalog(app)
+    ret = catalog.build_status(reportdirname, buildtype, logmtime)
+    if ret is None:
+        # try to make a regexp which is general and accounts for potential changes in the
+        # output string msg:
+        for line in _logiter(app, reportdirname, buildtype):
+            ret = line  # first element is the exit status
+            break
+        catalog.set_build_status(reportdirname, buildtype, logmtime, ret)
+    return ret
 
 
 def _logiter(app, reportdirname, buildtype):
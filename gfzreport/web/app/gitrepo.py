@@ -0,0 +1,218 @@
+'''
+Access to the git repository of a report.
+
+Each git command spawns a new process which reads the repository index, refs and so on. Most
+of the git operations of the web app are reads (the HEAD commit, its notes, the source file
+at a given commit) which can be served by a single long-lived `git cat-file --batch` process
+per repository: a `GitRepo` starts such a process lazily and keeps it running, sending it
+object names (e.g. 'HEAD', 'refs/notes/commits:<hash>', '<hash>:report.rst') and reading back
+the objects content. The remaining operations (status, commit, notes writing, log, diff) are
+run as git commands, as few as possible.
+
+A `GitRepo` is thread safe. It is not picklable (and it should not be: a process must not
+share the `git cat-file` process of another one). `GitRepos` is a bounded cache of `GitRepo`s
+which closes the least recently used ones, so that the number of `git cat-file` processes
+kept alive does not grow with the number of repositories accessed
+
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from subprocess import CalledProcessError
+
+
+class GitRepo(object):
+    '''A git repository'''
+
+    notes_ref = 'refs/notes/commits'
+
+    def __init__(self, path, **kwargs):
+        '''
+        :param path: the repository working directory
+        :param kwargs: additional keyword arguments passed to all `subprocess` functions
+            invoking git
+        '''
+        self.path = path
+        self.kwargs = dict(kwargs, cwd=path)
+        self._lock = threading.Lock()
+        self._catfile = None
+
+    def output(self, *args):
+        '''Runs git with the given arguments and returns its output. Raises CalledProcessError
+        if git exits with non-zero status'''
+        return subprocess.check_output(['git'] + list(args), **self.kwargs)
+
+    def call(self, *args):
+        '''Runs git with the given arguments and returns its exit status'''
+        return subprocess.call(['git'] + list(args), **self.kwargs)
+
+    def status(self):
+        '''Returns the output of `git status --porcelain` (empty string: nothing to commit),
+        or None if the path is not a git repository
+        :raise: ValueError if git fails
+        '''
+        try:
+            with open(os.devnull, 'w') as devnull:
+                return subprocess.check_output(['git', 'status', '--porcelain'], stderr=devnull,
+                                               **self.kwargs)
+        except CalledProcessError as cpe:
+            if cpe.returncode == 128:
+                return None
+            raise ValueError("Unable to run git on the specified folder '%s'. "
+                             "Please contact the administrator" % self.path)
+
+    def commit_all(self, message, author=None):
+        '''Adds all files (including untracked ones) and commits them. Returns True if a
+        commit was issued, False if there was nothing to commit. Initializes the repository
+        if needed (in this case 'git-init and ' is prepended to message)
+        :raise: ValueError if git fails
+        '''
+        status = self.status()
+        if status is None:
+            if self.call('init', '.') != 0 or self.status() is None:
+                raise ValueError("Unable to run git on the specified folder '%s'. "
+                                 "Please contact the administrator" % self.path)
+            message = 'git-init and ' + message
+        elif not status:
+            return False
+        # the dot is to commit only the working tree. We are on the source root, is just for
+        # safety
+        if self.call('add', '-A', '.') != 0:
+            raise ValueError("Unable to run git -A . on the specified folder '%s'. "
+                             "Please contact the administrator" % self.path)
+        args = ['commit']
+        if author:
+            args.append("--author=\"%s\"" % author)
+        args.extend(['-am', '"%s"' % message])
+        if self.call(*args) != 0:
+            raise ValueError("Unable to run commit -am . on the specified folder '%s'. "
+                             "Please contact the administrator" % self.path)
+        return True
+
+    def cat(self, name):
+        '''Returns the tuple (hash, type, content) of the git object with the given name (e.g.
+        'HEAD', '<commit>:<path>'), or None if the object does not exist (or the path is not a
+        git repository)'''
+        if not name or '\n' in name:
+            return None
+        with self._lock:
+            for attempt in (0, 1):
+                try:
+                    return self._cat(name)
+                except (IOError, OSError, ValueError):
+                    # process died (e.g. started before the repository was created): restart
+                    # it once
+                    self._close()
+                    if attempt:
+                        return None
+
+    def _cat(self, name):
+        if self._catfile is None or self._catfile.poll() is not None:
+            with open(os.devnull, 'w') as devnull:
+                self._catfile = subprocess.Popen(['git', 'cat-file', '--batch'],
+                                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                                 stderr=devnull, **self.kwargs)
+        self._catfile.stdin.write(name + '\n')
+        self._catfile.stdin.flush()
+        header = self._catfile.stdout.readline()
+        if not header:
+            raise IOError('git cat-file exited')
+        fields = header.split()
+        if len(fields) != 3:  # '<name> missing' or '<name> ambiguous'
+            return None
+        content = self._catfile.stdout.read(int(fields[2]) + 1)[:-1]  # strip trailing newline
+        return fields[0], fields[1], content
+
+    def head(self):
+        '''Returns the hash of the HEAD commit, or None'''
+        obj = self.cat('HEAD')
+        return None if obj is None else obj[0]
+
+    def show(self, commit, path):
+        '''Returns the content of the file at the given path (relative to the repository root)
+        at the given commit
+        :raise: ValueError if the file or the commit are not found
+        '''
+        obj = self.cat('%s:%s' % (commit, path))
+        if obj is None or obj[1] != 'blob':
+            raise ValueError("'%s' not found in commit '%s'" % (path, commit))
+        return obj[2]
+
+    def note(self, commit='HEAD'):
+        '''Returns the note of the given commit (empty string if the commit has no note)'''
+        obj = self.cat(commit)
+        if obj is None:
+            return ''
+        sha = obj[0]
+        # notes are stored in the notes tree under the commit hash, possibly split in
+        # sub-directories when there are many notes:
+        for path in (sha, sha[:2] + '/' + sha[2:], sha[:2] + '/' + sha[2:4] + '/' + sha[4:]):
+            obj = self.cat('%s:%s' % (self.notes_ref, path))
+            if obj is not None:
+                return obj[2]
+        return ''
+
+    def set_note(self, note, commit='HEAD'):
+        '''Sets (overrides) the note of the given commit. Returns the git exit status'''
+        return self.call('notes', 'add', commit, '--force', '-m', note)
+
+    def _close(self):
+        if self._catfile is not None:
+            try:
+                self._catfile.stdin.close()
+                self._catfile.wait()
+            except (IOError, OSError):
+                pass
+            self._catfile = None
+
+    def close(self):
+        '''Terminates the `git cat-file` process, if running. The process is restarted if
+        needed'''
+        with self._lock:
+            self._close()
+
+
+class GitRepos(object):
+    '''A thread safe Least Recently Used (LRU) cache of `GitRepo`s, keyed by name'''
+
+    def __init__(self, maxsize):
+        '''
+        :param maxsize: the maximum number of `GitRepo`s. When exceeded, the least recently
+            used `GitRepo` is removed and closed
+        '''
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._repos = OrderedDict()
+
+    def get(self, name, factory):
+        '''Returns the `GitRepo` with the given name, creating it via `factory()` if not
+        found'''
+        with self._lock:
+            repo = self._repos.pop(name, None)
+            if repo is None:
+                repo = factory()
+            self._repos[name] = repo  # (re)insert as most recently used
+            evicted = []
+            while len(self._repos) > max(1, self.maxsize):
+                evicted.append(self._repos.popitem(last=False)[1])
+        # close outside our lock (closing waits for the repo lock). Note that an evicted repo
+        # still in use elsewhere restarts its process if needed, which terminates when the
+        # repo is garbage collected (the process stdin gets closed):
+        for evicted_repo in evicted:
+            evicted_repo.close()
+        return repo
+
+    def __len__(self):
+        return len(self._repos)
+
+    def close(self):
+        '''Closes and removes all `GitRepo`s'''
+        with self._lock:
+            repos = self._repos.values()
+            self._repos.clear()
+        for repo in repos:
+            repo.close()
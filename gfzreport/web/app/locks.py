@@ -0,0 +1,77 @@
+'''
+File locks (multi-process and multi-thread safe) used to serialize operations on the same
+report, e.g. builds and git commits
+
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import errno
+import fcntl
+import json
+import time
+
+
+class FileLock(object):
+    '''Exclusive lock on a given file, to be used in a with statement:
+    ```
+        with FileLock(path) as lock:
+            ... code here ...
+    ```
+    The lock is acquired when entering the with statement, blocking if another process (or
+    thread) holds it, and released when exiting it. After entering, `lock.waited` tells if
+    the lock was held by someone else and we had to wait for it.
+    The lock file can also store a small json-serializable object (see `read` and `write`)
+    useful e.g. to communicate the result of the locked operation to the processes which were
+    waiting for it
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.waited = False
+        self.waitstart = None
+        self._fd = None
+
+    def __enter__(self):
+        dirname = os.path.dirname(self.path)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:  # race condition: created meanwhile?
+                if not os.path.isdir(dirname):
+                    raise
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        self.waitstart = time.time()
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as ioerr:
+            if ioerr.errno not in (errno.EAGAIN, errno.EACCES):
+                os.close(self._fd)
+                raise
+            self.waited = True
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def read(self):
+        '''Returns the object stored in the lock file, or None'''
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        content = os.read(self._fd, os.fstat(self._fd).st_size)
+        try:
+            return json.loads(content) if content else None
+        except ValueError:
+            return None
+
+    def write(self, obj):
+        '''Stores the given (json serializable) object in the lock file'''
+        content = json.dumps(obj)
+        os.ftruncate(self._fd, 0)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, content)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
@@ -47,9 +47,9 @@ app.controller('MyController', function ($scope, $http, $window, $timeout, $root
     			    }, 200);
 			    }
 			    // proceed:
-				if ($scope.needsRefresh[_view]){  // (in principle, this should always be true)
-					$scope.fetchBuildExitcode(_view);
-				}
+				// fetch the exit code at each load: with the build queue enabled, the frame
+				// first loads a page waiting for the build, which then reloads itself:
+				$scope.fetchBuildExitcode(_view);
 				$scope.needsRefresh[_view] = false;
 				$scope.loading = false;
 				$scope._init = false; //if first time, notify that everything is loaded succesfully
@@ -422,7 +422,9 @@ app.controller('MyController', function ($scope, $http, $window, $timeout, $root
 	$scope.showCommits = function(){
 		/**
 		 * fetches all commits. This function is called if $scope.commitHash is truthy, as
-		 * the button invoking it is enabled only if $scope.commitHash is truthy
+		 * the button invoking it is enabled only if $scope.commitHash is truthy.
+		 * Commit notes are not fetched here but when a commit is selected (see
+		 * setSelectedCommitInWindow)
 		 */
 		var commits = $scope.popups.commits;
 		commits.loading = true;
@@ -432,7 +434,7 @@ app.controller('MyController', function ($scope, $http, $window, $timeout, $root
 		commits.data.navigation = [null, null, null, null, null];
 		$http.post(
 			'get_commits',
-			JSON.stringify({}),
+			JSON.stringify({'notes': false}),
 			{headers: { 'Content-Type': 'application/json' }}
 		).then(
     		function(response){ // success callback
@@ -494,6 +496,9 @@ app.controller('MyController', function ($scope, $http, $window, $timeout, $root
     				commits.data.navigation[2] = idx < lastIndex ? commits.data.commits[idx+1].hash : null;
     				commits.data.navigation[3] = idx < lastIndex ? commits.data.commits[lastIndex].hash : null;
     				commits.data.navigation[4] = idx + 1;
+    				if (commits.data.commits[idx].notes === undefined){
+    					$scope.fetchCommitNotes(idx);
+    				}
     			}
     			
     		},
@@ -503,6 +508,29 @@ app.controller('MyController', function ($scope, $http, $window, $timeout, $root
     	);
 	}
 
+	$scope.fetchCommitNotes = function(idx){
+		/**
+		 * fetches the notes of the idx-th commit of the commits popup
+		 */
+		var commit = $scope.popups.commits.data.commits[idx];
+		$http.post(
+			'get_commits',
+			JSON.stringify({'offset': idx, 'limit': 1}),
+			{headers: { 'Content-Type': 'application/json' }}
+		).then(
+    		function(response){ // success callback
+    			var data = response.data || [];
+    			// check the hash, the history might have changed meanwhile:
+    			if (data.length && data[0].hash == commit.hash){
+    				commit.notes = data[0].notes;
+    			}
+    		},
+    		function(response){ // failure callback
+    			$scope.popups.commits.errMsg = $scope.exc(response);
+    		}
+	    );
+	}
+
 	$scope.setEditorContentFromCommit = function(hash){
 		/**
 		 * This function sets the editor content from the given commit hash.
@@ -653,13 +681,16 @@ app.controller('MyController', function ($scope, $http, $window, $timeout, $root
 	 */
 
 	$scope.logs = [];  // a two element array: first is the text with the full log, second with errors only (if any)
+	$scope.logsPageSize = 262144;  // the bytes of the full log fetched at each request
+	$scope.logsNextOffset = null;  // the offset of the full log remaining content, if any
 	$scope.showLogs = function(){
 		$scope.popups.logs.loading = true;
 		$scope.logs = ['Log file not found', 'Log file not found'];
+		$scope.logsNextOffset = null;
 		$scope.popups.logs.show();
 		$http.post(
 			'get_logs', 
-			JSON.stringify({'buildtype': $scope.view}),
+			JSON.stringify({'buildtype': $scope.view, 'limit': $scope.logsPageSize}),
 	    	{headers: { 'Content-Type': 'application/json' }}
     	).then(
     		function(response){ // success callback
@@ -668,6 +699,32 @@ app.controller('MyController', function ($scope, $http, $window, $timeout, $root
     			if (response.data[0] || response.data[1]){
     				$scope.logs = response.data;
     			}
+    			$scope.logsNextOffset = response.headers('X-Log-Next-Offset');
+    		},
+    		function(response){ // failure callback
+    			$scope.popups.logs.errMsg = $scope.exc(response);
+    		}
+    	);
+	}
+
+	$scope.showMoreLogs = function(){
+		/**
+		 * fetches the next page of the full log (see showLogs)
+		 */
+		if (!$scope.logsNextOffset){
+			return;
+		}
+		$scope.popups.logs.loading = true;
+		$http.post(
+			'get_logs', 
+			JSON.stringify({'buildtype': $scope.view, 'offset': parseInt($scope.logsNextOffset),
+							'limit': $scope.logsPageSize, 'errors': false}),
+	    	{headers: { 'Content-Type': 'application/json' }}
+    	).then(
+    		function(response){ // success callback
+    			$scope.popups.logs.loading = false;
+    			$scope.logs[0] += "\n" + response.data[0];
+    			$scope.logsNextOffset = response.headers('X-Log-Next-Offset');
     		},
     		function(response){ // failure callback
     			$scope.popups.logs.errMsg = $scope.exc(response);
@@ -16,8 +16,10 @@ from flask_login.utils import login_user, logout_user
 # from gfzreport.web.app import app
 from gfzreport.web.app.core import get_reports, build_report, get_sourcefile_content, \
     get_builddir, save_sourcefile, get_commits, secure_upload_filepath,\
-    get_fig_directive, get_sourcedir, get_buildfile, get_logs_, lastbuildexitcode, nocache,\
-    get_git_diff, is_editable, set_editable
+    get_fig_directive, get_sourcedir, get_buildfile, lastbuildexitcode, nocache,\
+    get_git_diff, get_log_content, get_log_errors, is_editable, set_editable, needs_build, \
+    get_timing, count_commits, githead
+from gfzreport.web.app.buildqueue import get_build_queue
 from gfzreport.web.app.models import User, session as dbsession
 
 
@@ -159,8 +161,26 @@ def get_report_type(reportdirname, pagetype):
         return nocache(make_response(template))
 
     if pagetype in ('html', 'pdf'):
+        queue = get_build_queue(current_app)
         try:
-            ret = build_report(current_app, reportdirname, pagetype, current_user, force=False)
+            if queue is None:
+                ret = build_report(current_app, reportdirname, pagetype, current_user,
+                                   force=False)
+            else:
+                # build asynchronously: if a build is needed (or running), render a page
+                # polling the job status and reloading itself when the job is done. Do not
+                # force the build: as in the synchronous case, build_report skips it if an
+                # identical build finished meanwhile (e.g., concurrent page loads):
+                job = queue.running_job(reportdirname, pagetype)
+                if job is None and needs_build(current_app, reportdirname, pagetype,
+                                               current_user):
+                    job = queue.submit(reportdirname, pagetype, current_user, force=False)
+                if job is not None:
+                    return nocache(make_response(render_template("building.html",
+                                                                 reportdirname=reportdirname,
+                                                                 pagetype=pagetype,
+                                                                 job_id=job.id)))
+                ret = -1  # no build needed (see build_report)
         except Exception as exc:
             # raises if gitcommit raises
             raise AppError(str(exc), 500)
@@ -215,6 +235,49 @@ def get_last_build_exitcode(reportdirname):
     return jsonify(ret)
 
 
+@mainpage.route('/<reportdirname>/build', methods=['POST'])
+def build(reportdirname):
+    '''Builds the report for the given buildtype (json key 'buildtype'). If the build queue is
+    enabled (see `buildqueue.get_build_queue`), submits a build job and returns immediately
+    its status (see `build_status` below). Otherwise, builds synchronously and returns a
+    status with 'status' = 'done' and the build 'exitcode'
+    '''
+    buildtype = request.get_json()['buildtype']
+    if buildtype != 'html' and not current_user.is_authenticated:
+        # 403 Forbidden (e.g., logged in but no auth), 401: Unauthorized (not logged in)
+        abort(401)
+    force = request.get_json().get('force', False)
+    queue = get_build_queue(current_app)
+    try:
+        if queue is not None:
+            return jsonify(queue.submit(reportdirname, buildtype, current_user,
+                                        force=force).status())
+        ret = build_report(current_app, reportdirname, buildtype, current_user, force=force)
+    except Exception as exc:
+        # raises if gitcommit raises
+        raise AppError(str(exc), 500)
+    return jsonify({'job_id': None, 'reportdirname': reportdirname, 'buildtype': buildtype,
+                    'status': 'done', 'exitcode': ret, 'message': ''})
+
+
+@mainpage.route('/<reportdirname>/build_status', methods=['POST'])
+def get_build_status(reportdirname):
+    '''Returns the status of the build job with the given id (json key 'job_id'), as
+    dict with keys 'job_id', 'reportdirname', 'buildtype', 'status' ('running', 'done' or
+    'error'), 'exitcode' (the build exit code, or None if the job is not done) and
+    'message' (the error message, if any)
+    '''
+    job_id = request.get_json()['job_id']
+    queue = get_build_queue(current_app)
+    try:
+        status = queue.status(job_id, reportdirname)
+    except (AttributeError, KeyError):  # queue is None or job not found
+        raise AppError("Build job '%s' not found" % str(job_id), 404)
+    if status['reportdirname'] != reportdirname:
+        raise AppError("Build job '%s' not found" % str(job_id), 404)
+    return jsonify(status)
+
+
 @mainpage.route('/<reportdirname>/save', methods=['POST'])
 def save_report(reportdirname):
     # instead of the decorator @login_required, which handles redirects and makes the view
@@ -250,9 +313,25 @@ def get_commits_list(reportdirname):  # dont use get_commits otherwise it overri
         # 403 Forbidden (e.g., logged in but no auth), 401: Unauthorized (not logged in)
         abort(401)
 
-    commits = get_commits(current_app, reportdirname)
+    # optional pagination parameters (json keys): 'offset', 'limit', 'since' (commit hash),
+    # 'notes' (boolean). See core.get_commits. The total number of commits is returned in the
+    # 'X-Total-Count' header (if 'since' is not found, e.g. the history was rewritten, no
+    # commit is returned: clients can detect it from the total count and reload all commits)
+    rjson = request.get_json(silent=True) or {}
+    try:
+        offset = int(rjson.get('offset', 0))
+        limit = rjson.get('limit', None)
+        limit = None if limit is None else int(limit)
+    except (TypeError, ValueError):
+        raise AppError("'offset' and 'limit' must be integers", 400)
+    if offset < 0 or (limit is not None and limit < 0):
+        raise AppError("'offset' and 'limit' must be non negative", 400)
+    commits = get_commits(current_app, reportdirname, offset, limit, rjson.get('since', None),
+                          bool(rjson.get('notes', True)))
     # note that (editable_page.html) we do not actually make use of the returned response value
-    return jsonify(commits)  # which converts to a Response
+    response = jsonify(commits)  # which converts to a Response
+    response.headers['X-Total-Count'] = count_commits(current_app, reportdirname)
+    return response
 
 
 @mainpage.route('/<reportdirname>/get_git_diff', methods=['POST'])
@@ -293,7 +372,7 @@ def get_lch(reportdirname):
         # 403 Forbidden (e.g., logged in but no auth), 401: Unauthorized (not logged in)
         abort(401)
 
-    return get_commits(current_app, reportdirname, -1)[0]['hash']
+    return githead(current_app, reportdirname)
 
 
 @mainpage.route('/<reportdirname>/get_logs', methods=['POST'])
@@ -310,8 +389,42 @@ def get_logs(reportdirname):
         # 403 Forbidden (e.g., logged in but no auth), 401: Unauthorized (not logged in)
         abort(401)
 
+    # optional json keys: 'offset' and 'limit' (in bytes) of the full log content to return,
+    # and 'errors' (boolean, default True) whether to return the errors. The log size and
+    # the offset of the remaining content, if any, are returned in the 'X-Log-Size' and
+    # 'X-Log-Next-Offset' headers, respectively. See core.get_log_content
+    rjson = request.get_json()
+    buildtype = rjson['buildtype']
+    try:
+        offset = int(rjson.get('offset', 0))
+        limit = rjson.get('limit', None)
+        limit = None if limit is None else int(limit)
+    except (TypeError, ValueError):
+        raise AppError("'offset' and 'limit' must be integers", 400)
+    if offset < 0 or (limit is not None and limit < 0):
+        raise AppError("'offset' and 'limit' must be non negative", 400)
+    content, next_offset, size = get_log_content(current_app, reportdirname, buildtype,
+                                                 offset, limit)
+    errors = get_log_errors(current_app, reportdirname, buildtype) \
+        if rjson.get('errors', True) else u''
+    response = jsonify([content, errors])
+    response.headers['X-Log-Size'] = size
+    if next_offset is not None:
+        response.headers['X-Log-Next-Offset'] = next_offset
+    return response
+
+
+@mainpage.route('/<reportdirname>/get_timing', methods=['POST'])
+def get_build_timing(reportdirname):
+    '''returns the timing of the last build (wall-clock and cpu time of each build phase,
+    e.g. sphinx read and write, pdflatex passes), or an empty dict if not found'''
+    # see get_logs:
+    if not current_user.is_authenticated:
+        # 403 Forbidden (e.g., logged in but no auth), 401: Unauthorized (not logged in)
+        abort(401)
+
     buildtype = request.get_json()['buildtype']
-    return jsonify(get_logs_(current_app, reportdirname, buildtype))
+    return jsonify(get_timing(current_app, reportdirname, buildtype))
 
 
 @mainpage.route('/<reportdirname>/upload_file', methods=['POST'])
@@ -13,6 +13,19 @@ class BaseConfig(object):
     DEBUG = False
     UPLOAD_ALLOWED_EXTENSIONS = set(['png', 'jpg', 'jpeg', 'gif'])
     UPLOAD_DIR_BASENAME = "_www_uploaded_files"  # in principle, you don't need t change this
+    # keep a sphinx application in memory for each report and build type, re-using it in
+    # subsequent builds (re-created only when the report conf.py changes). Set to False to
+    # create a new sphinx application on each build:
+    WARM_SPHINX_APPS = True
+    # the number of processes building reports in background. If 0, reports are built
+    # synchronously within the request (blocking the server worker for the whole build):
+    BUILD_QUEUE_SIZE = 0
+    # the maximum number of pdflatex runs when building a pdf (pdflatex is re-run until its
+    # auxiliary files, e.g. cross references or table of contents, do not change):
+    PDFLATEX_MAX_PASSES = 5
+    # the maximum number of reports whose git process (serving git reads) is kept alive in
+    # each server worker. The least recently used ones are terminated:
+    GIT_REPOS_MAXSIZE = 20
     # flask-login settings:
     # ~~~~~~~~~~~~~~~~~~~~~
     # currently not used (login_user(user, remember=False) in views), but let's implement anyway:
@@ -0,0 +1,23 @@
+'''
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import shutil
+import tempfile
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cachedir(monkeypatch):
+    '''Sets an empty temporary directory as root of the gfzreport caches (see
+    `gfzreport.sphinxbuild.filecache`), so that tests do not read data cached by other tests
+    (e.g. mocked web service responses)'''
+    root = tempfile.mkdtemp()
+    monkeypatch.setenv('GFZREPORT_CACHE_DIR', root)
+    monkeypatch.delenv('GFZREPORT_OFFLINE', raising=False)
+    try:
+        yield root
+    finally:
+        shutil.rmtree(root)
@@ -40,4 +40,107 @@ def testParseMargins(test_input, parsefunc, expected):
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testParseMargins']
-    unittest.main()
\ No newline at end of file
+    unittest.main()
+
+def _png_bytes():
+    import os
+    with open(os.path.join(os.path.dirname(__file__), 'testdata', 'annual',
+                           'archive_1.png'), 'rb') as opn:
+        return opn.read()
+
+
+def test_arcgis_cache():
+    import os
+    import shutil
+    import tempfile
+    from urllib2 import URLError
+    from mock import patch, MagicMock
+    from click.testing import CliRunner
+    from gfzreport.cli import main as cli_main
+    from gfzreport.sphinxbuild.map import plotmap, get_arcgis_cache
+
+    cachedir = tempfile.mkdtemp()
+    try:
+        with patch.dict(os.environ, {'GFZREPORT_CACHE_DIR': cachedir,
+                                     'GFZREPORT_OFFLINE': ''}), \
+                patch('gfzreport.sphinxbuild.map.urllib2.urlopen') as mock_urlopen:
+            mock_urlopen.side_effect = lambda url: MagicMock(read=_png_bytes)
+            fig = plotmap([10, 11], [45, 46])
+            assert fig.bgimage_error is None
+            assert mock_urlopen.call_count == 1
+            assert len(os.listdir(get_arcgis_cache().dirpath)) == 1
+            # second time, no url fetched:
+            fig = plotmap([10, 11], [45, 46])
+            assert fig.bgimage_error is None
+            assert mock_urlopen.call_count == 1
+            # different bounds or image size:
+            plotmap([10, 11], [45, 46], arcgis_xpixels=1000)
+            assert mock_urlopen.call_count == 2
+            plotmap([10, 12], [45, 46])
+            assert mock_urlopen.call_count == 3
+
+            # offline: cached image found:
+            mock_urlopen.reset_mock()
+            with patch.dict(os.environ, {'GFZREPORT_OFFLINE': '1'}):
+                fig = plotmap([10, 11], [45, 46])
+                assert fig.bgimage_error is None
+                # not cached: fallback to coastlines, no url fetched:
+                fig = plotmap([0, 1], [45, 46])
+                assert isinstance(fig.bgimage_error, URLError)
+            assert mock_urlopen.call_count == 0
+
+            # invalid images are not cached:
+            mock_urlopen.side_effect = lambda url: MagicMock(read=lambda: b'<html>error</html>')
+            with pytest.raises(Exception):
+                plotmap([0, 1], [45, 46])
+            assert len(os.listdir(get_arcgis_cache().dirpath)) == 3
+
+            # pre-warm the cache:
+            mock_urlopen.side_effect = lambda url: MagicMock(read=_png_bytes)
+            mock_urlopen.reset_mock()
+            result = CliRunner().invoke(cli_main, ['prewarm', '0,45,1,46', '10,45,11,46'])
+            assert result.exit_code == 0
+            assert 'downloaded' in result.output and 'already cached' in result.output
+            assert mock_urlopen.call_count == 1
+            with patch.dict(os.environ, {'GFZREPORT_OFFLINE': '1'}):
+                fig = plotmap([0, 1], [45, 46])
+                assert fig.bgimage_error is None
+
+            result = CliRunner().invoke(cli_main, ['prewarm', '0,45,1'])
+            assert result.exit_code != 0
+    finally:
+        shutil.rmtree(cachedir)
+
+
+def test_get_basemap():
+    import os
+    from mock import patch
+    from mpl_toolkits.basemap import Basemap
+    from gfzreport.sphinxbuild import map as mapmodule
+    from gfzreport.sphinxbuild.map import plotmap, get_basemap
+
+    mapmodule._basemaps.clear()
+    with patch.dict(os.environ, {'GFZREPORT_OFFLINE': '1', 'GFZREPORT_CACHE_DIR': ''}), \
+            patch('gfzreport.sphinxbuild.map.Basemap', side_effect=Basemap) as mock_basemap:
+        fig1 = plotmap([10, 11], [45, 46], labels=['a', 'b'], colors='#ff0000')
+        # same geometry, different labels and colors:
+        fig2 = plotmap([10, 11], [45, 46], labels=['c', 'd'], colors='#00ff00')
+        assert mock_basemap.call_count == 1
+        assert fig1.bmap is not fig2.bmap
+        assert fig1.bmap.ax is fig1.axes[0] and fig2.bmap.ax is fig2.axes[0]
+        assert fig1.bmap.coastsegs is fig2.bmap.coastsegs
+        # different geometry:
+        plotmap([10, 12], [45, 46])
+        assert mock_basemap.call_count == 2
+
+        # test eviction:
+        with patch('gfzreport.sphinxbuild.map._BASEMAP_CACHE_SIZE', 2):
+            mock_basemap.reset_mock()
+            for lon in [1, 2, 3, 1]:
+                get_basemap(llcrnrlon=lon, llcrnrlat=1, urcrnrlon=lon + 1, urcrnrlat=2,
+                            epsg='4326', resolution=None)
+            assert mock_basemap.call_count == 4
+            assert len(mapmodule._basemaps) == 2
+            get_basemap(llcrnrlon=3, llcrnrlat=1, urcrnrlon=4, urcrnrlat=2,
+                        epsg='4326', resolution=None)
+            assert mock_basemap.call_count == 4
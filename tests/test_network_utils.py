@@ -3,8 +3,26 @@ Created on Oct 30, 2017
 
 @author: riccardo
 '''
+import os
+import socket
+import threading
+import time
 import unittest, pytest
-from gfzreport.templates.network.core.utils import sortchannels
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from collections import OrderedDict
+from io import BytesIO
+from urllib2 import URLError, HTTPError
+from mock import patch, Mock
+from gfzreport.sphinxbuild.filecache import hashkey
+from gfzreport.templates.network.core.utils import sortchannels, URLFetcher, todf, iterdcurl,\
+    IRIS_STATION_URL, urlopen, get_session
+from gfzreport.templates.network.core.stationxml import read_stationxml
+from gfzreport.templates.network.core import get_noise_pdfs_content
+import pandas as pd
+from obspy import read_inventory
+from lxml.etree import XMLSyntaxError
+import requests
 
 
 class Test(unittest.TestCase):
@@ -45,6 +63,274 @@ def testSortChannels(test_input, expected):
         else:
             assert scha is not test_input
 
+def test_urlfetcher_cache(cachedir):
+    fetcher = URLFetcher('test', ttl=100, cache_maxsize=10000)
+    with patch('gfzreport.templates.network.core.utils.urlopen',
+               side_effect=lambda url, **kw: BytesIO(url)) as mock_urlopen:
+        assert fetcher.read('http://a/b') == 'http://a/b'
+        assert fetcher.read('http://a/b') == 'http://a/b'
+        assert mock_urlopen.call_count == 1
+        # content not parsable: not cached:
+        with pytest.raises(ValueError):
+            fetcher.read('http://a/c', parse=int)
+        with pytest.raises(ValueError):
+            fetcher.read('http://a/c', parse=int)
+        assert mock_urlopen.call_count == 3
+        # expired:
+        path = fetcher.get_cache().path(hashkey('http://a/b'))
+        os.utime(path, (time.time(), time.time() - 101))
+        assert fetcher.read('http://a/b', parse=len) == len('http://a/b')
+        assert mock_urlopen.call_count == 4
+        # offline: expired items are returned, not cached ones raise:
+        os.utime(path, (time.time(), time.time() - 101))
+        with patch.dict(os.environ, {'GFZREPORT_OFFLINE': '1'}):
+            assert fetcher.read('http://a/b') == 'http://a/b'
+            with pytest.raises(URLError):
+                fetcher.read('http://a/d')
+        assert mock_urlopen.call_count == 4
+        # no cache:
+        with patch.dict(os.environ, {'GFZREPORT_CACHE_DIR': ''}):
+            assert fetcher.read('http://a/b') == 'http://a/b'
+        assert mock_urlopen.call_count == 5
+
+
+@pytest.mark.parametrize("error, retriable", [
+    (URLError(socket.timeout('timed out')), True),
+    (URLError(socket.error(104, 'Connection reset by peer')), True),
+    (socket.timeout('timed out'), True),
+    (HTTPError('http://a', 503, 'Service Unavailable', {}, None), True),
+    (URLError(socket.gaierror(-2, 'Name or service not known')), False),
+    (HTTPError('http://a', 404, 'Not Found', {}, None), False),
+    (URLError('unknown url type'), False),
+    (ValueError('wat?'), False),
+])
+def test_urlfetcher_retries(error, retriable):
+    fetcher = URLFetcher('test', ttl=100, cache_maxsize=10000, retries=2, backoff=0)
+    with patch('gfzreport.templates.network.core.utils.urlopen',
+               side_effect=error) as mock_urlopen:
+        with pytest.raises(type(error)):
+            fetcher.read('http://a/b')
+        assert mock_urlopen.call_count == (3 if retriable else 1)
+
+    errors = [error]
+
+    def urlopen(url, **kwargs):
+        if errors:
+            raise errors.pop()
+        return BytesIO('ok')
+    with patch('gfzreport.templates.network.core.utils.urlopen',
+               side_effect=urlopen) as mock_urlopen:
+        if retriable:
+            assert fetcher.read('http://a/b') == 'ok'
+        else:
+            with pytest.raises(type(error)):
+                fetcher.read('http://a/b')
+
+
+def test_urlfetcher_max_connections_per_host():
+    fetcher = URLFetcher('test', ttl=100, cache_maxsize=10000, max_connections_per_host=2)
+    lock = threading.Lock()
+    running = {}
+    maxrunning = {}
+
+    def urlopen(url, **kwargs):
+        host = url.split('/')[2]
+        with lock:
+            running[host] = running.get(host, 0) + 1
+            maxrunning[host] = max(maxrunning.get(host, 0), running[host])
+        time.sleep(0.05)
+        with lock:
+            running[host] -= 1
+        return BytesIO(url)
+
+    with patch('gfzreport.templates.network.core.utils.urlopen', side_effect=urlopen):
+        threads = [threading.Thread(target=fetcher.read, args=('http://%s/%d' % (host, i),))
+                   for i in range(6) for host in ('a', 'b')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert maxrunning == {'a': 2, 'b': 2}
+
+
+def test_urlopen():
+    connections = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+
+        def setup(self):
+            connections.append(self.client_address)
+            BaseHTTPRequestHandler.setup(self)
+
+        def do_GET(self):
+            code, body = (503, 'busy') if self.path == '/busy' else (200, self.path)
+            self.send_response(code)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_HEAD(self):
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d' % server.server_address[1]
+    try:
+        assert urlopen(url + '/a').read() == '/a'
+        assert urlopen(url + '/b', timeout=5).read() == '/b'
+        response = urlopen(url + '/c', method='HEAD')
+        assert response.getcode() == 204 and response.read() == ''
+        with pytest.raises(HTTPError) as exc:
+            urlopen(url + '/busy')
+        assert exc.value.code == 503 and URLFetcher.isretriable(exc.value)
+        # the connection is kept alive and re-used:
+        assert len(connections) == 1
+        assert get_session() is get_session()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # errors are raised as urllib2 errors:
+    with patch.object(requests.Session, 'request',
+                      side_effect=requests.exceptions.ReadTimeout('timed out')):
+        with pytest.raises(URLError) as exc:
+            urlopen('http://a/b', timeout=1)
+        assert isinstance(exc.value.reason, socket.timeout)
+        assert URLFetcher.isretriable(exc.value)
+    with patch.object(requests.Session, 'request',
+                      side_effect=requests.exceptions.ConnectionError('refused')):
+        with patch('gfzreport.templates.network.core.utils.socket.getaddrinfo'):
+            with pytest.raises(URLError) as exc:
+                urlopen('http://a/b')
+            assert URLFetcher.isretriable(exc.value)
+        with patch('gfzreport.templates.network.core.utils.socket.getaddrinfo',
+                   side_effect=socket.gaierror(-2, 'Name or service not known')):
+            with pytest.raises(URLError) as exc:
+                urlopen('http://a/b')
+            assert isinstance(exc.value.reason, socket.gaierror)
+            assert not URLFetcher.isretriable(exc.value)
+    with pytest.raises(URLError) as exc:
+        urlopen('wat://a/b')
+    assert not URLFetcher.isretriable(exc.value)
+
+
+DATADIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "testdata")
+
+
+@pytest.mark.parametrize("filename", ["ZE.network.xml", "other_stations.xml"])
+def test_read_stationxml(filename):
+    path = os.path.join(DATADIR, filename)
+
+    def func(net, sta, cha):
+        return {'net': net.code, 'net_start': net.start_date, 'net_end': net.end_date,
+                'net_restricted': net.restricted_status, 'net_desc': net.description,
+                'sta': sta.code, 'lat': sta.latitude, 'lon': sta.longitude,
+                'cha': cha.code, 'start': cha.start_date, 'end': cha.end_date,
+                'ele': cha.elevation, 'azi': cha.azimuth, 'rate': cha.sample_rate,
+                'sensor': cha.sensor.model, 'sensor_sn': cha.sensor.serial_number,
+                'logger': cha.data_logger.model, 'logger_sn': cha.data_logger.serial_number}
+
+    dfr = todf(read_stationxml(path), func, funclevel='channel')
+    expected = todf(read_inventory(path, format='STATIONXML'), func, funclevel='channel')
+    assert not dfr.empty
+    assert dfr.equals(expected)
+
+
+@pytest.mark.parametrize("funclevel", ['network', 'station', 'channel'])
+def test_todf_columns(funclevel):
+    inv = read_stationxml(os.path.join(DATADIR, "ZE.network.xml"))
+    columns = ['net', 'sta', 'cha', 'lat', 'end']
+
+    def func(net, sta=None, cha=None):
+        if sta is not None and sta.code.startswith('M'):  # skip some stations
+            return []
+        # return two rows, the second one being empty (skipped):
+        return [(net.code, getattr(sta, 'code', None), getattr(cha, 'code', None),
+                 getattr(sta, 'latitude', None), net.end_date), ()]
+
+    def dictfunc(*args):
+        return [OrderedDict(zip(columns, row)) for row in func(*args) if row]
+
+    dfr = todf(inv, func, funclevel, sortby=['sta', 'cha'], columns=columns)
+    expected = todf(inv, dictfunc, funclevel, sortby=['sta', 'cha'])
+    assert list(dfr.columns) == columns
+    assert dfr.equals(expected)
+    assert todf(inv, lambda *a: None, funclevel, columns=columns).empty
+
+
+def test_read_stationxml_errors():
+    with pytest.raises(XMLSyntaxError):
+        read_stationxml(BytesIO(''))
+    with pytest.raises(ValueError):
+        read_stationxml(BytesIO('<html><body>Not found</body></html>'))
+    assert read_stationxml(BytesIO('<FDSNStationXML xmlns="http://www.fdsn.org/xml/station/1">'
+                                   '</FDSNStationXML>')) == []
+
+
+def test_iterdcurl(cachedir):
+    routing = "http://a/fdsnws/station/1/query\nZE * * * 2012-01-01T00:00:00 2013-01-01T00:00:00\n" \
+        "\nhttp://b/fdsnws/station/1/query\nZE * * * 2012-01-01T00:00:00 2013-01-01T00:00:00"
+    iris_status = [200]
+
+    def urlopen(url, method='GET', **kwargs):
+        if method == 'GET':
+            assert 'routing' in url
+            return BytesIO(routing)
+        assert method == 'HEAD' and 'nodata=204' in url
+        return Mock(getcode=Mock(return_value=iris_status[0]))
+
+    expected = ['http://a/fdsnws/station/1/query', 'http://b/fdsnws/station/1/query']
+    bbox = dict(minlat=1, maxlat=2, minlon=3, maxlon=4)
+    with patch('gfzreport.templates.network.core.utils.urlopen',
+               side_effect=urlopen) as mock_urlopen:
+        assert list(iterdcurl(**bbox)) == expected + [IRIS_STATION_URL]
+        assert mock_urlopen.call_count == 2
+        # cached:
+        assert list(iterdcurl(**bbox)) == expected + [IRIS_STATION_URL]
+        assert mock_urlopen.call_count == 2
+        # another bounding box, IRIS has no data:
+        iris_status[0] = 204
+        bbox['maxlon'] = 5
+        assert list(iterdcurl(**bbox)) == expected
+        assert mock_urlopen.call_count == 4
+        # local routing file:
+        routing_file = os.path.join(cachedir, 'routing.txt')
+        with open(routing_file, 'w') as opn:
+            opn.write(routing.replace('http://b', 'http://c'))
+        expected[1] = 'http://c/fdsnws/station/1/query'
+        assert list(iterdcurl(routing_file, **bbox)) == expected
+        with patch.dict(os.environ, {'GFZREPORT_ROUTING_FILE': routing_file}):
+            assert list(iterdcurl(**bbox)) == expected
+        assert mock_urlopen.call_count == 4
+
+
+def test_get_noise_pdfs_content(cachedir):
+    stations_df = pd.DataFrame({'Label': ['AA01', 'BB01', 'BB01', 'Cc01']})
+    stations_df.metadata = {'channels': ['HHZ', 'HHN']}
+    for fname in ['AA01_HHZ.png', 'aa01_hhn.png', 'AA01_HHN_1.png',  # already found
+                  'BB01_HHZ_2.png', 'BB01_HHN.png',  # no index, two stations BB01
+                  'BB01_HHN_3.png',  # out of bounds
+                  'cc01.HHZ.png',  # case insensitive
+                  'XX01_HHZ.png', 'AA01_BHZ.png', 'AA01.png']:
+        open(os.path.join(cachedir, fname), 'w').close()
+    content = get_noise_pdfs_content(cachedir, stations_df)
+    assert content.splitlines() == ['HHZ HHN',
+                                    'AA01_HHZ.png aa01_hhn.png',
+                                    'BB01_HHZ_1.png BB01_HHN_1.png',
+                                    'BB01_HHZ_2.png BB01_HHN_2.png',
+                                    'cc01.HHZ.png Cc01_HHN.png']
+
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,189 @@
+'''
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import shutil
+import tempfile
+import re
+from contextlib import contextmanager
+
+import pytest
+from mock import patch
+
+from gfzreport.sphinxbuild import _run, get_logfilename
+from gfzreport.sphinxbuild.buildserver import BuildServer, sphinx_build_main
+
+
+CONF = """
+extensions = ['gfzreport.sphinxbuild.core.extensions.setup',
+              'gfzreport.sphinxbuild.core.extensions.gridfigure',
+              'sphinx.ext.mathjax']
+master_doc = 'report'
+source_suffix = '.rst'
+latex_documents = [(master_doc, 'report.tex', u'title', u'author', 'manual')]
+"""
+
+RST = """
+Title
+=====
+
+Some text %s and math: $x^2$
+
+.. gridfigure:: caption
+   :dir: ./imgs
+
+   "a.png"
+"""
+
+
+@contextmanager
+def sourcedir(conf=CONF, rst=RST % 'a'):
+    root = tempfile.mkdtemp()
+    try:
+        src = os.path.join(root, 'source')
+        os.makedirs(os.path.join(src, 'imgs'))
+        shutil.copy(os.path.join(os.path.dirname(__file__), 'testdata', 'annual', 'archive_1.png'),
+                    os.path.join(src, 'imgs', 'a.png'))
+        with open(os.path.join(src, 'conf.py'), 'w') as opn:
+            opn.write(conf)
+        with open(os.path.join(src, 'report.rst'), 'w') as opn:
+            opn.write(rst)
+        yield root, src
+    finally:
+        shutil.rmtree(root)
+
+
+def _read(*paths):
+    with open(os.path.join(*paths)) as opn:
+        content = opn.read()
+    # sphinx adds the mathjax script to a class attribute of the html builder each time a
+    # new application is created, so html files of different builds might differ by
+    # duplicated script tags. Remove them:
+    return re.sub(r'\s*<script type="text/javascript" src="https://cdn\.mathjax.+?</script>',
+                  '', content)
+
+
+@pytest.mark.parametrize('buildtype, outfile', [('html', 'report.html'),
+                                                 ('latex', 'report.tex')])
+def test_buildserver(buildtype, outfile):
+    with sourcedir() as (root, src):
+        server = BuildServer()
+        cold = os.path.join(root, 'cold')
+        warm = os.path.join(root, 'warm')
+        assert _run(src, cold, 'report', buildtype, False, '-E') == 0
+        assert _run(src, warm, 'report', buildtype, False, '-E', sphinx_main=server.main) == 0
+        assert _read(cold, outfile) == _read(warm, outfile)
+        assert len(server) == 1
+        warmapp = server.get(src, src, warm, os.path.join(warm, '.doctrees'), buildtype)[0]
+
+        # modify the rst, the app is re-used:
+        with open(os.path.join(src, 'report.rst'), 'w') as opn:
+            opn.write(RST % 'b')
+        assert _run(src, warm, 'report', buildtype, False, '-E', sphinx_main=server.main) == 0
+        assert _run(src, cold, 'report', buildtype, False, '-E') == 0
+        assert "Some text b" in _read(warm, outfile)
+        assert _read(cold, outfile) == _read(warm, outfile)
+        assert server.get(src, src, warm, os.path.join(warm, '.doctrees'),
+                          buildtype) == (warmapp, False)
+        assert warmapp.builds == 2
+        assert "Build successful" in _read(warm, get_logfilename())
+
+        # modify conf.py, the app is re-created:
+        with open(os.path.join(src, 'conf.py'), 'a') as opn:
+            opn.write("\nproject = u'changed'\n")
+        assert _run(src, warm, 'report', buildtype, False, '-E', sphinx_main=server.main) == 0
+        assert len(server) == 1
+        newwarmapp = server.get(src, src, warm, os.path.join(warm, '.doctrees'), buildtype)[0]
+        assert newwarmapp is not warmapp and newwarmapp.builds == 1
+
+        server.invalidate(src)
+        assert len(server) == 0
+
+
+def test_buildserver_errors():
+    with sourcedir(rst=RST % 'a' + "\n.. unknown_directive::\n") as (root, src):
+        server = BuildServer()
+        out = os.path.join(root, 'warm')
+        for _ in range(2):
+            assert _run(src, out, 'report', 'html', False, '-E', sphinx_main=server.main) == 1
+            assert 'Unknown directive type "unknown_directive"' in \
+                _read(out, get_logfilename())
+
+    # non existing source dir (the server does not raise, as sphinx.build_main):
+    assert server.main(['', '/this/dir/does/not/exist', '/tmp', '-b', 'html']) == 1
+
+
+def test_buildserver_build_state():
+    with sourcedir() as (root, src):
+        server = BuildServer()
+        out = os.path.join(root, 'warm')
+        assert _run(src, out, 'report', 'html', False, sphinx_main=server.main) == 0
+        warmapp = server.get(src, src, out, os.path.join(out, '.doctrees'), 'html')[0]
+        # the state of the previous build set by our extensions is removed:
+        warmapp.app._doicitation_cache__ = 'cache of the previous build'
+        assert _run(src, out, 'report', 'html', False, sphinx_main=server.main) == 0
+        assert warmapp.builds == 2
+        assert not hasattr(warmapp.app, '_doicitation_cache__')
+
+
+def test_buildserver_unsupported_sphinx():
+    with sourcedir() as (root, src):
+        server = BuildServer()
+        out = os.path.join(root, 'warm')
+        # simulate a sphinx version without the private attributes reset by the server:
+        with patch('gfzreport.sphinxbuild.buildserver._SPHINX_PRIVATE_ATTRS',
+                   ('_warncount', '_no_such_attribute')):
+            with patch('gfzreport.sphinxbuild.buildserver.sphinx_build_main',
+                       side_effect=sphinx_build_main) as mock_main:
+                assert _run(src, out, 'report', 'html', False, sphinx_main=server.main) == 0
+                assert mock_main.call_count == 1
+                assert "_no_such_attribute" in _read(out, get_logfilename())
+                # the server does not try to create warm applications anymore:
+                assert _run(src, out, 'report', 'html', False, '-E',
+                            sphinx_main=server.main) == 0
+                assert mock_main.call_count == 2
+        assert not server.supported and len(server) == 0
+        assert "Some text a" in _read(out, 'report.html')
+
+
+@pytest.mark.parametrize('warm', [True, False])
+def test_incremental_build(warm, capsys):
+    with sourcedir(rst=RST % 'a' + '\n   "b.png"\n') as (root, src):
+        out = os.path.join(root, 'out')
+        kwargs = {'sphinx_main': BuildServer().main} if warm else {}
+
+        def build():
+            capsys.readouterr()
+            assert _run(src, out, 'report', 'html', False, **kwargs) == 0
+            return capsys.readouterr()[0]
+
+        assert "1 added, 0 changed, 0 removed" in build()
+        assert "0 added, 0 changed, 0 removed" in build()
+
+        # modification time changed, content did not (e.g. git checkout):
+        rstfile = os.path.join(src, 'report.rst')
+        mtime = os.stat(rstfile).st_mtime
+        os.utime(rstfile, (mtime + 10, mtime + 10))
+        assert "0 added, 0 changed, 0 removed" in build()
+
+        # an image changed its content, but with an older modification time
+        # (e.g. uploaded image copied preserving its metadata):
+        img = os.path.join(src, 'imgs', 'a.png')
+        mtime = os.stat(img).st_mtime
+        shutil.copy(os.path.join(os.path.dirname(__file__), 'testdata', 'annual',
+                                 'archive_2.png'), img)
+        os.utime(img, (mtime - 10, mtime - 10))
+        assert "0 added, 1 changed, 0 removed" in build()
+        assert "0 added, 0 changed, 0 removed" in build()
+
+        # a missing image of the grid figure has been added:
+        shutil.copy(img, os.path.join(src, 'imgs', 'b.png'))
+        assert "0 added, 1 changed, 0 removed" in build()
+        assert "0 added, 0 changed, 0 removed" in build()
+
+        # conf.py changed:
+        with open(os.path.join(src, 'conf.py'), 'a') as opn:
+            opn.write("\n# a comment\n")
+        assert "0 added, 1 changed, 0 removed" in build()
@@ -0,0 +1,133 @@
+'''
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import json
+import shutil
+import tempfile
+from io import BytesIO
+
+import pytest
+from mock import patch
+
+from gfzreport.sphinxbuild import _run
+from gfzreport.sphinxbuild.core.extensions.doicitation import CitationCache, get_citations, \
+    get_cachefile, _CACHE_FILENAME, DOI_BASE_URL
+
+
+@pytest.fixture
+def tmpdir_():
+    root = tempfile.mkdtemp()
+    try:
+        yield root
+    finally:
+        shutil.rmtree(root)
+
+
+def urlopen(req, timeout=None):
+    '''mocks urllib2.urlopen for DOI requests'''
+    doi = req.get_full_url()[len(DOI_BASE_URL):]
+    if doi.startswith('bad'):
+        raise IOError('not found')
+    return BytesIO((u'Citation of <i>%s</i>. %s%s' % (doi, DOI_BASE_URL, doi)).encode('utf8'))
+
+
+def test_cachefile(tmpdir_):
+    assert get_cachefile(tmpdir_) == os.path.join(os.environ['GFZREPORT_CACHE_DIR'], 'doi',
+                                                  'citations.json')
+    with patch.dict(os.environ, {'GFZREPORT_CACHE_DIR': ''}):
+        assert get_cachefile(tmpdir_) == os.path.join(tmpdir_, _CACHE_FILENAME)
+
+
+@patch('gfzreport.sphinxbuild.core.extensions.doicitation.urllib2.urlopen',
+       side_effect=urlopen)
+def test_get_citations(mock_urlopen, tmpdir_):
+    cachefile = os.path.join(tmpdir_, 'cache', 'citations.json')
+    # old cache format (no fetch time):
+    fallback = os.path.join(tmpdir_, 'old.json')
+    with open(fallback, 'w') as opn:
+        json.dump({'bad/old': ['old citation', '']}, opn)
+    cache = CitationCache(cachefile, fallback)
+    dois = ['a/1', 'b/2', 'a/1', 'bad/old', 'bad/new']
+    cits = get_citations(dois, cache)
+    assert mock_urlopen.call_count == 4
+    assert cits['a/1'] == ('Citation of a/1.', DOI_BASE_URL + 'a/1')
+    assert cits['bad/old'] == ('old citation', '')  # fetch failed, use expired
+    assert isinstance(cits['bad/new'], Exception)
+    # nothing written until saved:
+    assert not os.path.isfile(cachefile)
+    cache.save()
+    with open(cachefile) as opn:
+        assert sorted(json.load(opn)) == ['a/1', 'b/2']
+
+    # new cache, citations not expired, only failed dois are fetched:
+    mock_urlopen.reset_mock()
+    cache = CitationCache(cachefile)
+    cits2 = get_citations(dois, cache)
+    assert mock_urlopen.call_count == 2
+    assert cits2['a/1'] == cits['a/1'] and cits2['b/2'] == cits['b/2']
+    assert isinstance(cits2['bad/old'], Exception)  # no fallback file given
+    # ttl 0: all expired (fallback on expired entries if fetch fails):
+    mock_urlopen.reset_mock()
+    cits = get_citations(dois, cache, ttl=0, workers=1)
+    assert mock_urlopen.call_count == 4
+    assert cits['a/1'] == ('Citation of a/1.', DOI_BASE_URL + 'a/1')
+
+    # concurrent builds: saving merges with the entries written meanwhile:
+    cache1, cache2 = CitationCache(cachefile), CitationCache(cachefile)
+    get_citations(['c/3'], cache1)
+    get_citations(['d/4'], cache2)
+    cache1.save()
+    cache2.save()
+    with open(cachefile) as opn:
+        assert sorted(json.load(opn)) == ['a/1', 'b/2', 'c/3', 'd/4']
+
+
+CONF = """
+extensions = ['gfzreport.sphinxbuild.core.extensions.setup',
+              'gfzreport.sphinxbuild.core.extensions.doicitation']
+master_doc = 'report'
+source_suffix = '.rst'
+latex_documents = [(master_doc, 'report.tex', u'title', u'author', 'manual')]
+"""
+
+RST = """
+:doi: a/1
+
+Title
+=====
+
+:doi-citation:`|doi|`
+
+:doi-citation:`a/1`
+
+:doi-citation:`b/2`
+
+:doi-citation:`bad/3`
+"""
+
+
+@pytest.mark.parametrize('buildtype', ['html', 'latex'])
+@patch('gfzreport.sphinxbuild.core.extensions.doicitation.urllib2.urlopen',
+       side_effect=urlopen)
+def test_doicitation_build(mock_urlopen, tmpdir_, buildtype):
+    src = os.path.join(tmpdir_, 'source')
+    os.makedirs(src)
+    with open(os.path.join(src, 'conf.py'), 'w') as opn:
+        opn.write(CONF)
+    with open(os.path.join(src, 'report.rst'), 'w') as opn:
+        opn.write(RST)
+    for i, expected_calls in enumerate([3, 1]):
+        mock_urlopen.reset_mock()
+        outdir = os.path.join(tmpdir_, 'build%d' % i)
+        assert _run(src, outdir, 'report', buildtype, False) == 0
+        # the second build takes a/1 and b/2 from the cache:
+        assert mock_urlopen.call_count == expected_calls
+        with open(os.path.join(outdir, 'report.' + ('tex' if buildtype == 'latex'
+                                                    else 'html'))) as opn:
+            content = opn.read()
+        assert content.count('Citation of a/1.') == 2
+        assert content.count('Citation of b/2.') == 1
+        assert 'DOI error' in content and 'bad/3' in content
@@ -0,0 +1,213 @@
+'''
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+from mock import patch
+
+from gfzreport.sphinxbuild import _run
+from gfzreport.sphinxbuild.filecache import FileCache, get_cachedir, hashkey
+from gfzreport.web.app.buildqueue import WorkerPool
+
+
+@pytest.fixture
+def tmpdir_():
+    root = tempfile.mkdtemp()
+    try:
+        yield root
+    finally:
+        shutil.rmtree(root)
+
+
+def _file(dirpath, name, size):
+    path = os.path.join(dirpath, name)
+    with open(path, 'wb') as opn:
+        opn.write(b'x' * size)
+    return path
+
+
+def test_hashkey():
+    assert hashkey({'a': [1, 2], 'b': u'c'}) == hashkey({'b': 'c', 'a': [1, 2]})
+    assert hashkey({'a': [1, 2]}) != hashkey({'a': [2, 1]})
+    assert hashkey({'a': 1}, '1.5') != hashkey({'a': 1}, '1.6')
+
+
+def test_get_cachedir():
+    with patch.dict(os.environ, {'GFZREPORT_CACHE_DIR': '/abc'}):
+        assert get_cachedir('maps') == '/abc/maps'
+    with patch.dict(os.environ, {'GFZREPORT_CACHE_DIR': ''}):
+        assert get_cachedir('maps') is None
+
+
+def test_filecache(tmpdir_):
+    src = os.path.join(tmpdir_, 'src')
+    os.makedirs(src)
+    cache = FileCache(os.path.join(tmpdir_, 'cache'), 25, '.png')
+    assert cache.get('a') is None
+    path = cache.put('a', _file(src, 'a.png', 10))
+    assert cache.get('a') == path and os.path.isfile(path)
+    cache.put('b', _file(src, 'b.png', 10))
+    # make 'a' the least recently used:
+    os.utime(cache.path('a'), (1, 1))
+    cache.put('c', _file(src, 'c.png', 10))
+    assert cache.get('a') is None
+    assert cache.get('b') is not None and cache.get('c') is not None
+    # now 'c' has been accessed after 'b', make them distinguishable:
+    os.utime(cache.path('b'), (1, 1))
+    cache.put('d', _file(src, 'd.png', 10))
+    assert cache.get('b') is None and cache.get('c') is not None
+    assert sorted(os.listdir(cache.dirpath)) == ['c.png', 'd.png']
+    cache.clear()
+    assert cache.get('c') is None
+
+
+CONF = """
+extensions = ['gfzreport.sphinxbuild.core.extensions.setup',
+              'gfzreport.sphinxbuild.core.extensions.mapfigure']
+master_doc = 'report'
+source_suffix = '.rst'
+latex_documents = [(master_doc, 'report.tex', u'title', u'author', 'manual')]
+"""
+
+RST = """
+Title
+=====
+
+.. mapfigure:: caption
+   :header: "Name", "Lat", "Lon"
+
+   "A", 10, 20
+   "B", 11, 21
+"""
+
+
+def test_mapfigure_cache(tmpdir_):
+    src = os.path.join(tmpdir_, 'source')
+    os.makedirs(src)
+    with open(os.path.join(src, 'conf.py'), 'w') as opn:
+        opn.write(CONF)
+    with open(os.path.join(src, 'report.rst'), 'w') as opn:
+        opn.write(RST)
+
+    import matplotlib.pyplot as plt
+
+    def get_map(bgimage_error):
+        def func(**kwargs):
+            fig = plt.figure()
+            fig.bgimage_error = bgimage_error
+            return fig
+        return func
+
+    def pngs(outdir):
+        return [_ for _ in os.listdir(outdir) if _.startswith('map_plot-')]
+
+    with patch.dict(os.environ, {'GFZREPORT_CACHE_DIR': os.path.join(tmpdir_, 'cache')}):
+        with patch('gfzreport.sphinxbuild.core.extensions.mapfigure.get_map_from_csv',
+                   side_effect=get_map(IOError())) as mock_getmap:
+            # the background image could not be fetched: the map is not cached:
+            for i in range(2):
+                outdir = os.path.join(tmpdir_, 'failed%d' % i)
+                assert _run(src, outdir, 'report', 'latex', False) == 0
+                assert len(pngs(outdir)) == 1
+                assert mock_getmap.call_count == i + 1
+
+            mock_getmap.reset_mock()
+            mock_getmap.side_effect = get_map(None)
+            # the first build renders the map, the others (in different output directories)
+            # use the cache:
+            for i in range(3):
+                outdir = os.path.join(tmpdir_, 'out%d' % i)
+                assert _run(src, outdir, 'report', 'latex', False) == 0
+                assert len(pngs(outdir)) == 1
+                assert mock_getmap.call_count == 1
+            assert len(os.listdir(os.path.join(tmpdir_, 'cache', 'maps'))) == 1
+
+    # no cache:
+    with patch.dict(os.environ, {'GFZREPORT_CACHE_DIR': ''}):
+        with patch('gfzreport.sphinxbuild.core.extensions.mapfigure.get_map_from_csv',
+                   side_effect=get_map(None)) as mock_getmap:
+            assert _run(src, os.path.join(tmpdir_, 'nocache'), 'report', 'latex', False) == 0
+            assert mock_getmap.call_count == 1
+
+
+@pytest.mark.parametrize('processes, parallel', [(2, True), (1, False)])
+def test_mapfigure_parallel(tmpdir_, processes, parallel):
+    src = os.path.join(tmpdir_, 'source')
+    os.makedirs(src)
+    with open(os.path.join(src, 'conf.py'), 'w') as opn:
+        opn.write(CONF + "\nmapfigure_processes = %s\n" % str(processes))
+    with open(os.path.join(src, 'report.rst'), 'w') as opn:
+        opn.write(RST + RST.replace('"B", 11, 21', '"B", 12, 22')[RST.index('..'):])
+
+    import matplotlib.pyplot as plt
+
+    def get_map(**kwargs):
+        fig = plt.figure()
+        fig.bgimage_error = None
+        return fig
+
+    outdir = os.path.join(tmpdir_, 'out')
+    with patch.dict(os.environ, {'GFZREPORT_CACHE_DIR': ''}):
+        with patch('gfzreport.sphinxbuild.core.extensions.mapfigure.get_map_from_csv',
+                   side_effect=get_map) as mock_getmap:
+            assert _run(src, outdir, 'report', 'latex', False) == 0
+            # maps rendered in parallel are rendered in child processes, so our mock is not
+            # called:
+            assert mock_getmap.call_count == (0 if parallel else 2)
+    assert len([_ for _ in os.listdir(outdir) if _.startswith('map_plot-')]) == 2
+    with open(os.path.join(outdir, 'report.tex')) as opn:
+        assert opn.read().count('map_plot-') == 2
+
+
+def _build_latex(src, outdir):
+    assert _run(src, outdir, 'report', 'latex', False) == 0
+    return os.getpid()
+
+
+def test_mapfigure_parallel_in_buildqueue_worker(tmpdir_):
+    src = os.path.join(tmpdir_, 'source')
+    os.makedirs(src)
+    with open(os.path.join(src, 'conf.py'), 'w') as opn:
+        opn.write(CONF + "\nmapfigure_processes = 2\n")
+    with open(os.path.join(src, 'report.rst'), 'w') as opn:
+        opn.write(RST + RST.replace('"B", 11, 21', '"B", 12, 22')[RST.index('..'):])
+
+    import matplotlib.pyplot as plt
+    pidsdir = os.path.join(tmpdir_, 'pids')
+    os.makedirs(pidsdir)
+
+    def get_map(**kwargs):
+        # store the id of the process rendering the map:
+        with open(os.path.join(pidsdir, str(os.getpid())), 'w'):
+            pass
+        fig = plt.figure()
+        fig.bgimage_error = None
+        return fig
+
+    with patch.dict(os.environ, {'GFZREPORT_CACHE_DIR': ''}):
+        with patch('gfzreport.sphinxbuild.core.extensions.mapfigure.get_map_from_csv',
+                   side_effect=get_map) as mock_getmap:
+            # the web app build queue workers render maps in parallel (in child processes):
+            pool = WorkerPool(1)
+            try:
+                workerpid = pool.apply(_build_latex, (src, os.path.join(tmpdir_, 'out1')))
+            finally:
+                pool.terminate()
+                pool.join()
+            pids = os.listdir(pidsdir)
+            assert len(pids) in (1, 2) and str(workerpid) not in pids
+            assert str(os.getpid()) not in pids
+
+            # building outside the main thread (e.g., threaded web server): maps are
+            # rendered serially:
+            thread = threading.Thread(target=_build_latex,
+                                      args=(src, os.path.join(tmpdir_, 'out2')))
+            thread.start()
+            thread.join()
+            assert mock_getmap.call_count == 2
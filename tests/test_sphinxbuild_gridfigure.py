@@ -0,0 +1,190 @@
+'''
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+from mock import patch
+import matplotlib.image as mpimg
+
+from gfzreport.sphinxbuild import _run
+from gfzreport.sphinxbuild.core.extensions import gridfigure
+from gfzreport.sphinxbuild.core.extensions.gridfigure import pnginfo
+
+
+CONF = """
+extensions = ['gfzreport.sphinxbuild.core.extensions.setup',
+              'gfzreport.sphinxbuild.core.extensions.gridfigure']
+master_doc = 'report'
+source_suffix = '.rst'
+latex_documents = [(master_doc, 'report.tex', u'title', u'author', 'manual')]
+"""
+
+RST = """
+Title
+=====
+
+.. gridfigure:: caption
+   :dir: ./imgs
+
+   "big.png", "small.png"
+"""
+
+
+@pytest.fixture
+def sourcedir():
+    root = tempfile.mkdtemp()
+    try:
+        src = os.path.join(root, 'source')
+        os.makedirs(os.path.join(src, 'imgs'))
+        with open(os.path.join(src, 'conf.py'), 'w') as opn:
+            opn.write(CONF)
+        with open(os.path.join(src, 'report.rst'), 'w') as opn:
+            opn.write(RST)
+        data = np.random.rand(300, 2400, 3)
+        mpimg.imsave(os.path.join(src, 'imgs', 'big.png'), data, dpi=150)
+        mpimg.imsave(os.path.join(src, 'imgs', 'small.png'), data[:, :100])
+        yield src
+    finally:
+        shutil.rmtree(root)
+
+
+def test_pnginfo(sourcedir):
+    assert pnginfo(os.path.join(sourcedir, 'imgs', 'big.png')) == \
+        (2400, 300, pytest.approx(150, 1))
+    assert pnginfo(os.path.join(sourcedir, 'conf.py')) is None
+
+
+def thumbs(dirpath):
+    return [_ for _ in os.listdir(dirpath) if _.startswith('gridfigure-')]
+
+
+@pytest.mark.parametrize('buildtype, imgdir, width', [('latex', '', 1200),
+                                                      ('html', '_images', 600)])
+def test_gridfigure_thumbnails(sourcedir, buildtype, imgdir, width):
+    cachedir = os.path.join(os.environ['GFZREPORT_CACHE_DIR'], 'gridthumbs')
+    with patch('gfzreport.sphinxbuild.core.extensions.gridfigure.make_thumbnail',
+               side_effect=gridfigure.make_thumbnail) as mock_make:
+        for i in range(2):
+            outdir = os.path.join(os.path.dirname(sourcedir), '%s%d' % (buildtype, i))
+            assert _run(sourcedir, outdir, 'report', buildtype, False) == 0
+            imgs = os.listdir(os.path.join(outdir, imgdir))
+            # the thumbnail replaces big.png, small.png is left as it is:
+            assert 'big.png' not in imgs and 'small.png' in imgs
+            thumbnails = thumbs(os.path.join(outdir, imgdir))
+            assert len(thumbnails) == 1
+            # the second build takes the thumbnail from the cache:
+            assert mock_make.call_count == 1
+            assert ['gridfigure-' + _ for _ in os.listdir(cachedir)] == thumbnails
+            # each column is half the table width (the source is downscaled by an integer
+            # factor, thus the thumbnail might be bigger than the target width):
+            info = pnginfo(os.path.join(outdir, imgdir, thumbnails[0]))
+            assert info[0] == width
+            # same physical size of the source (2400px at 150dpi):
+            assert info[2] == pytest.approx(150.0 * width / 2400, 1)
+            with open(os.path.join(outdir, 'report.' + ('tex' if buildtype == 'latex'
+                                                        else 'html'))) as opn:
+                content = opn.read()
+            # (latex writes image paths as {name}.png):
+            assert os.path.splitext(thumbnails[0])[0] in content and 'big' not in content
+
+
+def test_gridfigure_thumbnails_disabled(sourcedir):
+    with open(os.path.join(sourcedir, 'conf.py'), 'a') as opn:
+        opn.write('\ngridfigure_thumbnails = False\n')
+    outdir = os.path.join(os.path.dirname(sourcedir), 'build')
+    assert _run(sourcedir, outdir, 'report', 'latex', False) == 0
+    assert 'big.png' in os.listdir(outdir) and not thumbs(outdir)
+
+
+@pytest.mark.parametrize('page_rows, option, hidden_rows', [(2, '', 3),
+                                                            (2, '   :html-page-rows: 0\n', 0),
+                                                            (0, '   :html-page-rows: 4\n', 1),
+                                                            (0, '', 0),
+                                                            (5, '', 0)])
+def test_gridfigure_html_pages(sourcedir, page_rows, option, hidden_rows):
+    with open(os.path.join(sourcedir, 'conf.py'), 'a') as opn:
+        opn.write('\ngridfigure_html_page_rows = %d\n' % page_rows)
+    with open(os.path.join(sourcedir, 'report.rst'), 'w') as opn:
+        opn.write(RST.replace('   :dir: ./imgs\n', '   :dir: ./imgs\n   :header: "A", "B"\n' +
+                              option).replace('   "big.png", "small.png"',
+                                              '\n'.join(['   "big.png", "small.png"'] * 5)))
+    outdir = os.path.join(os.path.dirname(sourcedir), 'build')
+    assert _run(sourcedir, outdir, 'report', 'html', False) == 0
+    with open(os.path.join(outdir, 'report.html')) as opn:
+        content = opn.read()
+    # all images are lazily loaded and have their pixel size set:
+    assert content.count('<img loading="lazy" width="600" height="75" ') == 5
+    assert content.count('<img loading="lazy" width="100" height="300" ') == 5
+    # the header row is never hidden:
+    assert content.count('<tr hidden') == hidden_rows
+    assert content.count('Show more rows') == (1 if hidden_rows else 0)
+
+
+def test_gridfigure_html_pages_many(sourcedir):
+    # two grid figures separated by a normal table:
+    rows = '\n'.join(['   "big.png", "small.png"'] * 3)
+    with open(os.path.join(sourcedir, 'conf.py'), 'a') as opn:
+        opn.write('\ngridfigure_html_page_rows = 1\n')
+    with open(os.path.join(sourcedir, 'report.rst'), 'w') as opn:
+        opn.write(RST.replace('   "big.png", "small.png"', rows) + '''
+.. csv-table:: table
+
+   1, 2
+   3, 4
+
+''' + RST[RST.index('..'):].replace('caption', 'caption2').replace('   "big.png", "small.png"',
+                                                               rows))
+    outdir = os.path.join(os.path.dirname(sourcedir), 'build')
+    assert _run(sourcedir, outdir, 'report', 'html', False) == 0
+    with open(os.path.join(outdir, 'report.html')) as opn:
+        content = opn.read()
+    # each grid figure table is paginated (with a unique id), the normal table is not:
+    assert content.count('<tr hidden') == 4
+    assert content.count('Show more rows') == 2
+    for tableid in ('gridfigure-table-1', 'gridfigure-table-2'):
+        assert content.count('<table id="%s"' % tableid) == 1
+    normaltable = content[content.index('<table', content.index('gridfigure-table-1') + 1):]
+    normaltable = normaltable[:normaltable.index('</table>')]
+    assert 'gridfigure' not in normaltable and '<tr hidden' not in normaltable
+
+
+def test_gridfigure_latex(sourcedir):
+    # two grid figures separated by a normal table and a normal figure:
+    with open(os.path.join(sourcedir, 'report.rst'), 'a') as opn:
+        opn.write('''
+.. csv-table:: table
+
+   1, 2
+
+.. figure:: imgs/small.png
+
+   figure
+
+.. gridfigure:: caption2
+   :dir: ./imgs
+
+   "small.png", "big.png"
+''')
+    outdir = os.path.join(os.path.dirname(sourcedir), 'build')
+    assert _run(sourcedir, outdir, 'report', 'latex', False) == 0
+    with open(os.path.join(outdir, 'report.tex')) as opn:
+        content = opn.read()
+    # each grid figure longtable is moved before its figure (holding the caption only):
+    chunks = content.split('\\begin{longtable}')
+    assert len(chunks) == 3
+    for chunk, caption in zip(chunks[1:], ['caption', 'caption2']):
+        table, figure = chunk.split('\\end{longtable}')[:2]
+        assert 'includegraphics' in table and 'Continued from previous page' in table
+        assert figure.index('\\vspace{-\\textfloatsep}') < figure.index('\\begin{figure}') < \
+            figure.index('\\caption{%s}' % caption) < figure.index('\\end{figure}')
+    # the normal figure is not modified:
+    end = content.index('\\caption{figure}')
+    start = content.rindex('\\begin{figure}', 0, end)
+    assert 'includegraphics' in content[start:end]
+    assert content[:start].rstrip().endswith('\\end{threeparttable}')
@@ -0,0 +1,81 @@
+'''
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import shutil
+import tempfile
+
+import pytest
+from mock import patch
+
+from gfzreport.sphinxbuild import pdflatex_passes, pdflatex_passes2str
+
+
+@pytest.fixture
+def texfile():
+    root = tempfile.mkdtemp()
+    try:
+        texfile = os.path.join(root, 'report.tex')
+        with open(texfile, 'w') as opn:
+            opn.write('\\documentclass{article}')
+        yield texfile
+    finally:
+        shutil.rmtree(root)
+
+
+def fake_pdflatex(aux_contents):
+    '''Returns a function mocking `pdflatex`, writing at each call the next element of
+    `aux_contents` into the aux file (the last element is written once the list is exhausted)'''
+    calls = []
+
+    def func(texfile, texfolder=None, draftmode=False, **kwargs):
+        calls.append(draftmode)
+        with open(os.path.splitext(texfile)[0] + '.aux', 'w') as opn:
+            opn.write(aux_contents[min(len(calls), len(aux_contents)) - 1])
+        return 0, 'stdout', ''
+    return func, calls
+
+
+@pytest.mark.parametrize('existing_aux, aux_contents, max_passes, expected_calls', [
+    # first build: a draft pass creating the aux, then the pass writing the pdf:
+    (None, ['a'], 5, [True, False]),
+    # aux not changed: one pass only:
+    ('a', ['a'], 5, [False]),
+    # aux changed (e.g. new labels): run until it does not change:
+    ('a', ['b'], 5, [False, False]),
+    ('a', ['b', 'c', 'd'], 5, [False, False, False, False]),
+    # never reaching a fixed point:
+    ('a', [str(i) for i in range(10)], 3, [False, False, False]),
+    # max_passes == 1: no draft mode, as the pass must write the pdf:
+    (None, ['a'], 1, [False]),
+])
+def test_pdflatex_passes(texfile, existing_aux, aux_contents, max_passes, expected_calls):
+    if existing_aux is not None:
+        with open(os.path.splitext(texfile)[0] + '.aux', 'w') as opn:
+            opn.write(existing_aux)
+    func, calls = fake_pdflatex(aux_contents)
+    with patch('gfzreport.sphinxbuild.pdflatex', side_effect=func):
+        ret, out, err, passes = pdflatex_passes(texfile, max_passes)
+    assert calls == expected_calls
+    assert (ret, out, err) == (0, 'stdout', '')
+    assert [_[0] for _ in passes] == expected_calls
+    assert pdflatex_passes2str(passes).startswith("%d pdflatex pass(es)" % len(calls))
+
+
+def test_pdflatex_passes_toc_changed(texfile):
+    # the aux file does not change, but the toc does:
+    tocfile = os.path.splitext(texfile)[0] + '.toc'
+    func, calls = fake_pdflatex(['a'])
+
+    def func2(*args, **kwargs):
+        with open(tocfile, 'a') as opn:
+            opn.write('x' if len(calls) < 1 else '')
+        return func(*args, **kwargs)
+
+    with open(os.path.splitext(texfile)[0] + '.aux', 'w') as opn:
+        opn.write('a')
+    with patch('gfzreport.sphinxbuild.pdflatex', side_effect=func2):
+        pdflatex_passes(texfile)
+    assert calls == [False, False]
@@ -22,6 +22,14 @@ from matplotlib.image import imread
 from urllib2 import URLError
 from shutil import rmtree
 from gfzreport.templates.network.core import otherstations_df, geofonstations_df
+from gfzreport.templates.network.core import utils as network_utils
+
+
+def _urllib2_urlopen(*args, **kwargs):
+    """Replaces the global `urllib2.urlopen`, used by the map and doicitation extensions to
+    fetch ArcGIS images and DOI citations, delegating to the (mocked, see `setupurlread`)
+    `urlopen` of the network template. Thus all downloads of a test share the same mock"""
+    return network_utils.urlopen(*args, **kwargs)
 
 
 # tests fix for #4 and #2
@@ -64,7 +72,8 @@ def invoke(*args):
         yield runner.invoke(gfzreport_main, TEMPLATE_NETWORK + argz, catch_exceptions=False), os.getcwd(), argz
 
 @patch('gfzreport.templates.network.core.iterdcurl', side_effect=lambda *a, **v: _getdatacenters(*a, **v))
-@patch('gfzreport.templates.network.core.utils.urllib2.urlopen')
+@patch('urllib2.urlopen', new=_urllib2_urlopen)
+@patch('gfzreport.templates.network.core.utils.urlopen')
 def test_netgen_configonly_flag(mock_urlopen, mock_get_dcs):
     # set args, with wildcards
     # mock urllib returns our testdata files
@@ -137,6 +146,7 @@ def _getdatacenters(*a, **v):
         if dc[:7] == 'http://':
             yield dc
 
+
 def setupurlread(mock_urlopen, geofon_retval=None, others_retval=None, doicit_retval=None):
     '''sets up urlopen.urlread mock
     :param geofon_retval: the string returned from urlopen.read when querying geofon network
@@ -180,7 +190,8 @@ def setupurlread(mock_urlopen, geofon_retval=None, others_retval=None, doicit_re
     mock_urlopen.side_effect = sideeffect
 
 @patch('gfzreport.templates.network.core.iterdcurl', side_effect=lambda *a, **v: _getdatacenters(*a, **v))
-@patch('gfzreport.templates.network.core.utils.urllib2.urlopen')
+@patch('urllib2.urlopen', new=_urllib2_urlopen)
+@patch('gfzreport.templates.network.core.utils.urlopen')
 def test_netgen_ok_sphinxbuild_err(mock_urlopen, mock_get_dcs):
     # set args, with wildcards
     # mock urllib returns our testdata files
@@ -325,7 +336,8 @@ def test_netgen_ok_sphinxbuild_err(mock_urlopen, mock_get_dcs):
     assert not os.path.isdir(outpath)
 
 @patch('gfzreport.templates.network.core.iterdcurl', side_effect=lambda *a, **v: _getdatacenters(*a, **v))
-@patch('gfzreport.templates.network.core.utils.urllib2.urlopen')
+@patch('urllib2.urlopen', new=_urllib2_urlopen)
+@patch('gfzreport.templates.network.core.utils.urlopen')
 def test_netgen_ok_sphinxbuild_ok(mock_urlopen, mock_get_dcs):
     # set args, with wildcards
     # mock urllib returns our testdata files
@@ -387,8 +399,11 @@ def test_netgen_ok_sphinxbuild_ok(mock_urlopen, mock_get_dcs):
     # check if we deleted the temop dir:
     assert not os.path.isdir(outpath)
 
+# the same urls are mocked with different responses below: disable the responses cache
+@patch.dict(os.environ, {'GFZREPORT_CACHE_DIR': ''})
 @patch('gfzreport.templates.network.core.iterdcurl', side_effect=lambda *a, **v: _getdatacenters(*a, **v))
-@patch('gfzreport.templates.network.core.utils.urllib2.urlopen')
+@patch('urllib2.urlopen', new=_urllib2_urlopen)
+@patch('gfzreport.templates.network.core.utils.urlopen')
 def test_netgen_errors(mock_urlopen, mock_get_dcs):
 
     # test that help works (without raising)
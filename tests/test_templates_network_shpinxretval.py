@@ -22,6 +22,15 @@ from urllib2 import URLError
 from StringIO import StringIO
 import time
 from gfzreport.sphinxbuild import get_logfilename
+from gfzreport.templates.network.core import utils as network_utils
+
+
+def _urllib2_urlopen(*args, **kwargs):
+    """Replaces the global `urllib2.urlopen`, used by the map and doicitation extensions to
+    fetch ArcGIS images and DOI citations, delegating to the (mocked, see `setupurlread`)
+    `urlopen` of the network template. Thus all downloads of a test share the same mock"""
+    return network_utils.urlopen(*args, **kwargs)
+
 
 # global paths defined once
 DATADIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "testdata")
@@ -134,7 +143,8 @@ def printl(title, buildtype):
     print("%s\n" % ('=' * len(line)))
 
 @patch('gfzreport.templates.network.core.iterdcurl', side_effect=lambda *a, **v: _getdatacenters(*a, **v))
-@patch('gfzreport.templates.network.core.utils.urllib2.urlopen')
+@patch('urllib2.urlopen', new=_urllib2_urlopen)
+@patch('gfzreport.templates.network.core.utils.urlopen')
 def test_netgen_ok_sphinxbuild_retval(mock_urlopen, mock_get_dcs):
     # set args, with wildcards
     # mock urllib returns our testdata files
@@ -207,7 +217,8 @@ def test_netgen_ok_sphinxbuild_retval(mock_urlopen, mock_get_dcs):
     
     
 @patch('gfzreport.templates.network.core.iterdcurl', side_effect=lambda *a, **v: _getdatacenters(*a, **v))
-@patch('gfzreport.templates.network.core.utils.urllib2.urlopen')
+@patch('urllib2.urlopen', new=_urllib2_urlopen)
+@patch('gfzreport.templates.network.core.utils.urlopen')
 def test_netgen_ok_sphinxbuild_output(mock_urlopen, mock_get_dcs):
     # set args, with wildcards
     # mock urllib returns our testdata files
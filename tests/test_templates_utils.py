@@ -0,0 +1,80 @@
+'''
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+from mock import patch
+
+from gfzreport.templates.utils import stagefiles, copyfiles
+
+
+@pytest.fixture
+def srcdir():
+    root = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(root, 'src', 'sub'))
+        for name, content in [('a.png', 'a'), ('b.png', 'bb'), ('sub/c.jpg', 'ccc')]:
+            with open(os.path.join(root, 'src', name), 'w') as opn:
+                opn.write(content)
+        yield root
+    finally:
+        shutil.rmtree(root)
+
+
+def _read(path):
+    with open(path) as opn:
+        return opn.read()
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_stagefiles(srcdir, workers):
+    src = os.path.join(srcdir, 'src')
+    dst = os.path.join(srcdir, 'dst')
+    threads = threading.active_count()
+    stats = stagefiles([src], dst, workers=workers)
+    # no worker thread outlives the call:
+    assert threading.active_count() == threads
+    assert stats.files == 3 and stats.bytes == 6
+    # same filesystem: files are linked (or cloned), not copied:
+    assert stats.methods['linked'] + stats.methods['reflinked'] == 3
+    assert sorted(os.listdir(dst)) == ['a.png', 'b.png', 'c.jpg']
+    assert _read(os.path.join(dst, 'c.jpg')) == 'ccc'
+    assert str(stats).startswith('3 file(s), 6 B (')
+
+    # re-stage: all files skipped. Modify a destination file: it is staged again:
+    os.remove(os.path.join(dst, 'a.png'))
+    with open(os.path.join(dst, 'a.png'), 'w') as opn:
+        opn.write('x')
+    stats = stagefiles(os.path.join(src, '*.png'), dst, workers=workers)
+    assert stats.files == 2 and stats.methods['skipped'] == 1
+    assert _read(os.path.join(dst, 'a.png')) == 'a'
+
+    # different filesystems (mock it): files are copied:
+    dst2 = os.path.join(srcdir, 'dst2')
+    with patch('gfzreport.templates.utils._hardlink', return_value=False), \
+            patch('gfzreport.templates.utils._reflink', return_value=False):
+        stats = stagefiles([src], dst2, workers=workers)
+    assert stats.methods['copied'] == 3
+    assert sorted(os.listdir(dst2)) == ['a.png', 'b.png', 'c.jpg']
+    os.remove(os.path.join(src, 'a.png'))
+    # the source is removed, but files staged into dst2 are copies:
+    assert _read(os.path.join(dst2, 'a.png')) == 'a'
+    # no temporary files left:
+    assert not [f for f in os.listdir(dst) + os.listdir(dst2) if f.endswith('.tmp')]
+
+
+def test_stagefiles_move(srcdir):
+    src = os.path.join(srcdir, 'src')
+    dst = os.path.join(srcdir, 'dst')
+    assert copyfiles(os.path.join(srcdir, 'nonexisting*'), dst, True) == 0
+    stats = stagefiles(src, dst, True)
+    assert stats.files == 3 and stats.methods['moved'] == 3
+    assert sorted(os.listdir(dst)) == ['a.png', 'b.png', 'c.jpg']
+    # the source dir is empty after the move, thus removed:
+    assert not os.path.isdir(src)
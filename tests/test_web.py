@@ -17,7 +17,11 @@ from mock import patch
 from io import BytesIO
 import re
 
-from gfzreport.web.app.core import _run as _reportbuild_run_orig
+from gfzreport.web.app.core import _run as _reportbuild_run_orig, build_report, \
+    gitcommit, githead, gitrepo, get_lockfile
+from gfzreport.web.app.locks import FileLock
+import time
+import threading
 import tempfile
 from urllib2 import URLError
 import json
@@ -36,10 +40,8 @@ def _cleanup(testobj):
         shutil.rmtree(testobj.source)
     except:
         pass
-    try:
-        testobj.mock_urlopen.stop()
-    except:
-        pass
+    for patcher in getattr(testobj, 'urlopen_patchers', []):
+        patcher.stop()
     try:
         testobj.mock_iterdcurl.stop()
     except:
@@ -127,7 +129,12 @@ class Test(unittest.TestCase):
         # os.makedirs(self.source)
         self.addCleanup(_cleanup, self)
 
-        self.mock_urlopen = patch('gfzreport.templates.network.core.utils.urllib2.urlopen').start()
+        # mock the network template downloads and, with the same mock, the global
+        # urllib2.urlopen used by the map and doicitation extensions (ArcGIS images, DOIs):
+        self.urlopen_patchers = [patch('gfzreport.templates.network.core.utils.urlopen')]
+        self.mock_urlopen = self.urlopen_patchers[0].start()
+        self.urlopen_patchers.append(patch('urllib2.urlopen', self.mock_urlopen))
+        self.urlopen_patchers[-1].start()
         self.mock_urlopen.side_effect = _get_urlopen_sideeffect()
 
         self.mock_iterdcurl = patch('gfzreport.templates.network.core.iterdcurl').start()
@@ -325,15 +332,10 @@ class Test(unittest.TestCase):
             assert res.status_code == 200
 
             
-            # but w need to setup urlread for the arcgis image, because we mocked it
-            # (FIXME: we mocked in gfzreport.templates.network.core.utils.urllib2.urlopen,
-            # why is it mocked in map module?!!!)
-            # The signature is:
-            # _get_urlopen_sideeffect(geofon_retval=None, others_retval=None):
-            # Thus, we setup others_retval=URLError, which means that if 'geofon' is not in url
-            # (which is the case for arcgis query) and URLException is raised.
-            # This way, the map is generated with drawcostallines
-            # and the pdf is created. Keep in mind that pdflatex will raise in any case
+            # urllib2.urlopen, used by the map extension to fetch the ArcGIS image, shares the
+            # urlopen mock (see setUp). Set others_retval=URLError: as 'geofon' is not in the
+            # ArcGIS url, URLError is raised and the map is drawn without background image.
+            # Keep in mind that pdflatex will raise in any case
             self.mock_urlopen.side_effect = _get_urlopen_sideeffect(None, URLError('wat'))
             res = app.get("/ZE_2012/pdf", follow_redirects=True)
             # few stupid asserts, the main test is not raising
@@ -465,8 +467,9 @@ class Test(unittest.TestCase):
             # in the short message:
             assert "No compilation error found" in _data[1]
     
+    @patch('gfzreport.sphinxbuild.buildserver.BuildServer.main', side_effect = Exception('!wow!'))
     @patch('gfzreport.sphinxbuild.sphinx_build_main', side_effect = Exception('!wow!'))
-    def test_report_views_build_failed_sphinxerr2(self, mock_sphinxbuild):
+    def test_report_views_build_failed_sphinxerr2(self, mock_sphinxbuild, mock_buildserver):
         '''test when sphinx_build raises. This should never be the case as sphinx prints
         exception to stderr, but we can check other stuff, e.g. that get_logs returns
         'file not found' string'''
@@ -523,15 +526,10 @@ class Test(unittest.TestCase):
             assert res.status_code == 200
             # thus, we DO access the pdf creation:
 
-            # but w need to setup urlread for the arcgis image, because we mocked it
-            # (FIXME: we mocked in gfzreport.templates.network.core.utils.urllib2.urlopen,
-            # why is it mocked in map module?!!!)
-            # The signature is:
-            # _get_urlopen_sideeffect(geofon_retval=None, others_retval=None):
-            # Thus, we setup others_retval=URLError, which means that if 'geofon' is not in url
-            # (which is the case for arcgis query) and URLException is raised.
-            # This way, the map is generated with drawcostallines
-            # and the pdf is created. Keep in mind that pdflatex will raise in any case
+            # urllib2.urlopen, used by the map extension to fetch the ArcGIS image, shares the
+            # urlopen mock (see setUp). Set others_retval=URLError: as 'geofon' is not in the
+            # ArcGIS url, URLError is raised and the map is drawn without background image.
+            # Keep in mind that pdflatex will raise in any case
             self.mock_urlopen.side_effect = _get_urlopen_sideeffect(None, URLError('wat'))
             res = app.get("/ZE_2012/pdf", follow_redirects=True)
             # status code is still 200, as we redirect to the error page
@@ -649,6 +647,70 @@ class Test(unittest.TestCase):
             m = re.compile(r">ZE_2012\s*<img ", re.DOTALL | re.MULTILINE).search(res.data)
             assert m
 
+    @patch('gfzreport.web.app.core._run')
+    def test_concurrent_builds(self, mock_reportbuild_run):
+        # concurrent builds of the same report and buildtype: the second waits for the first
+        # and returns its result without building again:
+        def slow_run(*a, **kw):
+            time.sleep(1)
+            return _reportbuild_run_orig(*a, **kw)
+        mock_reportbuild_run.side_effect = slow_run
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(build_report(self.app,
+                                                                               'ZE_2012',
+                                                                               'html', None)))
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.2)
+        for thread in threads:
+            thread.join()
+        assert mock_reportbuild_run.call_count == 1
+        assert len(results) == 2 and results[0] == results[1] and results[0] in (0, 1)
+        # but if the report is saved while building, the waiting build re-builds:
+        mock_reportbuild_run.reset_mock()
+
+        def slow_run_and_modify(*a, **kw):
+            ret = slow_run(*a, **kw)
+            if mock_reportbuild_run.call_count == 1:
+                # simulate a user saving the report while building:
+                self.modifyrst("", "Some new text")
+                gitcommit(self.app, 'ZE_2012')
+            return ret
+        mock_reportbuild_run.side_effect = slow_run_and_modify
+        self.modifyrst("", "Some text")
+        del results[:]
+        threads = [threading.Thread(target=lambda: results.append(build_report(self.app,
+                                                                               'ZE_2012',
+                                                                               'html', None)))
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.2)
+        for thread in threads:
+            thread.join()
+        assert mock_reportbuild_run.call_count == 2
+
+    @patch('gfzreport.web.app.core._run', side_effect=_reportbuild_run_orig)
+    def test_forced_build_commits(self, mock_reportbuild_run):
+        # a forced build of a modified source commits the modifications first:
+        assert build_report(self.app, 'ZE_2012', 'html', None) in (0, 1)
+        head = githead(self.app, 'ZE_2012')
+        self.modifyrst("", "Some text")
+        assert build_report(self.app, 'ZE_2012', 'html', None, force=True) in (0, 1)
+        assert mock_reportbuild_run.call_count == 2
+        newhead = githead(self.app, 'ZE_2012')
+        assert newhead != head
+        assert gitrepo(self.app, 'ZE_2012').status() == ''
+        # the lock file stores the new commit:
+        with FileLock(get_lockfile(self.app, 'ZE_2012', 'html')) as lock:
+            assert lock.read()['commit'] == newhead
+        # nothing to commit: the forced build builds anyway:
+        assert build_report(self.app, 'ZE_2012', 'html', None, force=True) in (0, 1)
+        assert mock_reportbuild_run.call_count == 3
+        assert githead(self.app, 'ZE_2012') == newhead
+
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file
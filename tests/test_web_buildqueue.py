@@ -0,0 +1,216 @@
+'''
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import re
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+
+from click.testing import CliRunner
+from mock import patch
+
+from gfzreport.cli import main as gfzreport_main
+from gfzreport.web.app import get_app
+from gfzreport.web.app.buildqueue import BuildQueue
+
+
+# global paths defined once
+SOURCEREPORTDIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "testdata")
+TEMPLATE_NETWORK = ["template", "n"]
+
+
+def _cleanup(testobj):
+    os.chdir(testobj.cwd)
+    try:
+        shutil.rmtree(testobj.source)
+    except:
+        pass
+    for patcher in getattr(testobj, 'urlopen_patchers', []):
+        patcher.stop()
+    try:
+        testobj.mock_iterdcurl.stop()
+    except:
+        pass
+
+
+def _get_urlopen_sideeffect(geofon_retval=None, others_retval=None):
+    '''Returns a side_effect function for the urlopen.urlread mock
+    :param geofon_retval: the string returned from urlopen.read when querying geofon network
+    If None, defaults to "ZE.network.xml" content (file defined in testdata dir)
+    If Exception, then it will be raised
+    :param others_retval: the string returned from urlopen.read when querying NON geofon stations
+    within the geofon network boundaries
+    If None, defaults to "other_stations.xml" content (file defined in testdata dir)
+    If Exception, then it will be raised
+    '''
+    def sideeffect(url, timeout=None):
+        if "geofon" in url:
+            if isinstance(geofon_retval, Exception):
+                raise geofon_retval
+            if geofon_retval is None:
+                with open(os.path.join(SOURCEREPORTDIR, "ZE.network.xml")) as opn:
+                    return BytesIO(opn.read())
+            else:
+                return BytesIO(geofon_retval)
+        else:
+            if isinstance(others_retval, Exception):
+                raise others_retval
+            if others_retval is None:
+                with open(os.path.join(SOURCEREPORTDIR, "other_stations.xml")) as opn:
+                    return BytesIO(opn.read())
+            else:
+                return BytesIO(others_retval)
+    return sideeffect
+
+
+def _getdatacenters(*a, **v):
+    """returns the datacenters as the returned response that the eida routing service
+    would give. The returned string is the datacenters.txt file in the testdata folder"""
+    with open(os.path.join(SOURCEREPORTDIR, "datacenters.txt"), 'rb') as opn:
+        ret = opn.read()
+
+    for dc in ret.splitlines():
+        if dc[:7] == 'http://':
+            yield dc
+
+class Test(unittest.TestCase):
+
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.source = tempfile.mkdtemp()
+        os.chdir(self.source)
+
+        # setup stuff in self.source:
+        # the users txt file, and a config that will be loaded
+        # 
+        with open(os.path.join(os.getcwd(), 'users.txt'), 'w') as opn:
+            opn.write("""[
+{"email": "user1_ok@example.com", "path_restriction_reg": ".*"},
+{"email": "user2_no@example.com", "path_restriction_reg": "/ZE_2012"},
+{"email": "user3_no@example.com", "path_restriction_reg": ".*/ZE2012$"},
+{"email": "user4_ok@example.com", "path_restriction_reg": ".*/ZE2012$"}
+]""")
+
+        with open(os.path.join(os.getcwd(), 'users.txt'), 'r') as opn:
+            _ = opn.read()
+
+        with open(os.path.join(os.getcwd(), 'users.txt'), 'r') as opn:
+            _ = opn.readline()
+
+        # os.makedirs(self.source)
+        self.addCleanup(_cleanup, self)
+
+        # mock the network template downloads and, with the same mock, the global
+        # urllib2.urlopen used by the map and doicitation extensions (ArcGIS images, DOIs):
+        self.urlopen_patchers = [patch('gfzreport.templates.network.core.utils.urlopen')]
+        self.mock_urlopen = self.urlopen_patchers[0].start()
+        self.urlopen_patchers.append(patch('urllib2.urlopen', self.mock_urlopen))
+        self.urlopen_patchers[-1].start()
+        self.mock_urlopen.side_effect = _get_urlopen_sideeffect()
+
+        self.mock_iterdcurl = patch('gfzreport.templates.network.core.iterdcurl').start()
+        self.mock_iterdcurl.side_effect=lambda *a, **v: _getdatacenters(*a, **v)
+
+        args = ['-n', 'ZE', '-s', '2012', '--noprompt', '--inst_uptimes', os.path.join(SOURCEREPORTDIR, 'inst_uptimes'),
+                '--noise_pdf', os.path.join(SOURCEREPORTDIR, 'noise_pdf'),
+                '-o', os.path.join(self.source, "source")
+                ]
+        runner = CliRunner()
+        res = runner.invoke(gfzreport_main, TEMPLATE_NETWORK + args, catch_exceptions=False)
+        if res.exit_code != 0:
+            raise unittest.SkipTest("Unable to generate test report:\n%s" % res.output)
+
+        os.environ['DATA_PATH'] = self.source
+        os.environ['DB_PATH'] = self.source
+        self.app = get_app(config_obj='gfzreport.web.config_example.BaseConfig',
+                           BUILD_QUEUE_SIZE=1)
+
+    def tearDown(self):
+        self.app.config['BUILD_QUEUE'].close()
+
+    def get_buildir(self, buildtype):
+        '''returns the buil directory. buildype can be 'pdf', 'latex' or 'html' (in the two
+        first cases, the path is the same)'''
+        return os.path.join(self.source, 'build', 'ZE_2012',
+                            'latex' if buildtype == 'pdf' else buildtype)
+
+    def wait(self, app, job_id):
+        '''polls the build status until the job is done, and returns the status'''
+        for _ in range(600):
+            res = app.post("/ZE_2012/build_status", data=json.dumps({'job_id': job_id}),
+                           content_type='application/json')
+            assert res.status_code == 200
+            status = json.loads(res.data)
+            if status['status'] != 'running':
+                return status
+            time.sleep(0.1)
+        raise AssertionError('build job still running')
+
+    def test_build_queue(self):
+        with self.app.test_request_context():
+            app = self.app.test_client()
+            # the html page needs to be built: we get a page waiting for the build:
+            with patch.object(BuildQueue, 'submit', autospec=True,
+                              side_effect=BuildQueue.submit) as mock_submit:
+                res = app.get("/ZE_2012/html", follow_redirects=True)
+                # the build is not forced (build_report skips it if an identical build
+                # finished meanwhile, e.g. submitted by another server process):
+                assert mock_submit.call_args[1]['force'] is False
+            assert res.status_code == 200
+            job_id = re.search(r"'job_id': \"(\w+)\"", res.data).group(1)
+            # requesting the page again while building does not issue a new build:
+            res = app.get("/ZE_2012/html", follow_redirects=True)
+            assert re.search(r"'job_id': \"(\w+)\"", res.data).group(1) == job_id
+
+            status = self.wait(app, job_id)
+            assert status['status'] == 'done' and status['exitcode'] in (0, 1)
+            # the status can be read from other server processes, i.e. other queues:
+            queue = BuildQueue(self.app.config, 1)
+            assert queue.status(job_id, 'ZE_2012') == status
+            with self.assertRaises(KeyError):
+                queue.status('../' + job_id, 'ZE_2012')
+            with self.assertRaises(KeyError):
+                queue.status(job_id, 'ZE_2013')
+            assert os.path.isfile(os.path.join(self.get_buildir('html'), 'report.html'))
+
+            # the page is built, we get the page:
+            res = app.get("/ZE_2012/html", follow_redirects=True)
+            assert res.status_code == 200
+            assert 'job_id' not in res.data
+            assert "ZE" in res.data
+
+            # build via the build endpoint:
+            res = app.post("/ZE_2012/build", data=json.dumps({'buildtype': 'html',
+                                                               'force': True}),
+                           content_type='application/json')
+            status = json.loads(res.data)
+            assert status['status'] in ('running', 'done') and status['job_id'] != job_id
+            # concurrent requests share the same job:
+            res = app.post("/ZE_2012/build", data=json.dumps({'buildtype': 'html',
+                                                               'force': True}),
+                           content_type='application/json')
+            status2 = json.loads(res.data)
+            if status['status'] == 'running':
+                assert status2['job_id'] == status['job_id']
+            assert self.wait(app, status2['job_id'])['exitcode'] in (0, 1)
+            # no build needed:
+            res = app.post("/ZE_2012/build", data=json.dumps({'buildtype': 'html'}),
+                           content_type='application/json')
+            assert self.wait(app, json.loads(res.data)['job_id'])['exitcode'] == -1
+
+            # pdf is not accessible if not logged in:
+            res = app.post("/ZE_2012/build", data=json.dumps({'buildtype': 'pdf'}),
+                           content_type='application/json')
+            assert res.status_code == 401
+
+            # job not found:
+            res = app.post("/ZE_2012/build_status", data=json.dumps({'job_id': 'abc'}),
+                           content_type='application/json')
+            assert res.status_code == 404
@@ -0,0 +1,99 @@
+'''
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import shutil
+import tempfile
+
+import pytest
+from mock import patch
+
+from gfzreport.web.app.catalog import ReportCatalog
+
+
+@pytest.fixture
+def root():
+    root = tempfile.mkdtemp()
+    try:
+        yield root
+    finally:
+        shutil.rmtree(root)
+
+
+def mkreport(root, name, mtime):
+    os.makedirs(os.path.join(root, name))
+    path = os.path.join(root, name, 'conf.py')
+    with open(path, 'w') as opn:
+        opn.write("master_doc = 'report_%s'\n" % name)
+    os.utime(path, (mtime, mtime))
+
+
+def names(catalog):
+    return [(_.name, _.editable) for _ in catalog.reports()]
+
+
+def test_catalog(root):
+    mkreport(root, 'A', 100)
+    mkreport(root, 'B', 300)
+    mkreport(root, 'C', 200)
+    os.makedirs(os.path.join(root, 'D'))  # empty: skipped
+    mkreport(root, '_E', 400)  # starts with '_': skipped
+    with open(os.path.join(root, 'C.locked'), 'w'):
+        pass
+
+    catalog = ReportCatalog(root)
+    with patch('gfzreport.web.app.catalog.os.listdir', side_effect=os.listdir) as mock_ls:
+        assert names(catalog) == [('B', True), ('C', False), ('A', True)]
+        assert mock_ls.call_count == 5  # root and the 4 report directories
+        # nothing changed: answers from memory:
+        mock_ls.reset_mock()
+        assert names(catalog) == [('B', True), ('C', False), ('A', True)]
+        assert mock_ls.call_count == 0
+
+        # a file is added to a report: only that report is re-scanned:
+        mtime = os.stat(os.path.join(root, 'A')).st_mtime
+        path = os.path.join(root, 'A', 'report.rst')
+        with open(path, 'w'):
+            pass
+        os.utime(path, (400, 400))
+        os.utime(os.path.join(root, 'A'), (mtime + 1, mtime + 1))
+        os.utime(os.path.join(root, 'A', 'conf.py'), (500, 500))
+        assert names(catalog) == [('A', True), ('B', True), ('C', False)]
+        assert mock_ls.call_args_list == [((os.path.join(root, 'A'),),)]
+
+        # a file is modified (the directory modification time does not change): the catalog
+        # is not updated unless invalidated:
+        mock_ls.reset_mock()
+        os.utime(path, (100, 100))
+        assert names(catalog) == [('A', True), ('B', True), ('C', False)]
+        catalog.invalidate('A')
+        assert names(catalog) == [('B', True), ('C', False), ('A', True)]
+        assert mock_ls.call_count == 1
+
+        # report unlocked and new report added: the root is re-listed:
+        mock_ls.reset_mock()
+        os.remove(os.path.join(root, 'C.locked'))
+        mkreport(root, 'F', 50)
+        catalog.invalidate()
+        assert names(catalog) == [('B', True), ('C', True), ('A', True), ('F', True)]
+
+        # report removed:
+        shutil.rmtree(os.path.join(root, 'B'))
+        assert names(catalog) == [('C', True), ('A', True), ('F', True)]
+
+    assert catalog.master_doc('A') == 'report_A'
+    with open(os.path.join(root, 'A', 'conf.py'), 'w') as opn:
+        opn.write("master_doc = 'changed'\n")
+    assert catalog.master_doc('A') == 'report_A'
+
+
+def test_catalog_build_status(root):
+    catalog = ReportCatalog(root)
+    assert catalog.build_status('A', 'html', 1.5) is None
+    catalog.set_build_status('A', 'html', 1.5, 0)
+    assert catalog.build_status('A', 'html', 1.5) == 0
+    assert catalog.build_status('A', 'pdf', 1.5) is None
+    # log file modified (e.g. built in another process):
+    assert catalog.build_status('A', 'html', 2.5) is None
@@ -0,0 +1,103 @@
+'''
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import json
+import shutil
+import tempfile
+import threading
+
+import pytest
+from mock import patch, MagicMock
+
+from gfzreport.web.app.core import get_commits, count_commits, get_commit_index, \
+    get_commitindexfile, gitrepo
+
+
+@pytest.fixture
+def app():
+    root = tempfile.mkdtemp()
+    app = MagicMock(config={'SOURCE_PATH': os.path.join(root, 'source'),
+                            'BUILD_PATH': os.path.join(root, 'build')})
+    os.makedirs(os.path.join(root, 'source', 'ZE_2012'))
+    try:
+        # commits need an identity:
+        with patch.dict(os.environ, {'GIT_COMMITTER_NAME': 'a', 'GIT_COMMITTER_EMAIL': 'a@b',
+                                     'GIT_AUTHOR_NAME': 'a', 'GIT_AUTHOR_EMAIL': 'a@b'}):
+            yield app
+    finally:
+        gitrepo(app, 'ZE_2012').close()
+        shutil.rmtree(root)
+
+
+def commit(app, content):
+    repo = gitrepo(app, 'ZE_2012')
+    with open(os.path.join(repo.path, 'report.rst'), 'w') as opn:
+        opn.write(content)
+    repo.commit_all('commit from webapp', 'me <me@x>')
+    return repo.head()
+
+
+def test_get_commits(app):
+    assert get_commits(app, 'ZE_2012') == [] and count_commits(app, 'ZE_2012') == 0
+    hashes = [commit(app, str(i)) for i in range(5)][::-1]  # newest first
+    repo = gitrepo(app, 'ZE_2012')
+    repo.set_note(json.dumps({'Report generation': {'pdf': 'ok'}}), hashes[1])
+
+    commits = get_commits(app, 'ZE_2012')
+    assert [_['hash'] for _ in commits] == hashes
+    assert commits[0]['author'] == 'me' and commits[0]['email'] == 'me@x'
+    assert commits[0]['msg'] == '"commit from webapp"'
+    assert commits[-1]['msg'] == '"git-init and commit from webapp"'
+    assert commits[0]['notes'] == ''
+    assert 'pdf: ok' in commits[1]['notes']
+    assert count_commits(app, 'ZE_2012') == 5
+
+    # pagination:
+    assert [_['hash'] for _ in get_commits(app, 'ZE_2012', 1, 2)] == hashes[1:3]
+    assert [_['hash'] for _ in get_commits(app, 'ZE_2012', 3)] == hashes[3:]
+    assert [_['hash'] for _ in get_commits(app, 'ZE_2012', since=hashes[2])] == hashes[:2]
+    assert [_['hash'] for _ in get_commits(app, 'ZE_2012', 1, since=hashes[2])] == \
+        hashes[1:2]
+    assert all('notes' not in _ for _ in get_commits(app, 'ZE_2012', notes=False))
+
+    # the index is stored on disk, too. New commits are read incrementally:
+    with open(get_commitindexfile(app, 'ZE_2012')) as opn:
+        assert json.load(opn)['head'] == hashes[0]
+    new = commit(app, 'new')
+    with patch.object(repo, 'output', side_effect=repo.output) as mock_output:
+        assert get_commits(app, 'ZE_2012', limit=1)[0]['hash'] == new
+        assert len(mock_output.call_args_list) == 1
+        assert mock_output.call_args[0][-1] == '%s..%s' % (hashes[0], new)
+        # HEAD did not change: no git log:
+        assert count_commits(app, 'ZE_2012') == 6
+        assert len(mock_output.call_args_list) == 1
+    hashes.insert(0, new)
+
+    # the in-memory index is lost (e.g., new process): the index file is used:
+    app.config.pop('COMMIT_INDEXES')
+    with patch.object(repo, 'output', side_effect=repo.output) as mock_output:
+        assert [_[0] for _ in get_commit_index(app, 'ZE_2012')] == hashes
+        assert mock_output.call_count == 0
+
+    # history rewritten: the index is rebuilt:
+    repo.call('reset', '--hard', '-q', hashes[2])
+    newer = commit(app, 'newer')
+    assert [_['hash'] for _ in get_commits(app, 'ZE_2012')] == [newer] + hashes[2:]
+    # a commit removed from the history: no commit returned:
+    assert get_commits(app, 'ZE_2012', since=hashes[0]) == []
+    assert get_commits(app, 'ZE_2012', since=newer) == []
+
+    # concurrent requests (threads) share the in-memory index:
+    app.config.pop('COMMIT_INDEXES')
+    counts = []
+    threads = [threading.Thread(target=lambda: counts.append(count_commits(app, 'ZE_2012')))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counts == [len(hashes) - 1] * 8
+    assert app.config['COMMIT_INDEXES']['ZE_2012']['head'] == newer
@@ -0,0 +1,119 @@
+'''
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import json
+import shutil
+import subprocess
+import tempfile
+
+import pytest
+from mock import patch
+
+from gfzreport.web.app.gitrepo import GitRepo, GitRepos
+
+
+@pytest.fixture
+def repo():
+    root = tempfile.mkdtemp()
+    repo = GitRepo(root)
+    try:
+        # commits need an identity:
+        with patch.dict(os.environ, {'GIT_COMMITTER_NAME': 'a', 'GIT_COMMITTER_EMAIL': 'a@b',
+                                     'GIT_AUTHOR_NAME': 'a', 'GIT_AUTHOR_EMAIL': 'a@b'}):
+            yield repo
+    finally:
+        repo.close()
+        shutil.rmtree(root)
+
+
+def write(repo, name, content):
+    with open(os.path.join(repo.path, name), 'w') as opn:
+        opn.write(content)
+
+
+def test_gitrepo(repo):
+    # not a git repository yet:
+    assert repo.status() is None
+    assert repo.head() is None and repo.note() == ''
+    write(repo, 'report.rst', 'first\n')
+    assert repo.commit_all('commit from webapp', 'me <>') is True
+    head1 = repo.head()
+    assert head1 == repo.output('rev-parse', 'HEAD').strip()
+    assert repo.output('log', '-1', '--pretty=format:%s %an') == \
+        '"git-init and commit from webapp" me'
+    # nothing to commit:
+    assert repo.status() == ''
+    assert repo.commit_all('commit from webapp') is False
+    # modified and untracked files:
+    write(repo, 'report.rst', 'second\n')
+    write(repo, 'new.txt', 'new')
+    assert repo.commit_all('commit from webapp') is True
+    head2 = repo.head()
+    assert head2 != head1
+    assert repo.output('show', '--name-only', '--pretty=format:', 'HEAD').split() == \
+        ['new.txt', 'report.rst']
+    assert repo.show(head1, 'report.rst') == 'first\n'
+    assert repo.show(head2, 'report.rst') == 'second\n'
+    with pytest.raises(ValueError):
+        repo.show(head1, 'new.txt')
+    with pytest.raises(ValueError):
+        repo.show('abc', 'report.rst')
+    # notes:
+    assert repo.note() == ''
+    assert repo.set_note(json.dumps({'a': 1})) == 0
+    assert json.loads(repo.note()) == {'a': 1}
+    assert json.loads(repo.note(head2)) == {'a': 1}
+    assert repo.note(head1) == ''
+    assert repo.output('log', '-1', '--pretty=format:%N').strip() == repo.note().strip()
+
+
+def test_gitrepo_single_process(repo):
+    write(repo, 'report.rst', 'first\n')
+    repo.commit_all('msg')
+    popen = subprocess.Popen
+    with patch('gfzreport.web.app.gitrepo.subprocess.Popen', side_effect=popen) as mock_popen:
+        for _ in range(5):
+            assert repo.head() is not None
+            assert repo.show('HEAD', 'report.rst') == 'first\n'
+            assert repo.note() == ''
+        # all reads are served by the same git process:
+        assert mock_popen.call_count == 1
+        # a dead process is restarted:
+        repo._catfile.kill()
+        repo._catfile.wait()
+        assert repo.show('HEAD', 'report.rst') == 'first\n'
+        assert mock_popen.call_count == 2
+
+
+def test_gitrepos_lru(repo):
+    write(repo, 'report.rst', 'first\n')
+    repo.commit_all('msg')
+    repos = GitRepos(2)
+    created = []
+
+    def factory():
+        created.append(GitRepo(repo.path))
+        return created[-1]
+
+    try:
+        assert repos.get('a', factory) is created[0]
+        assert repos.get('b', factory) is created[1]
+        for obj in created:
+            assert obj.head() is not None and obj._catfile is not None
+        assert repos.get('a', factory) is created[0]  # now 'b' is the least recently used
+        assert len(created) == 2
+        repos.get('c', factory)
+        assert len(repos) == 2
+        # 'b' evicted and its process closed:
+        assert created[1]._catfile is None
+        assert created[0]._catfile is not None
+        assert repos.get('b', factory) is created[3]
+        # 'a' evicted:
+        assert created[0]._catfile is None
+    finally:
+        repos.close()
+    assert len(repos) == 0
+    assert all(_._catfile is None for _ in created)
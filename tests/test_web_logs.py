@@ -0,0 +1,92 @@
+'''
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import json
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+import pytest
+from mock import patch, MagicMock
+
+from gfzreport.sphinxbuild import finalize, logindex
+from gfzreport.web.app.core import get_logs_, get_log_content, get_log_errors, get_logfile, \
+    get_logindexfile
+
+
+STDERR = """*** Sphinx (rst to latex) ***
+
+/a/report.rst:12: WARNING: something
+/a/report.rst:14: ERROR: wrong directive
+/a/report.rst:19: ERROR: worse \xc3\xa8
+
+*** Pdflatex (latex to pdf) ***
+
+2 pdflatex pass(es) run in 1.00 seconds: 0.50s (-draftmode), 0.50s
+  This is pdfTeX
+./report.tex:100: ERROR: Undefined control sequence
+"""
+
+
+@pytest.fixture
+def app():
+    root = tempfile.mkdtemp()
+    app = MagicMock(config={'SOURCE_PATH': os.path.join(root, 'source'),
+                            'BUILD_PATH': os.path.join(root, 'build')})
+    os.makedirs(os.path.join(root, 'build', 'ZE_2012', 'latex'))
+    try:
+        yield app
+    finally:
+        shutil.rmtree(root)
+
+
+def test_logindex():
+    lines = ['a\n', '*** Sphinx (rst to html) ***\n', 'x.rst:1: ERROR: e\n', 'b']
+    assert logindex(lines) == {'size': 50, 'sections': [[2, '*** Sphinx (rst to html) ***']],
+                               'errors': [31]}
+
+
+def test_get_logs(app):
+    assert get_logs_(app, 'ZE_2012', 'pdf') == ('Log file not found', 'Log file not found')
+
+    finalize(StringIO(STDERR), 1, os.path.join(app.config['BUILD_PATH'], 'ZE_2012', 'latex'),
+             False)
+    logfile = get_logfile(app, 'ZE_2012', 'pdf')
+    with open(get_logindexfile(app, 'ZE_2012', 'pdf')) as opn:
+        assert json.load(opn)['size'] == os.stat(logfile).st_size
+
+    full, errors = get_logs_(app, 'ZE_2012', 'pdf')
+    with open(logfile) as opn:
+        assert full == "\n".join(_.strip() for _ in opn).decode('utf8')
+    assert errors == ("*** Sphinx (rst to latex) ***\n"
+                      "/a/report.rst:14: ERROR: wrong directive\n"
+                      u"/a/report.rst:19: ERROR: worse \xe8\n"
+                      "*** Pdflatex (latex to pdf) ***\n"
+                      "./report.tex:100: ERROR: Undefined control sequence")
+
+    # pagination:
+    pages = []
+    offset = 0
+    while offset is not None:
+        content, offset, size = get_log_content(app, 'ZE_2012', 'pdf', offset, 50)
+        assert size == os.stat(logfile).st_size
+        pages.append(content)
+    assert len(pages) > 2
+    assert "\n".join(pages) == full
+
+    # the log is rewritten (e.g. by a previous version of the program) without index: the
+    # index is re-computed:
+    with open(logfile, 'w') as opn:
+        opn.write("Build failed (exit status: 2)\n\n*** Sphinx (rst to latex) ***\n\n"
+                  "Exception occurred:\n")
+    os.utime(logfile, (1, 1))
+    assert get_log_errors(app, 'ZE_2012', 'pdf') == \
+        ("*** Sphinx (rst to latex) ***\n   No compilation error found (critical errors or "
+         "exceptions are reported in the full log)")
+    # now the index is up-to-date and the log is not parsed:
+    with patch('gfzreport.web.app.core.write_logindex') as mock_write:
+        assert 'Exception' not in get_log_errors(app, 'ZE_2012', 'pdf')
+        assert not mock_write.called
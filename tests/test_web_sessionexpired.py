@@ -38,10 +38,8 @@ def _cleanup(testobj):
         shutil.rmtree(testobj.source)
     except:
         pass
-    try:
-        testobj.mock_urlopen.stop()
-    except:
-        pass
+    for patcher in getattr(testobj, 'urlopen_patchers', []):
+        patcher.stop()
     try:
         testobj.mock_iterdcurl.stop()
     except:
@@ -116,7 +114,12 @@ class Test(unittest.TestCase):
         # os.makedirs(self.source)
         self.addCleanup(_cleanup, self)
 
-        self.mock_urlopen = patch('gfzreport.templates.network.core.utils.urllib2.urlopen').start()
+        # mock the network template downloads and, with the same mock, the global
+        # urllib2.urlopen used by the map and doicitation extensions (ArcGIS images, DOIs):
+        self.urlopen_patchers = [patch('gfzreport.templates.network.core.utils.urlopen')]
+        self.mock_urlopen = self.urlopen_patchers[0].start()
+        self.urlopen_patchers.append(patch('urllib2.urlopen', self.mock_urlopen))
+        self.urlopen_patchers[-1].start()
         self.mock_urlopen.side_effect = _get_urlopen_sideeffect()
 
         self.mock_iterdcurl = patch('gfzreport.templates.network.core.iterdcurl').start()
@@ -201,15 +204,10 @@ class Test(unittest.TestCase):
             # (we set REMEMBER_COOKIE_DURATION = 1 second)
             time.sleep(duration.total_seconds()+1)
 
-            # Note that we need to setup urlread for the arcgis image, because we mocked it
-            # (FIXME: we mocked in gfzreport.templates.network.core.utils.urllib2.urlopen,
-            # why is it mocked in map module?!!!)
-            # The signature is:
-            # _get_urlopen_sideeffect(geofon_retval=None, others_retval=None):
-            # Thus, we setup others_retval=URLError, which means that if 'geofon' is not in url
-            # (which is the case for arcgis query) and URLException is raised.
-            # This way, the map is generated with drawcostallines
-            # and the pdf is created. Keep in mind that pdflatex will raise in any case
+            # urllib2.urlopen, used by the map extension to fetch the ArcGIS image, shares the
+            # urlopen mock (see setUp). Set others_retval=URLError: as 'geofon' is not in the
+            # ArcGIS url, URLError is raised and the map is drawn without background image.
+            # Keep in mind that pdflatex will raise in any case
             self.mock_urlopen.side_effect = _get_urlopen_sideeffect(None, URLError('wat'))
             res = app.get("/ZE_2012/pdf", follow_redirects=True)
             # few stupid asserts, the main test is not raising
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+'''
+Created on Oct 18, 2026
+
+@author: riccardo
+'''
+import os
+import shutil
+import subprocess
+import tempfile
+import timeit
+from cStringIO import StringIO
+
+import pytest
+from mock import patch, MagicMock
+
+from gfzreport.web.app.core import js_escape, get_sourcefile_content
+
+
+def js_escape_loop(content):
+    '''the old (char by char) implementation of `js_escape`, for comparison'''
+    fpoint = StringIO(content)
+    sio = StringIO()
+    while True:
+        c = fpoint.read(1)
+        if not c:
+            break
+        elif c == '\n' or c == '\r':
+            sio.write("\\")
+            c = 'n' if c == '\n' else 'r'
+        elif c == '\\' or c == '"':
+            sio.write("\\")
+        sio.write(c)
+    return sio.getvalue()
+
+
+RST = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'gfzreport', 'templates',
+                   'network', 'sphinx', 'report.rst')
+
+
+@pytest.mark.parametrize('content', [
+    '',
+    'Title\r\n=====\r\n\r\n',
+    'a "quoted" \\"escaped\\" \\\\n text\n',
+    u'unicode: èà α "’"\n\\'.encode('utf8'),
+    open(RST).read(),
+])
+def test_js_escape(content):
+    assert js_escape(content) == js_escape_loop(content)
+
+
+def test_js_escape_benchmark():
+    with open(RST) as opn:
+        content = opn.read() * 50  # ~1MB
+    assert js_escape(content) == js_escape_loop(content)
+    new = min(timeit.repeat(lambda: js_escape(content), number=1, repeat=3))
+    old = min(timeit.repeat(lambda: js_escape_loop(content), number=1, repeat=1))
+    # the bulk implementation is (much) faster: ~100x here, be conservative:
+    assert new * 10 < old
+
+
+@pytest.fixture
+def sourcedir():
+    root = tempfile.mkdtemp()
+    try:
+        yield root
+    finally:
+        shutil.rmtree(root)
+
+
+def test_get_sourcefile_content(sourcedir):
+    filename = os.path.join(sourcedir, 'report.rst')
+    old = u'first "version"\r\nè\\\n'.encode('utf8')
+    new = u'second "version"\n'.encode('utf8')
+    with open(filename, 'w') as opn:
+        opn.write(old)
+    kwargs = dict(cwd=sourcedir, stdout=open(os.devnull, 'w'))
+    subprocess.check_call(['git', 'init', '-q'], **kwargs)
+    subprocess.check_call(['git', 'add', 'report.rst'], **kwargs)
+    subprocess.check_call(['git', '-c', 'user.name=a', '-c', 'user.email=a@b', 'commit', '-q',
+                           '-m', 'first'], **kwargs)
+    commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=sourcedir).strip()
+    with open(filename, 'w') as opn:
+        opn.write(new)
+
+    app = MagicMock(config={})
+    with patch('gfzreport.web.app.core.get_sourcefile', return_value=filename), \
+            patch('gfzreport.web.app.core.get_sourcedir', return_value=sourcedir):
+        assert get_sourcefile_content(app, 'report') == \
+            js_escape_loop(new).decode('utf8')
+        assert get_sourcefile_content(app, 'report', as_js=False) == new.decode('utf8')
+        assert get_sourcefile_content(app, 'report', commit) == \
+            js_escape_loop(old).decode('utf8')
+        assert get_sourcefile_content(app, 'report', commit, as_js=False) == \
+            old.decode('utf8')
@@ -38,10 +38,8 @@ def _cleanup(testobj):
         shutil.rmtree(testobj.source)
     except:
         pass
-    try:
-        testobj.mock_urlopen.stop()
-    except:
-        pass
+    for patcher in getattr(testobj, 'urlopen_patchers', []):
+        patcher.stop()
     try:
         testobj.mock_iterdcurl.stop()
     except:
@@ -116,7 +114,12 @@ class Test(unittest.TestCase):
         # os.makedirs(self.source)
         self.addCleanup(_cleanup, self)
 
-        self.mock_urlopen = patch('gfzreport.templates.network.core.utils.urllib2.urlopen').start()
+        # mock the network template downloads and, with the same mock, the global
+        # urllib2.urlopen used by the map and doicitation extensions (ArcGIS images, DOIs):
+        self.urlopen_patchers = [patch('gfzreport.templates.network.core.utils.urlopen')]
+        self.mock_urlopen = self.urlopen_patchers[0].start()
+        self.urlopen_patchers.append(patch('urllib2.urlopen', self.mock_urlopen))
+        self.urlopen_patchers[-1].start()
         self.mock_urlopen.side_effect = _get_urlopen_sideeffect()
 
         self.mock_iterdcurl = patch('gfzreport.templates.network.core.iterdcurl').start()